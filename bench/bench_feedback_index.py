@@ -0,0 +1,154 @@
+"""Vergleicht das alte Feedback-Layout (Verlauf in jedem Dokument) mit Template und Snapshot-Index.
+
+Aufruf aus dem Projektverzeichnis:
+
+    python -m bench.bench_feedback_index [--conversations 500] [--opensearch http://127.0.0.1:9200]
+
+Erzeugt Feedback wie App.vue: pro Gespräch werden mehrere Antworten
+bewertet, jedes Mal mit den letzten 20 Nachrichten als chat_snapshot.
+Ohne --opensearch wird nur die Größe der _bulk-Payload verglichen; die
+Aktionen des neuen Layouts kommen aus FeedbackIngestor._actions.
+
+Mit --opensearch werden beide Varianten in temporäre Indizes geschrieben
+(alt: Mapping vor user-021 plus dynamisches Mapping, neu: FEEDBACK_MAPPING
+und SNAPSHOT_MAPPING) und Dokumente pro Sekunde sowie Speicher nach
+forcemerge ausgegeben. Die Indizes werden danach gelöscht.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+from uuid import uuid4
+
+from src.feedback_queue import FeedbackIngestor
+from src.opensearch import FEEDBACK_MAPPING, INDEX_SETTINGS, SNAPSHOT_MAPPING
+
+LEGACY_MAPPING = {
+    "settings": {"index": {"number_of_shards": 1, "number_of_replicas": 0}},
+    "mappings": {
+        "properties": {
+            "timestamp": {"type": "date"},
+            "thumbs": {"type": "keyword"},
+            "model": {"type": "keyword"},
+            "provider": {"type": "keyword"},
+            "message_index": {"type": "integer"},
+            "feedback_text": {"type": "text"},
+            "id": {"type": "keyword"}
+        }
+    }
+}
+
+BENCH_PREFIX = "bench-feedback"
+SENTENCES = [
+    "Die Photosynthese findet in den Chloroplasten statt.",
+    "Ein Regenbogen entsteht durch Brechung und Reflexion von Sonnenlicht in Wassertropfen.",
+    "Bienen kommunizieren über den Schwänzeltanz die Richtung einer Futterquelle.",
+    "Der Jupiter ist der größte Planet des Sonnensystems.",
+    "Kannst du das noch etwas genauer erklären?",
+]
+
+def conversation(rng, turns):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": rng.choice(SENTENCES[-2:]) + f" ({turn})"})
+        messages.append({"role": "assistant", "content": " ".join(rng.choices(SENTENCES, k=rng.randint(3, 8)))})
+    return messages
+
+def feedback_docs(conversations, seed=7):
+    """Bewertungen wie im Frontend; meist werden mehrere Antworten am Ende eines Gesprächs bewertet."""
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(conversations):
+        messages = conversation(rng, rng.randint(2, 15))
+        ratings = rng.randint(1, 4)
+        for _ in range(ratings):
+            upto = len(messages) if rng.random() < 0.7 else rng.randrange(2, len(messages) + 1, 2)
+            docs.append({
+                "timestamp": datetime.utcnow().isoformat(),
+                "thumbs": rng.choice(["up", "down"]),
+                "model": "gemma2-9b-it",
+                "provider": "groq",
+                "message_index": upto - 1,
+                "feedback_text": "",
+                "chat_snapshot": messages[:upto][-20:],
+                "id": str(uuid4()),
+            })
+    return docs
+
+def legacy_actions(docs, index):
+    return [{"_index": index, "_id": doc["id"], "_source": doc} for doc in docs]
+
+def new_actions(docs, index, snapshot_index):
+    return FeedbackIngestor(index=index, snapshot_index=snapshot_index)._actions(docs)[0]
+
+def payload_bytes(actions):
+    total = 0
+    for action in actions:
+        meta = {action.get("_op_type", "index"): {"_index": action["_index"], "_id": action["_id"]}}
+        total += len(json.dumps(meta)) + len(json.dumps(action["_source"])) + 2
+    return total
+
+##########################
+# OPENSEARCH             #
+##########################
+
+async def index_and_measure(client, indices, actions):
+    from opensearchpy.helpers import async_bulk
+
+    for name, body in indices.items():
+        await client.indices.create(index=name, body=body)
+    started = time.perf_counter()
+    await async_bulk(client, actions, chunk_size=500, refresh="wait_for")
+    elapsed = time.perf_counter() - started
+    names = ",".join(indices)
+    await client.indices.forcemerge(index=names, max_num_segments=1)
+    stats = await client.indices.stats(index=names, metric="store")
+    return elapsed, stats["_all"]["primaries"]["store"]["size_in_bytes"]
+
+async def measure_opensearch(url, docs):
+    from opensearchpy import AsyncOpenSearch
+
+    parsed = urlparse(url)
+    client = AsyncOpenSearch(hosts=[{"host": parsed.hostname, "port": parsed.port or 9200}],
+                             use_ssl=parsed.scheme == "https", verify_certs=False, timeout=120)
+    legacy_index, new_index, snapshot_index = f"{BENCH_PREFIX}-legacy", f"{BENCH_PREFIX}-v2", f"{BENCH_PREFIX}-snapshots"
+    try:
+        legacy = await index_and_measure(client, {legacy_index: LEGACY_MAPPING}, legacy_actions(docs, legacy_index))
+        new = await index_and_measure(
+            client,
+            {new_index: {"settings": {"index": INDEX_SETTINGS}, "mappings": FEEDBACK_MAPPING},
+             snapshot_index: SNAPSHOT_MAPPING},
+            new_actions(docs, new_index, snapshot_index),
+        )
+    finally:
+        await client.indices.delete(index=f"{BENCH_PREFIX}-*", ignore_unavailable=True)
+        await client.close()
+    return legacy, new
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--opensearch", help="URL eines Test-Clusters, z.B. http://127.0.0.1:9200")
+    args = parser.parse_args()
+
+    docs = feedback_docs(args.conversations)
+    legacy = legacy_actions(docs, f"{BENCH_PREFIX}-legacy")
+    new = new_actions(docs, f"{BENCH_PREFIX}-v2", f"{BENCH_PREFIX}-snapshots")
+    snapshots = sum(1 for action in new if action.get("_op_type") == "create")
+
+    print(f"{len(docs)} Feedback-Dokumente, {snapshots} verschiedene Verläufe")
+    print(f"{'Layout':<8} {'Aktionen':>9} {'Bytes/Feedback':>15}")
+    print(f"{'alt':<8} {len(legacy):>9} {payload_bytes(legacy) / len(docs):>15.0f}")
+    print(f"{'neu':<8} {len(new):>9} {payload_bytes(new) / len(docs):>15.0f}")
+
+    if args.opensearch:
+        (legacy_s, legacy_store), (new_s, new_store) = asyncio.run(measure_opensearch(args.opensearch, docs))
+        print(f"{'Layout':<8} {'Docs/s':>9} {'Speicher/Feedback':>18}")
+        print(f"{'alt':<8} {len(docs) / legacy_s:>9.0f} {legacy_store / len(docs):>18.0f}")
+        print(f"{'neu':<8} {len(docs) / new_s:>9.0f} {new_store / len(docs):>18.0f}")
+
+if __name__ == "__main__":
+    main()
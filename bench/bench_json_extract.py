@@ -0,0 +1,92 @@
+"""Vergleicht den alten Regex-Cleaner mit src/json_extract auf echten Modellausgaben.
+
+Aufruf aus dem Projektverzeichnis:
+
+    python -m bench.bench_json_extract
+
+Der Exit-Code ist 1, wenn der neue Extraktor einen Fall des Korpus verfehlt.
+"""
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+from src.json_extract import IncrementalJSONExtractor, find_json
+
+CORPUS = Path(__file__).parent / "data" / "malformed_outputs.jsonl"
+ROUNDS = 2000
+CHUNK_SIZE = 7
+
+def legacy_clean_json_output(text: str) -> str:
+    # Stand vor user-010, unverändert aus src/chains.py übernommen
+    if not isinstance(text, str):
+        return text
+    text = re.sub(r"^```(?:json|python)?\s*|\s*```$", "", text.strip(), flags=re.MULTILINE)
+    text = re.sub(r"^['\"]{1,3}|['\"]{1,3}$", "", text.strip())
+    match = re.search(r"(\{.*?\}|\[.*?\])", text, re.DOTALL)
+    return match.group().strip() if match else text.strip()
+
+def legacy_parse(raw):
+    try:
+        return json.loads(legacy_clean_json_output(raw))
+    except json.JSONDecodeError:
+        return None
+
+def new_parse(raw):
+    try:
+        return find_json(raw)
+    except ValueError:
+        return None
+
+def incremental_parse(raw):
+    extractor = IncrementalJSONExtractor()
+    for i in range(0, len(raw), CHUNK_SIZE):
+        if extractor.feed(raw[i:i + CHUNK_SIZE]) is not None:
+            return extractor.value
+    try:
+        return find_json(extractor.text)
+    except ValueError:
+        return None
+
+def load_corpus():
+    with CORPUS.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def timed(fn, inputs, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for raw in inputs:
+            fn(raw)
+    return (time.perf_counter() - started) / (rounds * len(inputs)) * 1e6
+
+def main():
+    corpus = load_corpus()
+    parsers = {"legacy": legacy_parse, "find_json": new_parse, "incremental": incremental_parse}
+
+    failures = {name: [] for name in parsers}
+    for case in corpus:
+        for name, parse in parsers.items():
+            if parse(case["raw"]) != case["expected"]:
+                failures[name].append(case["name"])
+
+    print(f"Korpus: {len(corpus)} Fälle ({CORPUS})")
+    for name, parse in parsers.items():
+        correct = len(corpus) - len(failures[name])
+        per_call = timed(parse, [c["raw"] for c in corpus], ROUNDS // 10)
+        print(f"{name:12s} korrekt {correct:2d}/{len(corpus)}  {per_call:8.2f} µs/Aufruf")
+        for case_name in failures[name]:
+            print(f"{'':12s} verfehlt: {case_name}")
+
+    # Skalierung: lange Präambel plus tief verschachteltes Objekt
+    print("\nSkalierung (find_json):")
+    for size in (1_000, 10_000, 100_000):
+        nested = {"summary": "x", "data": [{"i": i, "tags": ["a", "b"]} for i in range(size // 40)]}
+        raw = "Überlegung: " + "bla " * (size // 4) + "\n```json\n" + json.dumps(nested) + "\n```\nFertig."
+        per_call = timed(new_parse, [raw], 20)
+        print(f"  {len(raw):>9d} Zeichen  {per_call / 1000:8.3f} ms")
+
+    return 1 if failures["find_json"] or failures["incremental"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""Lasttest der API gegen die Fake-Provider und das Fake-OpenSearch aus bench/fake_services.py.
+
+Aufruf aus dem Projektverzeichnis:
+
+    python -m bench.bench_load [--profile bench/data/load_profile.json] [--duration 20] [--concurrency 16]
+                               [--scenario FunFact] [--output load.json] [--baseline load.json]
+
+Startet die Fakes und uvicorn mit main:app in eigenen Prozessen und treibt
+jedes Szenario des Profils nacheinander mit --concurrency parallelen
+Clients für --duration Sekunden. Pro Szenario werden p50/p95/p99, Requests
+pro Sekunde, Statuscodes und die Event-Loop-Verzögerung der API (aus
+/metrics) als JSON ausgegeben. Anfragen sind durchnummeriert, damit die
+Caches nicht greifen.
+
+Mit --baseline ist der Exit-Code 1, wenn in einem Szenario p95 oder p99
+um mehr als --max-regression (Anteil) steigen oder der Durchsatz um mehr
+als diesen Anteil fällt.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from bench.bench_startup import ROOT, bench_env, free_port
+from bench.fake_services import DEFAULT_PROFILE, gemini_tls_files, load_profile
+
+SUMMARY_TEXT = (
+    "Die Photosynthese ist ein Prozess, bei dem Pflanzen mithilfe von Lichtenergie aus Kohlendioxid "
+    "und Wasser Glukose und Sauerstoff herstellen. Sie findet in den Chloroplasten statt. "
+) * 3
+
+QUERIES = {
+    "FreePrompt": "Erkläre mir kurz, wie ein Regenbogen entsteht",
+    "Summary": SUMMARY_TEXT,
+    "Quiz": "Sonnensystem",
+    "FunFact": "Biene",
+}
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+def ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+##########################
+# EVENT LOOP LAG         #
+##########################
+
+def loop_lag_buckets(metrics_text):
+    """Kumulative Bucket-Zähler von event_loop_lag_seconds aus dem /metrics-Text."""
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name == "event_loop_lag_seconds":
+            buckets, total, count = {}, 0.0, 0
+            for sample in family.samples:
+                if sample.name.endswith("_bucket"):
+                    buckets[float(sample.labels["le"])] = sample.value
+                elif sample.name.endswith("_sum"):
+                    total = sample.value
+                elif sample.name.endswith("_count"):
+                    count = sample.value
+            return buckets, total, count
+    return {}, 0.0, 0
+
+def loop_lag_delta(before, after):
+    (b_buckets, b_sum, b_count), (a_buckets, a_sum, a_count) = before, after
+    count = a_count - b_count
+    if count <= 0:
+        return {"samples": 0}
+
+    def bucket_percentile(q):
+        # Obergrenze des Buckets, in dem das Quantil liegt
+        for le in sorted(a_buckets):
+            if a_buckets[le] - b_buckets.get(le, 0) >= q * count:
+                return le
+        return None
+
+    return {
+        "samples": int(count),
+        "mean_ms": ms((a_sum - b_sum) / count),
+        "p50_ms": ms(bucket_percentile(0.5)),
+        "p99_ms": ms(bucket_percentile(0.99)),
+    }
+
+##########################
+# LOAD DRIVER            #
+##########################
+
+def build_request(scenario, provider, n):
+    if scenario["endpoint"] == "/store_feedback":
+        return {
+            "thumbs": "up" if n % 3 else "down",
+            "message_index": n,
+            "model": "bench",
+            "provider": provider,
+            "feedback": f"Benchmark-Feedback {n}",
+            "messages": [{"role": "user", "content": "Hallo"}, {"role": "assistant", "content": "Hallo!"}],
+        }
+    use_case = scenario["use_case"]
+    body = {
+        "query": f"{scenario.get('query', QUERIES[use_case])} ({n})",
+        "use_case": use_case,
+        "provider": provider,
+    }
+    if "length" in scenario:
+        body["length"] = scenario["length"]
+    return body
+
+async def timed_request(client, scenario, body):
+    started = time.perf_counter()
+    if scenario["endpoint"].endswith("/stream"):
+        first_byte = None
+        async with client.stream("POST", scenario["endpoint"], json=body) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                # Fehler kommen beim Stream als SSE-Event, nicht als Statuscode
+                if b"event: error" in chunk:
+                    return "stream_error", time.perf_counter() - started, first_byte
+            return str(response.status_code), time.perf_counter() - started, first_byte
+    response = await client.post(scenario["endpoint"], json=body)
+    return str(response.status_code), time.perf_counter() - started, None
+
+async def run_scenario(base_url, scenario, providers, duration, concurrency):
+    counter = itertools.count()
+    latencies, first_bytes = [], []
+    statuses = Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        lag_before = loop_lag_buckets((await client.get("/metrics")).text)
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                n = next(counter)
+                body = build_request(scenario, providers[n % len(providers)], n)
+                try:
+                    status, latency, first_byte = await timed_request(client, scenario, body)
+                except httpx.HTTPError as e:
+                    status, latency, first_byte = type(e).__name__, None, None
+                statuses[status] += 1
+                if status == "200":
+                    latencies.append(latency)
+                    if first_byte is not None:
+                        first_bytes.append(first_byte)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        lag_after = loop_lag_buckets((await client.get("/metrics")).text)
+
+    total = sum(statuses.values())
+    result = {
+        "requests": total,
+        "ok": len(latencies),
+        "error_rate": round(1 - len(latencies) / total, 4) if total else 0.0,
+        "rps": round(len(latencies) / elapsed, 2),
+        "status": dict(statuses),
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 0.5)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+        },
+        "event_loop_lag": loop_lag_delta(lag_before, lag_after),
+    }
+    if first_bytes:
+        result["first_byte_ms"] = {"p50": ms(percentile(first_bytes, 0.5)), "p95": ms(percentile(first_bytes, 0.95))}
+    return result
+
+##########################
+# PROCESSES              #
+##########################
+
+def app_env(provider_port, gemini_port, opensearch_port):
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    env = bench_env()
+    env.update({
+        "GROQ_API_KEY": "bench",
+        "MISTRAL_API_KEY": "bench",
+        "GOOGLE_API_KEY": "bench",
+        "OPENAI_API_KEY": "bench",
+        "GROQ_BASE_URL": provider_url,
+        "MISTRAL_BASE_URL": provider_url,
+        "OPENAI_BASE_URL": f"{provider_url}/oai/v1",
+        "GOOGLE_API_ENDPOINT": f"127.0.0.1:{gemini_port}",
+        "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": str(gemini_tls_files()[0]),
+        "OPENSEARCH_PORT": str(opensearch_port),
+        "EVENT_LOOP_LAG_INTERVAL": "0.05",
+    })
+    # bench_env schaltet die Fallback-Reihenfolge ab; hier sollen Router und Fallbacks mitlaufen
+    env.pop("LLM_FALLBACK_ORDER")
+    env.pop("QUIZ_POOL_ENABLED")
+    return env
+
+def wait_until_up(url, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Prozess für {url} ist beim Start abgestürzt")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.05)
+    raise RuntimeError(f"{url} nicht erreichbar")
+
+def check_regressions(result, baseline, max_regression):
+    regressions = []
+    for name, current in result["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for key in ("p95", "p99"):
+            now, before = current["latency_ms"][key], previous["latency_ms"].get(key)
+            if now is not None and before and now > before * (1 + max_regression):
+                regressions.append(f"{name}: {key} {now} ms statt {before} ms")
+        if previous.get("rps") and current["rps"] < previous["rps"] * (1 - max_regression):
+            regressions.append(f"{name}: {current['rps']} rps statt {previous['rps']} rps")
+    return regressions
+
+async def drive(base_url, scenarios, providers, duration, concurrency):
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        # Aufwärmen: SDK-Importe und Verbindungsaufbau gehören nicht in die Messung
+        for provider in providers:
+            await client.post("/process_query", json={"query": "Aufwärmen", "use_case": "FunFact",
+                                                      "provider": provider, "cache": False})
+    results = {}
+    for scenario in scenarios:
+        results[scenario["name"]] = await run_scenario(base_url, scenario, providers, duration, concurrency)
+        print(f"{scenario['name']}: {results[scenario['name']]['rps']} rps, "
+              f"p95 {results[scenario['name']]['latency_ms']['p95']} ms", file=sys.stderr)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=str(DEFAULT_PROFILE))
+    parser.add_argument("--duration", type=float)
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--scenario", action="append", help="Nur diese Szenarien (mehrfach möglich)")
+    parser.add_argument("--provider", action="append", help="Nur diese Provider (mehrfach möglich)")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    profile = load_profile(args.profile)
+    load = profile["load"]
+    duration = args.duration or load.get("duration", 20)
+    concurrency = args.concurrency or load.get("concurrency", 16)
+    scenarios = [s for s in load["scenarios"] if not args.scenario or s["name"] in args.scenario]
+    providers = args.provider or load["providers"]
+
+    provider_port, gemini_port, opensearch_port, app_port = free_port(), free_port(), free_port(), free_port()
+    fakes = subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_services", "--profile", args.profile,
+         "--provider-port", str(provider_port), "--gemini-port", str(gemini_port),
+         "--opensearch-port", str(opensearch_port)],
+        cwd=ROOT,
+    )
+    app = None
+    try:
+        wait_until_up(f"http://127.0.0.1:{provider_port}/_fake/stats", fakes)
+        app = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+            cwd=ROOT, env=app_env(provider_port, gemini_port, opensearch_port),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{app_port}"
+        wait_until_up(f"{base_url}/ready", app)
+
+        scenario_results = asyncio.run(drive(base_url, scenarios, providers, duration, concurrency))
+        result = {
+            "profile": str(args.profile),
+            "duration": duration,
+            "concurrency": concurrency,
+            "providers": providers,
+            "scenarios": scenario_results,
+            "fakes": {
+                "providers": httpx.get(f"http://127.0.0.1:{provider_port}/_fake/stats").json(),
+                "opensearch": httpx.get(f"http://127.0.0.1:{opensearch_port}/_fake/stats").json(),
+            },
+        }
+    finally:
+        for proc in (app, fakes):
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n")
+
+    if args.baseline:
+        regressions = check_regressions(result, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        for line in regressions:
+            print(f"Regression: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Misst den Kaltstart der API: Importzeit und Zeit bis zur ersten beantworteten Anfrage.
+
+Aufruf aus dem Projektverzeichnis:
+
+    python -m bench.bench_startup [--runs 5] [--warm groq] [--baseline startup.json] [--output startup.json]
+
+Für jeden Lauf wird uvicorn in einem frischen Prozess gestartet. Groq zeigt
+über GROQ_BASE_URL auf einen lokalen Fake-Server, OpenSearch auf einen
+geschlossenen Port; gemessen wird also nur die eigene Startarbeit.
+Mit --baseline ist der Exit-Code 1, wenn ein Median um mehr als
+--max-regression (Anteil) langsamer ist als in der Baseline.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+FAKE_COMPLETION = {
+    "id": "bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": '{"fact": "Bienen tanzen.", "source": "bench"}'},
+        "finish_reason": "stop",
+    }],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+}
+
+class FakeProvider(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        body = json.dumps(FAKE_COMPLETION).encode("utf-8")
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def measure_import():
+    # Eigener Prozess, damit nichts aus einem vorherigen Import im Cache liegt
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=bench_env(), capture_output=True, text=True)
+    out.check_returncode()
+    return float(out.stdout.strip().splitlines()[-1])
+
+def bench_env(provider_url=None, warm=""):
+    env = dict(os.environ)
+    env.update({
+        "GROQ_API_KEY": env.get("GROQ_API_KEY", "bench"),
+        "OPENSEARCH_HOST": "127.0.0.1",
+        "OPENSEARCH_PORT": str(free_port()),
+        "LLM_WARM_PROVIDERS": warm,
+        "LLM_FALLBACK_ORDER": "",
+        "SEMANTIC_CACHE_EMBEDDER": "off",
+        "QUIZ_POOL_ENABLED": "false",
+        "PYTHONWARNINGS": "ignore",
+    })
+    if provider_url:
+        env["GROQ_BASE_URL"] = provider_url
+    return env
+
+def measure_serve(provider_url, warm):
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=bench_env(provider_url, warm), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(timeout=30) as client:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn ist beim Start abgestürzt")
+                try:
+                    client.get(f"{base}/ready")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            ready = time.perf_counter() - started
+
+            response = client.post(f"{base}/process_query", json={
+                "query": "Bienen", "use_case": "FunFact", "provider": "groq", "cache": False,
+            })
+            first_request = time.perf_counter() - started
+            if response.status_code != 200:
+                raise RuntimeError(f"Erste Anfrage fehlgeschlagen: {response.status_code} {response.text}")
+
+            t = time.perf_counter()
+            client.post(f"{base}/process_query", json={
+                "query": "Wespen", "use_case": "FunFact", "provider": "groq", "cache": False,
+            })
+            second_request = time.perf_counter() - t
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return ready, first_request, second_request
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm", default="", help="LLM_WARM_PROVIDERS für den Lauf, z.B. groq")
+    parser.add_argument("--baseline")
+    parser.add_argument("--output")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeProvider)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    provider_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    imports, readies, firsts, seconds = [], [], [], []
+    for _ in range(args.runs):
+        imports.append(measure_import())
+        ready, first, second = measure_serve(provider_url, args.warm)
+        readies.append(ready)
+        firsts.append(first)
+        seconds.append(second)
+    server.shutdown()
+
+    result = {
+        "runs": args.runs,
+        "warm": args.warm or None,
+        "import_main_s": round(statistics.median(imports), 3),
+        "time_to_ready_s": round(statistics.median(readies), 3),
+        "time_to_first_response_s": round(statistics.median(firsts), 3),
+        "second_request_s": round(statistics.median(seconds), 3),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2) + "\n")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = [
+            key for key in ("import_main_s", "time_to_ready_s", "time_to_first_response_s")
+            if key in baseline and result[key] > baseline[key] * (1 + args.max_regression)
+        ]
+        for key in regressions:
+            print(f"Regression: {key} {result[key]}s statt {baseline[key]}s", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
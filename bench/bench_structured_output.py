@@ -0,0 +1,100 @@
+"""Vergleicht die JSON-Parse-Fehlerrate mit und ohne strukturierte Ausgabe der Provider.
+
+Aufruf aus dem Projektverzeichnis:
+
+    python -m bench.bench_structured_output [--requests 200] [--profile bench/data/load_profile.json]
+
+Startet die Stand-ins aus bench/fake_services.py im selben Prozess (ohne
+Latenz, Fehler und 429, mit der malformed_rate aus dem Profil) und ruft jeden
+JSON-Use-Case pro Provider --requests Mal über CompiledUseCase auf: einmal nur
+mit dem Format im Prompt, einmal mit JSON-Modus bzw. Schema beim Provider.
+Ausgegeben wird der Anteil der Antworten, die nicht als JSON gelesen werden
+konnten. Mit --reject PROVIDER lehnt der Stand-in das Antwortformat ab, um den
+Rückfall auf das Prompt-Format zu prüfen.
+"""
+import argparse
+import asyncio
+import logging
+import os
+
+PROVIDER_PORT, GEMINI_PORT, OPENSEARCH_PORT = 8910, 8911, 8912
+
+from bench.fake_services import DEFAULT_PROFILE, gemini_tls_files, load_profile, serve  # noqa: E402
+
+os.environ.update({
+    "GROQ_BASE_URL": f"http://127.0.0.1:{PROVIDER_PORT}",
+    "MISTRAL_BASE_URL": f"http://127.0.0.1:{PROVIDER_PORT}",
+    "OPENAI_BASE_URL": f"http://127.0.0.1:{PROVIDER_PORT}/oai/v1",
+    "GOOGLE_API_ENDPOINT": f"127.0.0.1:{GEMINI_PORT}",
+    "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": str(gemini_tls_files()[0]),
+})
+# Parse-Fehler werden sonst einzeln geloggt
+os.environ.setdefault("LOG_LEVEL", "CRITICAL")
+for key in ("GROQ_API_KEY", "MISTRAL_API_KEY", "OPENAI_API_KEY", "GOOGLE_API_KEY"):
+    os.environ.setdefault(key, "bench")
+
+from src.chains import CompiledUseCase, USE_CASE_SCHEMAS, get_llm, llm_identity, structured_output  # noqa: E402
+from src.metrics import set_request_labels  # noqa: E402
+
+PROVIDERS = ("groq", "mistral", "google", "openai")
+QUERY = "Photosynthese"
+
+def bench_profile(path, reject):
+    profile = load_profile(path)
+    providers = profile.setdefault("providers", {})
+    malformed_rate = providers.get("default", {}).get("malformed_rate", 0.05)
+    providers["default"] = {"latency_ms": {"median": 0}, "error_rate": 0.0, "rate_limit_rate": 0.0,
+                            "malformed_rate": malformed_rate}
+    for provider in PROVIDERS:
+        providers[provider] = {"structured_output": provider not in reject}
+    return profile, malformed_rate
+
+async def failure_rate(provider, use_case, structured, requests):
+    # Der OpenAI-Pfad wirft bei kaputtem JSON statt {"error": ...} zu liefern
+    from langchain_core.exceptions import OutputParserException
+
+    failures = 0
+    llm = get_llm(provider=provider)
+    compiled = CompiledUseCase(llm, use_case, structured=structured)
+    prompt = compiled.render(QUERY, "kurz", [])
+    set_request_labels(use_case, *llm_identity(llm)[:2])
+    for _ in range(requests):
+        try:
+            result = await compiled.ainvoke(prompt)
+        except OutputParserException:
+            failures += 1
+            continue
+        failures += isinstance(result, dict) and "error" in result
+    return failures / requests, compiled.structured
+
+async def run(args):
+    profile, malformed_rate = bench_profile(args.profile, set(args.reject))
+    server = asyncio.create_task(serve(profile, PROVIDER_PORT, GEMINI_PORT, OPENSEARCH_PORT))
+    await asyncio.sleep(1.0)
+    try:
+        print(f"malformed_rate der Stand-ins: {malformed_rate:.0%}, {args.requests} Aufrufe je Zeile")
+        print(f"{'Provider':<9} {'Use Case':<9} {'nur Prompt':>11} {'strukturiert':>13} {'Modus':>8}")
+        for provider in PROVIDERS:
+            for use_case in USE_CASE_SCHEMAS:
+                before, _ = await failure_rate(provider, use_case, False, args.requests)
+                after, native = await failure_rate(provider, use_case, True, args.requests)
+                print(f"{provider:<9} {use_case:<9} {before:>11.1%} {after:>13.1%} "
+                      f"{'native' if native else 'prompt':>8}")
+        if structured_output.unsupported:
+            print(f"Abgelehnt: {', '.join(f'{p}:{m}' for p, m in structured_output.unsupported)}")
+    finally:
+        # uvicorn meldet den abgebrochenen Lifespan sonst mit Traceback
+        logging.getLogger("uvicorn.error").disabled = True
+        server.cancel()
+        await asyncio.gather(server, return_exceptions=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--profile", default=str(DEFAULT_PROFILE))
+    parser.add_argument("--reject", action="append", default=[], choices=PROVIDERS,
+                        help="Provider, der response_format/response_schema ablehnt (mehrfach möglich)")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
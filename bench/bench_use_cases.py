@@ -0,0 +1,77 @@
+"""Misst den Aufwand pro Request vor dem Provider-Aufruf: Pipeline-Aufbau und Prompt.
+
+Aufruf aus dem Projektverzeichnis:
+
+    python -m bench.bench_use_cases
+
+Verglichen werden der frühere Weg (Parser, Prompt und Chain pro Request neu
+bauen bzw. Provider-Dispatch per if/elif) und die UseCaseRegistry aus
+src/chains.py. Es findet kein Netzwerkaufruf statt; API-Keys werden nur
+gesetzt, damit sich die Clients bauen lassen.
+"""
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("GROQ_API_KEY", "bench")
+
+from src.chains import (  # noqa: E402
+    LANGCHAIN_USE_CASES, PROVIDER_PROMPTS, get_llm, use_case_registry,
+)
+
+ROUNDS = 2000
+QUERY = "Photosynthese"
+MESSAGES = [{"role": "user", "content": "Was ist Chlorophyll?"}, {"role": "assistant", "content": "Ein Farbstoff."}]
+
+def legacy_openai(llm, use_case):
+    # Stand vor user-018: Parser, Prompt und Chain bei jedem Request neu
+    from langchain_core.output_parsers import JsonOutputParser
+    from langchain_core.prompts import PromptTemplate
+    template, input_variables, schema = LANGCHAIN_USE_CASES[use_case]
+    parser = JsonOutputParser(pydantic_object=schema)
+    prompt = PromptTemplate(template=template, input_variables=input_variables,
+                            partial_variables={"format_instructions": parser.get_format_instructions()})
+    chain = prompt | llm | parser
+    inputs = {"text": QUERY, "length": "kurz"} if use_case == "Summary" else {input_variables[0]: QUERY}
+    return chain, prompt.format_prompt(**inputs)
+
+def legacy_provider(llm, use_case):
+    # if/elif-Dispatch wie im früheren ainvoke_use_case
+    if use_case == "FreePrompt":
+        prompt = PROVIDER_PROMPTS["FreePrompt"](QUERY, None, MESSAGES)
+    elif use_case == "Summary":
+        prompt = PROVIDER_PROMPTS["Summary"](QUERY, "kurz", MESSAGES)
+    elif use_case == "Quiz":
+        prompt = PROVIDER_PROMPTS["Quiz"](QUERY, None, MESSAGES)
+    else:
+        prompt = PROVIDER_PROMPTS["FunFact"](QUERY, None, MESSAGES)
+    return llm["async_client"], prompt
+
+def registry(llm, use_case):
+    compiled = use_case_registry.get(llm, use_case)
+    return compiled, compiled.render(QUERY, "kurz", MESSAGES)
+
+def measure(fn, llm, use_case):
+    fn(llm, use_case)
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(llm, use_case)
+    return (time.perf_counter() - started) / ROUNDS * 1e6
+
+def main():
+    openai_llm = get_llm(provider="openai")
+    groq_llm = get_llm(provider="groq")
+
+    print(f"{'Use Case':<12} {'Provider':<8} {'vorher µs':>10} {'Registry µs':>12}")
+    for use_case in LANGCHAIN_USE_CASES:
+        before = measure(legacy_openai, openai_llm, use_case)
+        after = measure(registry, openai_llm, use_case)
+        print(f"{use_case:<12} {'openai':<8} {before:>10.1f} {after:>12.1f}")
+    for use_case in PROVIDER_PROMPTS:
+        before = measure(legacy_provider, groq_llm, use_case)
+        after = measure(registry, groq_llm, use_case)
+        print(f"{use_case:<12} {'groq':<8} {before:>10.1f} {after:>12.1f}")
+    print(f"Registry: {use_case_registry.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""Lokale Stand-ins für Groq, Mistral, Gemini, OpenAI und OpenSearch.
+
+Aufruf aus dem Projektverzeichnis:
+
+    python -m bench.fake_services [--profile bench/data/load_profile.json]
+                                  [--provider-port 8900] [--gemini-port 8901] [--opensearch-port 8902]
+
+Groq, Mistral und OpenAI teilen sich einen HTTP-Port und unterscheiden sich
+am Pfad, Gemini läuft wie beim echten SDK über gRPC mit TLS; das selbst
+signierte Zertifikat liegt unter GEMINI_CA_FILE. Die API findet sie über:
+
+    GROQ_BASE_URL=http://127.0.0.1:8900
+    MISTRAL_BASE_URL=http://127.0.0.1:8900
+    OPENAI_BASE_URL=http://127.0.0.1:8900/oai/v1
+    GOOGLE_API_ENDPOINT=127.0.0.1:8901
+    GRPC_DEFAULT_SSL_ROOTS_FILE_PATH=<GEMINI_CA_FILE>
+    OPENSEARCH_HOST=127.0.0.1 OPENSEARCH_PORT=8902
+
+Latenz, Streaming, Fehler-, 429- und Kaputt-JSON-Raten stehen pro Provider
+im Profil (Abschnitt "providers", mit "default" als Grundlage). Zähler für
+jede Antwortart liefert GET /_fake/stats. Wird JSON per response_format bzw.
+response_mime_type angefordert, kommt die Antwort nie kaputt; mit
+"structured_output": false lehnt der Provider das wie ein älteres Modell ab.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_PROFILE = Path(__file__).parent / "data" / "load_profile.json"
+# Zertifikat und Schlüssel des Gemini-Stand-ins; das Zertifikat dient dem Client zugleich als CA
+GEMINI_TLS_DIR = Path(tempfile.gettempdir()) / "paiya-fake-gemini"
+GEMINI_CA_FILE = GEMINI_TLS_DIR / "cert.pem"
+GEMINI_KEY_FILE = GEMINI_TLS_DIR / "key.pem"
+
+# Feste Antworten je Use Case; erkannt wird der Use Case an Stichworten der Prompts aus src/chains.py
+CANNED_RESPONSES = {
+    "Quiz": {
+        "question": "Welcher Planet ist der größte im Sonnensystem?",
+        "options": ["A) Mars", "B) Jupiter", "C) Venus", "D) Merkur"],
+        "answer": "B) Jupiter",
+        "explanation": "Jupiter hat mehr als die doppelte Masse aller anderen Planeten zusammen (NASA).",
+    },
+    "Summary": {"summary": "Der Text beschreibt kurz die wichtigsten Punkte des Themas."},
+    "FunFact": {"fact": "Honigbienen verständigen sich über einen Schwänzeltanz.", "source": "Karl von Frisch"},
+}
+FREE_TEXT = "Das ist eine Antwort des Fake-Providers für Benchmarks. " * 4
+
+def detect_use_case(prompt: str):
+    if "Quizfrage" in prompt:
+        return "Quiz"
+    if "Zusammenfassung" in prompt:
+        return "Summary"
+    if "Fun Fact" in prompt:
+        return "FunFact"
+    return "FreePrompt"
+
+def load_profile(path=DEFAULT_PROFILE):
+    return json.loads(Path(path).read_text())
+
+def provider_profile(profile, provider):
+    providers = profile.get("providers", {})
+    return {**providers.get("default", {}), **providers.get(provider, {})}
+
+def sample_latency(settings):
+    """Log-normalverteilte Latenz in Sekunden aus Median und p99 (in ms)."""
+    latency = settings.get("latency_ms", {})
+    median = latency.get("median", 0)
+    if median <= 0:
+        return 0.0
+    p99 = max(latency.get("p99", median), median)
+    sigma = math.log(p99 / median) / 2.326
+    return median * math.exp(random.gauss(0, sigma)) / 1000
+
+def malform(text: str) -> str:
+    # Typische Fehlerbilder echter Modelle: abgeschnitten, mit Prosa, in Markdown
+    kind = random.choice(("truncated", "prose", "fenced"))
+    if kind == "truncated":
+        return text[:max(len(text) // 2, 1)]
+    if kind == "prose":
+        return f"Hier ist die Antwort:\n{text}\nIch hoffe, das hilft!"
+    return f"```json\n{text}\n```"
+
+def split_chunks(text: str, count: int):
+    size = max(math.ceil(len(text) / max(count, 1)), 1)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+class Outcome:
+    """Würfelt pro Aufruf das Ergebnis eines Providers und zählt es mit."""
+
+    def __init__(self, provider, settings, counters):
+        self.provider = provider
+        self.settings = settings
+        self.counters = counters
+
+    def roll(self):
+        r = random.random()
+        if r < self.settings.get("rate_limit_rate", 0.0):
+            return "rate_limited"
+        r -= self.settings.get("rate_limit_rate", 0.0)
+        if r < self.settings.get("error_rate", 0.0):
+            return "error"
+        return "ok"
+
+    def count(self, kind):
+        self.counters[self.provider][kind] += 1
+
+    def failure_response(self, kind):
+        self.count(kind)
+        if kind == "rate_limited":
+            retry_after = self.settings.get("retry_after", 1)
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                                status_code=429, headers={"retry-after": str(retry_after)})
+        return JSONResponse({"error": {"message": "Internal error", "type": "server_error"}}, status_code=500)
+
+    def rejects_structured(self, structured):
+        if structured and not self.settings.get("structured_output", True):
+            self.count("structured_rejected")
+            return True
+        return False
+
+    def content(self, prompt, structured=False):
+        use_case = detect_use_case(prompt)
+        text = FREE_TEXT if use_case == "FreePrompt" else json.dumps(CANNED_RESPONSES[use_case], ensure_ascii=False)
+        # Mit erzwungenem JSON-Format liefern echte Provider gültiges JSON (oder einen Fehler)
+        if structured:
+            self.count("structured")
+        elif use_case != "FreePrompt" and random.random() < self.settings.get("malformed_rate", 0.0):
+            self.count("malformed")
+            return malform(text)
+        self.count("ok")
+        return text
+
+    async def stream(self, pieces, total_latency):
+        # Die Latenz verteilt sich auf die Zeit bis zum ersten Chunk und die Abstände danach
+        chunks = max(len(pieces), 1)
+        first = total_latency * self.settings.get("first_chunk_share", 0.3)
+        await asyncio.sleep(first)
+        gap = (total_latency - first) / chunks
+        for piece in pieces:
+            yield piece
+            await asyncio.sleep(gap)
+
+##########################
+# PROVIDER APP           #
+##########################
+
+def _usage(prompt, text):
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(text) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+def _completion(model, text, prompt):
+    return {
+        "id": "fake-completion",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": _usage(prompt, text),
+    }
+
+def _chunk(model, content, finish_reason=None):
+    return {
+        "id": "fake-completion",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+    }
+
+def _last_user_prompt(body):
+    messages = body.get("messages") or []
+    return "\n".join(str(m.get("content", "")) for m in messages if m.get("role") != "system")
+
+def create_provider_app(profile, counters):
+    app = FastAPI()
+
+    async def chat_completions(provider, request):
+        body = await request.json()
+        outcome = Outcome(provider, provider_profile(profile, provider), counters)
+        latency = sample_latency(outcome.settings)
+        kind = outcome.roll()
+        if kind != "ok":
+            await asyncio.sleep(latency / 4)
+            return outcome.failure_response(kind)
+
+        structured = "response_format" in body
+        if outcome.rejects_structured(structured):
+            return JSONResponse({"error": {"message": "response_format is not supported with this model",
+                                           "type": "invalid_request_error"}}, status_code=400)
+
+        prompt = _last_user_prompt(body)
+        model = body.get("model", "fake")
+        text = outcome.content(prompt, structured)
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return JSONResponse(_completion(model, text, prompt))
+
+        async def events():
+            pieces = split_chunks(text, outcome.settings.get("stream_chunks", 10))
+            async for piece in outcome.stream(pieces, latency):
+                yield f"data: {json.dumps(_chunk(model, piece), ensure_ascii=False)}\n\n"
+            final = _chunk(model, "", "stop")
+            final["usage"] = _usage(prompt, text)
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/openai/v1/chat/completions")
+    async def groq(request: Request):
+        return await chat_completions("groq", request)
+
+    @app.post("/v1/chat/completions")
+    async def mistral(request: Request):
+        return await chat_completions("mistral", request)
+
+    @app.post("/oai/v1/chat/completions")
+    async def openai(request: Request):
+        return await chat_completions("openai", request)
+
+    @app.get("/_fake/stats")
+    async def stats():
+        return {provider: dict(counter) for provider, counter in counters.items()}
+
+    return app
+
+##########################
+# GEMINI (gRPC)          #
+##########################
+
+GEMINI_SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+def gemini_tls_files():
+    """Erzeugt bei Bedarf ein selbst signiertes Zertifikat für 127.0.0.1/localhost.
+
+    Das Gemini-SDK spricht eigene Endpunkte nur per TLS an; der Client vertraut
+    dem Zertifikat über GRPC_DEFAULT_SSL_ROOTS_FILE_PATH=GEMINI_CA_FILE.
+    """
+    if GEMINI_CA_FILE.exists() and GEMINI_KEY_FILE.exists():
+        return GEMINI_CA_FILE, GEMINI_KEY_FILE
+
+    import ipaddress
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=365))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    GEMINI_TLS_DIR.mkdir(parents=True, exist_ok=True)
+    GEMINI_KEY_FILE.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                                  serialization.NoEncryption()))
+    GEMINI_CA_FILE.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    return GEMINI_CA_FILE, GEMINI_KEY_FILE
+
+def create_gemini_server(profile, counters, address):
+    """gRPC-Server mit GenerateContent und StreamGenerateContent, wie ihn das Gemini-SDK anspricht."""
+    import grpc
+    from google.ai import generativelanguage_v1beta as glm
+
+    def response(text, prompt):
+        usage = _usage(prompt, text)
+        return glm.GenerateContentResponse(
+            candidates=[{"content": {"parts": [{"text": text}], "role": "model"}, "finish_reason": 1, "index": 0}],
+            usage_metadata={
+                "prompt_token_count": usage["prompt_tokens"],
+                "candidates_token_count": usage["completion_tokens"],
+                "total_token_count": usage["total_tokens"],
+            },
+        )
+
+    async def start(request, context):
+        outcome = Outcome("google", provider_profile(profile, "google"), counters)
+        latency = sample_latency(outcome.settings)
+        kind = outcome.roll()
+        if kind != "ok":
+            await asyncio.sleep(latency / 4)
+            outcome.count(kind)
+            code = grpc.StatusCode.RESOURCE_EXHAUSTED if kind == "rate_limited" else grpc.StatusCode.INTERNAL
+            await context.abort(code, "Rate limit reached" if kind == "rate_limited" else "Internal error")
+        prompt = "\n".join(part.text for content in request.contents for part in content.parts)
+        return outcome, latency, prompt
+
+    async def generate_content(request, context):
+        outcome, latency, prompt = await start(request, context)
+        structured = request.generation_config.response_mime_type == "application/json"
+        if outcome.rejects_structured(structured):
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "response_mime_type is not supported for this model")
+        text = outcome.content(prompt, structured)
+        await asyncio.sleep(latency)
+        return response(text, prompt)
+
+    async def stream_generate_content(request, context):
+        outcome, latency, prompt = await start(request, context)
+        pieces = split_chunks(outcome.content(prompt), outcome.settings.get("stream_chunks", 10))
+        async for piece in outcome.stream(pieces, latency):
+            yield response(piece, prompt)
+
+    handler = grpc.method_handlers_generic_handler(GEMINI_SERVICE, {
+        "GenerateContent": grpc.unary_unary_rpc_method_handler(
+            generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+        "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+            stream_generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+    })
+    server = grpc.aio.server()
+    server.add_generic_rpc_handlers((handler,))
+    cert_file, key_file = gemini_tls_files()
+    credentials = grpc.ssl_server_credentials([(key_file.read_bytes(), cert_file.read_bytes())])
+    server.add_secure_port(address, credentials)
+    return server
+
+##########################
+# OPENSEARCH APP         #
+##########################
+
+def create_opensearch_app(profile):
+    app = FastAPI()
+    settings = profile.get("opensearch", {})
+    indices = {}
+    aliases = {}
+    templates = {}
+    policies = {}
+    counters = Counter()
+
+    async def read_body(request):
+        raw = await request.body()
+        if request.headers.get("content-encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        return raw
+
+    @app.get("/")
+    async def info():
+        return {"name": "fake-opensearch", "version": {"distribution": "opensearch", "number": "2.19.0"}}
+
+    @app.put("/_index_template/{name}")
+    async def put_template(name: str, request: Request):
+        templates[name] = json.loads(await read_body(request))
+        return {"acknowledged": True}
+
+    @app.get("/_plugins/_ism/policies/{policy}")
+    async def get_policy(policy: str):
+        if policy not in policies:
+            return JSONResponse({"error": {"type": "status_exception"}, "status": 404}, status_code=404)
+        return {"_id": policy, "_seq_no": 0, "_primary_term": 1, **policies[policy]}
+
+    @app.put("/_plugins/_ism/policies/{policy}")
+    async def put_policy(policy: str, request: Request):
+        policies[policy] = json.loads(await read_body(request))
+        return {"_id": policy, "_seq_no": 0, "_primary_term": 1}
+
+    @app.head("/_alias/{name}")
+    async def alias_exists(name: str):
+        return Response(status_code=200 if name in aliases else 404)
+
+    @app.head("/{index}")
+    async def index_exists(index: str):
+        return Response(status_code=200 if index in indices or index in aliases else 404)
+
+    @app.put("/{index}")
+    async def create_index(index: str, request: Request):
+        if index in indices:
+            return JSONResponse({"error": {"type": "resource_already_exists_exception"}, "status": 400},
+                                status_code=400)
+        body = await read_body(request)
+        indices[index] = {}
+        for alias in (json.loads(body) if body else {}).get("aliases", {}):
+            aliases[alias] = index
+        return {"acknowledged": True, "index": index}
+
+    @app.post("/_bulk")
+    @app.post("/{index}/_bulk")
+    async def bulk(request: Request, index: str = None):
+        lines = [json.loads(line) for line in (await read_body(request)).splitlines() if line.strip()]
+        await asyncio.sleep(sample_latency(settings))
+        items = []
+        for action, source in zip(lines[::2], lines[1::2]):
+            op, meta = next(iter(action.items()))
+            target = aliases.get(meta.get("_index", index), meta.get("_index", index))
+            if random.random() < settings.get("rate_limit_rate", 0.0):
+                counters["rejected"] += 1
+                items.append({op: {"_index": target, "_id": meta.get("_id"), "status": 429,
+                                   "error": {"type": "es_rejected_execution_exception"}}})
+                continue
+            if op == "create" and meta.get("_id") in indices.get(target, {}):
+                items.append({op: {"_index": target, "_id": meta.get("_id"), "status": 409,
+                                   "error": {"type": "version_conflict_engine_exception"}}})
+                continue
+            indices.setdefault(target, {})[meta.get("_id")] = source
+            counters["bulk_bytes"] += len(json.dumps(source))
+            counters["indexed"] += 1
+            items.append({op: {"_index": target, "_id": meta.get("_id"), "status": 201, "result": "created"}})
+        errors = any(next(iter(item.values()))["status"] >= 300 for item in items)
+        return {"took": 1, "errors": errors, "items": items}
+
+    @app.get("/_fake/stats")
+    async def stats():
+        return {**counters, "indices": {name: len(docs) for name, docs in indices.items()}, "aliases": aliases}
+
+    return app
+
+async def serve(profile, provider_port, gemini_port, opensearch_port, host="127.0.0.1"):
+    counters = {p: Counter() for p in ("groq", "mistral", "openai", "google")}
+    gemini = create_gemini_server(profile, counters, f"{host}:{gemini_port}")
+    await gemini.start()
+    servers = [
+        uvicorn.Server(uvicorn.Config(create_provider_app(profile, counters), host=host, port=provider_port,
+                                      log_level="warning")),
+        uvicorn.Server(uvicorn.Config(create_opensearch_app(profile), host=host, port=opensearch_port,
+                                      log_level="warning")),
+    ]
+    try:
+        await asyncio.gather(*(server.serve() for server in servers))
+    finally:
+        await gemini.stop(grace=None)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", default=str(DEFAULT_PROFILE))
+    parser.add_argument("--provider-port", type=int, default=8900)
+    parser.add_argument("--gemini-port", type=int, default=8901)
+    parser.add_argument("--opensearch-port", type=int, default=8902)
+    args = parser.parse_args()
+    asyncio.run(serve(load_profile(args.profile), args.provider_port, args.gemini_port, args.opensearch_port))
+
+if __name__ == "__main__":
+    main()
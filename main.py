@@ -1,28 +1,69 @@
+import asyncio
+import json
 import logging
+import os
+import time
 from uuid import uuid4
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from src.chains import (
-    safe_invoke, fun_fact_prompt, quiz_prompt, summary_prompt,
-    free_prompt_template, get_llm,
-    SummaryInput, FunFactResponse, QuizResponse,
-    get_fun_fact_groq, get_quiz_groq, get_summary_groq, get_free_prompt_groq
+    aget_llm, llm_identity, DEFAULT_MODELS,
+    ainvoke_use_case, astream_use_case, parse_json_response, build_chat_context, use_case_registry,
+    structured_output
 )
-from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from src.validators import validate_response
-from src.opensearch import create_feedback_index_if_not_exists, get_opensearch_client
+from src.opensearch import create_feedback_index_if_not_exists, close_opensearch_client, opensearch_state
+from src.feedback_queue import feedback_ingestor, FeedbackQueueFull
+from src.feedback_stats import feedback_stats, FeedbackStatsUnavailable
+from src.clients import client_registry, normalize_provider, warm_providers_from_env
+from src.cache import response_cache, make_request_key
+from src.routing import router
+from src.semantic_cache import semantic_cache
+from src.quiz_pool import quiz_pool, QUIZ_POOL_ENABLED
+from src.scheduler import provider_scheduler, estimate_tokens, ProviderOverloaded
+from src.singleflight import single_flight, COALESCE_USE_CASES
+from src.context import context_builder, make_summarizer, preload_encodings
+from src.document_summary import document_summarizer
+from src.sessions import session_store
+from src.json_extract import IncrementalJSONExtractor
+from src.log_config import setup_logging, logging_stats, request_log
+from src.tracing import TracingMiddleware, setup_tracing, shutdown_tracing, span, slow_request_log
+from src.metrics import set_request_labels, track_in_flight, observe_validation, record_ttft, monitor_event_loop_lag
+from prometheus_fastapi_instrumentator import Instrumentator
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Messintervall für die Event-Loop-Verzögerung in Sekunden, 0 schaltet die Messung ab
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))
 
-@app.on_event("startup")
-async def startup_event():
-    create_feedback_index_if_not_exists()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_tracing()
+    # Index-Bootstrap und Client-Warmup laufen im Hintergrund, damit die API sofort antwortet
+    index_task = asyncio.create_task(create_feedback_index_if_not_exists(extra_indices=session_store.indices()))
+    warm_task = asyncio.create_task(client_registry.warm(warm_providers_from_env(), DEFAULT_MODELS))
+    tokenizer_task = asyncio.create_task(preload_encodings())
+    background = [index_task, warm_task, tokenizer_task]
+    if EVENT_LOOP_LAG_INTERVAL > 0:
+        background.append(asyncio.create_task(monitor_event_loop_lag(EVENT_LOOP_LAG_INTERVAL)))
+    await feedback_ingestor.start()
+    yield
+    await feedback_ingestor.stop()
+    await quiz_pool.stop()
+    await session_store.stop()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await client_registry.aclose()
+    await close_opensearch_client()
+    shutdown_tracing()
+
+app = FastAPI(lifespan=lifespan)
+Instrumentator().instrument(app).expose(app, endpoint="/metrics")
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,141 +71,517 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# Request-ID und Server-Span pro Anfrage; zuletzt registriert und damit ganz außen
+app.add_middleware(TracingMiddleware)
+
+def uses_history(llm, use_case):
+    # Summary und die Provider-Variante von FunFact bauen ihren Prompt ohne Verlauf
+    if use_case in ("FreePrompt", "Quiz"):
+        return True
+    return use_case == "FunFact" and not isinstance(llm, dict)
+
+def scheduled_summarizer(llm):
+    # Zusammenfassungen des Verlaufs zählen wie jeder andere Aufruf gegen die Provider-Limits
+    provider, model, _ = llm_identity(llm)
+    summarize = make_summarizer(llm)
+
+    async def scheduled(prompt):
+        return await provider_scheduler.submit(
+            provider, lambda: summarize(prompt), tokens=estimate_tokens(prompt, model)
+        )
+    return scheduled
+
+async def build_context(llm, use_case, messages, query):
+    if not messages or not uses_history(llm, use_case):
+        return []
+    with span("context.build", messages=len(messages)):
+        return await context_builder.build(
+            messages, query, model=llm_identity(llm)[1], use_case=use_case,
+            summarize=scheduled_summarizer(llm), scope=llm_identity(llm),
+        )
 
 @app.post("/process_query")
 async def process_query(request: Request):
     data = await request.json()
+    with track_in_flight(data.get("use_case"), normalize_provider(data.get("provider"))):
+        return await handle_query(data)
+
+RESPONSE_TYPES = {
+    "FreePrompt": "free_prompt",
+    "Summary": "summary",
+    "Quiz": "quiz",
+    "FunFact": "fun_fact",
+}
+
+# Quiz und FreePrompt sollen bei gleicher Eingabe neue Antworten liefern
+CACHEABLE_USE_CASES = {"Summary", "FunFact"}
+
+def overloaded_response(error: ProviderOverloaded):
+    retry_after = max(1, round(error.retry_after)) if error.retry_after else 1
+    return JSONResponse(
+        content={"error": "Der Anbieter ist gerade ausgelastet. Bitte versuche es gleich noch einmal."},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def quiz_from_pool(llm, topic: str, history: list):
+    """Nimmt eine vorab generierte Frage aus dem Vorrat und stößt das Nachfüllen an."""
+    key = quiz_pool.make_key(topic, *llm_identity(llm))
+    quiz = quiz_pool.take(key, history)
+
+    async def generate(avoid):
+        tokens = estimate_tokens(build_chat_context(avoid, topic), llm_identity(llm)[1])
+        return await provider_scheduler.submit(
+            llm_identity(llm)[0], lambda: ainvoke_use_case(llm, "Quiz", topic, messages=avoid), tokens=tokens
+        )
+
+    quiz_pool.refill(key, generate, history)
+    return quiz
+
+async def load_history(data: dict):
+    """Verlauf der Anfrage: aus der Sitzung, falls eine session_id kommt, sonst wie bisher aus messages."""
+    session_id = data.get("session_id")
+    if session_id is None:
+        return None, data.get("messages", [])
+    session = await session_store.get(session_id)
+    return session, session_store.history(session)
+
+def answered(session, query: str, content: dict) -> JSONResponse:
+    # Erfolgreiche Antworten landen im Sitzungsverlauf, damit der Client ihn nicht mitschicken muss
+    if session is not None:
+        session_store.record_turn(session, query, content)
+    return JSONResponse(content=content, status_code=200)
+
+async def handle_query(data: dict):
     query = data.get("query", "").strip()
     length = data.get("length")
     use_case = data.get("use_case")
     provider = data.get("provider", "openai")
     model = data.get("model", None)
-    messages = data.get("messages", [])
+    use_cache = use_case in CACHEABLE_USE_CASES and data.get("cache", True) is not False
+    coalesce = use_case in COALESCE_USE_CASES and data.get("coalesce", True) is not False
+    fallback = data.get("fallback", True) is not False
+    use_semantic = semantic_cache.applies_to(use_case) and data.get("cache", True) is not False
+    use_pool = use_case == "Quiz" and QUIZ_POOL_ENABLED and data.get("pool", True) is not False
 
-    logging.info(f"User query: {query} | Use case: {use_case} | Provider: {provider} | Model: {model}")
+    request_log.info("Anfrage", extra={"use_case": use_case, "provider": provider, "model": model, "query": query})
 
     if not query:
         return JSONResponse(content={"error": "Query fehlt oder ist leer."}, status_code=422)
+    if use_case not in RESPONSE_TYPES:
+        return JSONResponse(
+            content={"type": "not_supported", "message": "Diese Anfrage wird nicht unterstützt."},
+            status_code=200
+        )
+    if use_case == "Summary" and not length:
+        return JSONResponse(content={"error": "Längenangabe für Zusammenfassung fehlt."}, status_code=422)
 
     try:
-        llm = get_llm(provider=provider, model=model)
-
-        if isinstance(llm, dict) and llm.get("provider") in ["groq", "google", "mistral"]:
-            client = llm["client"]
-            model = llm["model"]
-            temperature = llm["temperature"]
-
-            if use_case == "FreePrompt":
-                chat_context = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-                full_prompt = f"{chat_context}\nuser: {query}\nassistant:" if chat_context else query
-                result = get_free_prompt_groq(full_prompt, client, model, temperature, provider=llm["provider"])
-                valid, msg = validate_response("FreePrompt", {"data": result})
-                if not valid:
-                    return JSONResponse(content={"error": msg}, status_code=422)
-                response = {"type": "free_prompt", "data": result}
-
-            elif use_case == "Summary":
-                if not length:
-                    return JSONResponse(content={"error": "Längenangabe für Zusammenfassung fehlt."}, status_code=422)
-                result = get_summary_groq(query, length, client, model, temperature, provider=llm["provider"])
-                if "error" in result:
-                    return JSONResponse(content={"error": result["error"]}, status_code=500)
-                valid, msg = validate_response("Summary", result)
-                if not valid:
-                    return JSONResponse(content={"error": msg}, status_code=422)
-                response = {"type": "summary", **result}
-
-            elif use_case == "Quiz":
-                result = get_quiz_groq(query, client, model, temperature, messages=messages, provider=llm["provider"])
-                if "error" in result:
-                    return JSONResponse(content={"error": result["error"]}, status_code=500)
-                valid, msg = validate_response("Quiz", result)
-                if not valid:
-                    return JSONResponse(content={"error": msg}, status_code=422)
-                response = {"type": "quiz", **result}
-
-            elif use_case == "FunFact":
-                result = get_fun_fact_groq(query, client, model, temperature, provider=llm["provider"])
-                if "error" in result:
-                    return JSONResponse(content={"error": result["error"]}, status_code=500)
-                valid, msg = validate_response("FunFact", result)
-                if not valid:
-                    return JSONResponse(content={"error": msg}, status_code=422)
-                response = {"type": "fun_fact", **result}
+        with span("get_llm", provider=provider, model=model):
+            llm = await aget_llm(provider=provider, model=model)
+        set_request_labels(use_case, *llm_identity(llm)[:2])
+        session, messages = await load_history(data)
 
-            else:
-                return JSONResponse(
-                    content={"type": "not_supported", "message": "Diese Anfrage wird nicht unterstützt."},
-                    status_code=200
-                )
+        if use_pool:
+            quiz = quiz_from_pool(llm, query, messages)
+            if quiz is not None:
+                return answered(session, query, {
+                    "type": "quiz", **quiz,
+                    "served_by": {"provider": llm_identity(llm)[0], "model": llm_identity(llm)[1], "pool": True},
+                })
 
-        else:
-            if use_case == "FreePrompt":
-                if hasattr(llm, "invoke"):
-                    chat_messages = messages + [{"role": "user", "content": query}]
-                    result = llm.invoke(chat_messages)
-                else:
-                    chat_context = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-                    full_prompt = f"{chat_context}\nuser: {query}\nassistant:" if chat_context else query
-                    chain = free_prompt_template | llm | StrOutputParser()
-                    result = safe_invoke(chain, {"question": full_prompt}, context="FreePrompt")
-                valid, msg = validate_response("FreePrompt", {"data": result})
-                if not valid:
-                    return JSONResponse(content={"error": msg}, status_code=422)
-                response = {"type": "free_prompt", "data": result}
-
-            elif use_case == "Summary":
-                if not length:
-                    return JSONResponse(content={"error": "Längenangabe für Zusammenfassung fehlt."}, status_code=422)
-                parser = JsonOutputParser(pydantic_object=SummaryInput)
-                chain = summary_prompt | llm | parser
-                result = safe_invoke(chain, {"text": query, "length": length}, context="Summary")
-                valid, msg = validate_response("Summary", result)
-                if not valid:
-                    return JSONResponse(content={"error": msg}, status_code=422)
-                response = {"type": "summary", **result}
-
-            elif use_case == "Quiz":
-                parser = JsonOutputParser(pydantic_object=QuizResponse)
-                chain = quiz_prompt | llm | parser
-                prompt_context = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-                prompt_with_context = f"{prompt_context}\nuser: {query}" if prompt_context else query
-                result = safe_invoke(chain, {"topic": prompt_with_context}, context="Quiz")
-                valid, msg = validate_response("Quiz", result)
-                if not valid:
-                    return JSONResponse(content={"error": msg}, status_code=422)
-                response = {"type": "quiz", **result}
-
-            elif use_case == "FunFact":
-                parser = JsonOutputParser(pydantic_object=FunFactResponse)
-                chain = fun_fact_prompt | llm | parser
-                prompt_context = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-                prompt_with_context = f"{prompt_context}\nuser: {query}" if prompt_context else query
-                result = safe_invoke(chain, {"word": prompt_with_context}, context="FunFact")
-                valid, msg = validate_response("FunFact", result)
-                if not valid:
-                    return JSONResponse(content={"error": msg}, status_code=422)
-                response = {"type": "fun_fact", **result}
+        messages = await build_context(llm, use_case, messages, query)
 
-            else:
-                return JSONResponse(
-                    content={"type": "not_supported", "message": "Diese Anfrage wird nicht unterstützt."},
-                    status_code=200
-                )
+        # Cache und Coalescing hängen am angefragten Provider; Fallback-Antworten werden
+        # nicht gecacht und nur mit Anfragen geteilt, die ebenfalls einen Fallback erlauben
+        key = make_request_key(use_case, build_chat_context(messages, query), *llm_identity(llm), length=length)
+        cached = await response_cache.aget(key) if use_cache else None
+        if cached is not None:
+            return answered(session, query, {
+                "type": RESPONSE_TYPES[use_case], **cached,
+                "served_by": {"provider": llm_identity(llm)[0], "model": llm_identity(llm)[1], "cache": True},
+            })
 
-        return JSONResponse(content=response, status_code=200)
+        # Umformulierte Anfragen ohne Verlauf können eine frühere Antwort wiederverwenden
+        vector = None
+        partition = (use_case, *llm_identity(llm), length)
+        if use_semantic and not messages:
+            vector = await semantic_cache.embed(query)
+            if vector is not None:
+                similar, similarity = semantic_cache.lookup(use_case, partition, vector)
+                if similar is not None:
+                    return answered(session, query, {
+                        "type": RESPONSE_TYPES[use_case], **similar,
+                        "served_by": {"provider": llm_identity(llm)[0], "model": llm_identity(llm)[1],
+                                      "cache": "semantic", "similarity": round(similarity, 4)},
+                    })
 
+        tokens = estimate_tokens(build_chat_context(messages, query), llm_identity(llm)[1])
+
+        async def attempt(candidate):
+            # Lange Dokumente werden vorab abschnittsweise verdichtet (Map), der
+            # normale Summary-Prompt bringt das Ergebnis auf die gewünschte Länge
+            text, text_tokens = query, tokens
+            if use_case == "Summary":
+                text = await document_summarizer.condense(candidate, query)
+                if text is not query:
+                    text_tokens = estimate_tokens(text, llm_identity(candidate)[1])
+            # Jeder Kandidat reiht sich beim Scheduler seines Providers ein
+            return await provider_scheduler.submit(
+                llm_identity(candidate)[0],
+                lambda: ainvoke_use_case(candidate, use_case, text, length=length, messages=messages),
+                tokens=text_tokens,
+            )
+
+        def call():
+            return router.run(llm, attempt, fallback=fallback)
+
+        # Identische, gleichzeitig laufende Anfragen teilen sich einen Provider-Aufruf
+        flight_key = f"{key}|fallback" if fallback else key
+        result, served, hedged = await (single_flight.do(flight_key, call) if coalesce else call())
+        if isinstance(result, dict) and "error" in result:
+            return JSONResponse(content={"error": result["error"]}, status_code=500)
+
+        result = {"data": result} if use_case == "FreePrompt" else result
+        valid, msg = observe_validation(use_case, result)
+        if not valid:
+            return JSONResponse(content={"error": msg}, status_code=422)
+        served_by_primary = llm_identity(served) == llm_identity(llm)
+        if use_cache and served_by_primary:
+            await response_cache.aset(key, result)
+        if vector is not None and served_by_primary:
+            semantic_cache.store(partition, vector, result)
+
+        served_provider, served_model = llm_identity(served)[:2]
+        return answered(session, query, {
+            "type": RESPONSE_TYPES[use_case], **result,
+            "served_by": {"provider": served_provider, "model": served_model, "hedged": hedged},
+        })
+
+    except ProviderOverloaded as po:
+        logging.warning("Anfrage abgewiesen", extra={"provider": po.provider, "reason": po.reason})
+        return overloaded_response(po)
     except ValueError as ve:
-        logging.error(f"Validierungsfehler: {ve}")
+        logging.error("Validierungsfehler", extra={"error": str(ve)})
         return JSONResponse(content={"error": str(ve)}, status_code=422)
     except Exception as e:
-        logging.exception(f"Fehler beim Verarbeiten der Anfrage: {e}")
+        logging.exception("Fehler beim Verarbeiten der Anfrage", extra={"error": str(e)})
         return JSONResponse(
             content={"error": "Ein unerwarteter Fehler ist aufgetreten."},
             status_code=500
         )
 
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.post("/process_query/stream")
+async def process_query_stream(request: Request):
+    data = await request.json()
+    query = data.get("query", "").strip()
+    length = data.get("length")
+    use_case = data.get("use_case")
+    provider = data.get("provider", "openai")
+    model = data.get("model", None)
+    use_cache = use_case in CACHEABLE_USE_CASES and data.get("cache", True) is not False
+
+    request_log.info("Anfrage (Stream)", extra={"use_case": use_case, "provider": provider, "model": model,
+                                                "query": query})
+
+    if not query:
+        return JSONResponse(content={"error": "Query fehlt oder ist leer."}, status_code=422)
+    if use_case not in RESPONSE_TYPES:
+        return JSONResponse(
+            content={"type": "not_supported", "message": "Diese Anfrage wird nicht unterstützt."},
+            status_code=200
+        )
+    if use_case == "Summary" and not length:
+        return JSONResponse(content={"error": "Längenangabe für Zusammenfassung fehlt."}, status_code=422)
+
+    async def stream_events():
+        started = time.perf_counter()
+        ttft = None
+        parts = []
+        try:
+            with span("get_llm", provider=provider, model=model):
+                llm = await aget_llm(provider=provider, model=model)
+            set_request_labels(use_case, *llm_identity(llm)[:2])
+            session, messages = await load_history(data)
+
+            if use_case == "Quiz" and QUIZ_POOL_ENABLED and data.get("pool", True) is not False:
+                quiz = quiz_from_pool(llm, query, messages)
+                if quiz is not None:
+                    if session is not None:
+                        session_store.record_turn(session, query, {"type": "quiz", **quiz})
+                    yield sse_event("result", {"type": "quiz", **quiz})
+                    yield sse_event("done", {
+                        "ttft_ms": None,
+                        "duration_ms": round((time.perf_counter() - started) * 1000),
+                        "pool": True,
+                    })
+                    return
+
+            context = await build_context(llm, use_case, messages, query)
+
+            # Gleicher Schlüssel wie in handle_query; ein Treffer kommt ohne Token-Events als Ergebnis
+            key = make_request_key(use_case, build_chat_context(context, query), *llm_identity(llm), length=length)
+            cached = await response_cache.aget(key) if use_cache else None
+            if cached is not None:
+                if session is not None:
+                    session_store.record_turn(session, query, {"type": RESPONSE_TYPES[use_case], **cached})
+                yield sse_event("result", {"type": RESPONSE_TYPES[use_case], **cached})
+                yield sse_event("done", {
+                    "ttft_ms": None,
+                    "duration_ms": round((time.perf_counter() - started) * 1000),
+                    "cache": True,
+                })
+                return
+
+            # JSON-Antworten werden beim Eintreffen gescannt; sobald das Objekt
+            # vollständig ist, wird der Rest des Streams (Nachsätze, Fences) nicht mehr abgewartet
+            extractor = IncrementalJSONExtractor() if use_case != "FreePrompt" else None
+            # Bei langen Dokumenten läuft der Map-Schritt vorab, gestreamt wird nur der Reduce
+            text = await document_summarizer.condense(llm, query) if use_case == "Summary" else query
+            tokens = estimate_tokens(build_chat_context(context, text), llm_identity(llm)[1])
+            async with provider_scheduler.slot(llm_identity(llm)[0], tokens):
+                stream = astream_use_case(llm, use_case, text, length=length, messages=context)
+                try:
+                    async for token in stream:
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                            record_ttft(ttft)
+                            request_log.info("TTFT %s/%s/%s: %.0f ms", use_case, provider, model, ttft * 1000)
+                        parts.append(token)
+                        yield sse_event("token", {"text": token})
+                        if extractor is not None and extractor.feed(token) is not None:
+                            break
+                finally:
+                    await stream.aclose()
+
+            if extractor is None:
+                result = {"data": "".join(parts).strip()}
+            elif extractor.done:
+                result = extractor.value
+                structured_output.record("prompt", True)
+            else:
+                result = parse_json_response(extractor.text)
+                if "error" in result:
+                    yield sse_event("error", {"error": result["error"]})
+                    return
+
+            valid, msg = observe_validation(use_case, result)
+            if not valid:
+                yield sse_event("error", {"error": msg})
+                return
+
+            if use_cache:
+                await response_cache.aset(key, result)
+            if session is not None:
+                session_store.record_turn(session, query, {"type": RESPONSE_TYPES[use_case], **result})
+            yield sse_event("result", {"type": RESPONSE_TYPES[use_case], **result})
+            yield sse_event("done", {
+                "ttft_ms": round(ttft * 1000) if ttft is not None else None,
+                "duration_ms": round((time.perf_counter() - started) * 1000),
+            })
+
+        except ProviderOverloaded as po:
+            logging.warning("Stream abgewiesen", extra={"provider": po.provider, "reason": po.reason})
+            yield sse_event("error", {"error": "Der Anbieter ist gerade ausgelastet. Bitte versuche es gleich noch einmal."})
+        except ValueError as ve:
+            logging.error("Validierungsfehler", extra={"error": str(ve)})
+            yield sse_event("error", {"error": str(ve)})
+        except Exception as e:
+            logging.exception("Fehler beim Streamen der Anfrage", extra={"error": str(e)})
+            yield sse_event("error", {"error": "Ein unerwarteter Fehler ist aufgetreten."})
+
+    async def event_stream():
+        with track_in_flight(use_case, normalize_provider(provider)):
+            async for event in stream_events():
+                yield event
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+BATCH_ITEM_FIELDS = ("use_case", "query", "length", "provider", "model", "messages", "cache", "coalesce", "fallback")
+
+def batch_validation_status(status_code: int, content: dict) -> str:
+    if status_code == 200:
+        return "not_supported" if content.get("type") == "not_supported" else "valid"
+    if status_code == 422:
+        return "invalid"
+    if status_code == 503:
+        return "overloaded"
+    return "error"
+
+async def run_batch_item(index: int, item: dict, defaults: dict, semaphore: asyncio.Semaphore) -> dict:
+    # Felder auf Batch-Ebene (provider, model, ...) gelten für alle Einträge ohne eigene Angabe
+    data = {**defaults, **{k: v for k, v in item.items() if k in BATCH_ITEM_FIELDS}}
+    async with semaphore:
+        with track_in_flight(data.get("use_case"), normalize_provider(data.get("provider"))):
+            response = await handle_query(data)
+    content = json.loads(response.body)
+    return {
+        "index": index,
+        "id": item.get("id"),
+        "status_code": response.status_code,
+        "validation": batch_validation_status(response.status_code, content),
+        **({"result": content} if response.status_code == 200 else {"error": content.get("error")}),
+    }
+
+@app.post("/process_batch")
+async def process_batch(request: Request):
+    """Führt viele Anfragen in einem HTTP-Aufruf aus, höchstens BATCH_CONCURRENCY gleichzeitig.
+
+    Jeder Eintrag durchläuft denselben Weg wie /process_query (Cache,
+    Coalescing, Router, Scheduler). Mit "stream": true wird jedes Ergebnis als
+    NDJSON-Zeile geschrieben, sobald es fertig ist.
+    """
+    data = await request.json()
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return JSONResponse(content={"error": "items fehlt oder ist leer."}, status_code=422)
+    if len(items) > BATCH_MAX_ITEMS:
+        return JSONResponse(content={"error": f"Höchstens {BATCH_MAX_ITEMS} Einträge pro Batch."}, status_code=422)
+    if not all(isinstance(item, dict) for item in items):
+        return JSONResponse(content={"error": "Jeder Eintrag muss ein Objekt sein."}, status_code=422)
+
+    concurrency = data.get("concurrency", BATCH_CONCURRENCY)
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool):
+        return JSONResponse(content={"error": "concurrency muss eine ganze Zahl sein."}, status_code=422)
+
+    defaults = {k: data[k] for k in BATCH_ITEM_FIELDS if k in data and k != "query"}
+    concurrency = max(1, min(concurrency, BATCH_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    request_log.info("Batch mit %d Einträgen, Parallelität %d", len(items), concurrency)
+
+    tasks = [asyncio.ensure_future(run_batch_item(i, item, defaults, semaphore)) for i, item in enumerate(items)]
+
+    def summary(results):
+        counts = {}
+        for r in results:
+            counts[r["validation"]] = counts.get(r["validation"], 0) + 1
+        return {"total": len(items), **counts, "duration_ms": round((time.perf_counter() - started) * 1000)}
+
+    if data.get("stream"):
+        async def ndjson():
+            results = []
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    result = await next_done
+                    results.append(result)
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+                yield json.dumps({"summary": summary(results)}, ensure_ascii=False) + "\n"
+            finally:
+                # Client hat die Verbindung geschlossen: restliche Einträge nicht mehr ausführen
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*tasks)
+    return JSONResponse(content={"results": results, "summary": summary(results)}, status_code=200)
+
+@app.get("/ready")
+async def ready():
+    # Die API ist immer bereit; OpenSearch-Zustand und gepuffertes Feedback zur Information
+    return JSONResponse(
+        content={
+            "status": "ok",
+            "opensearch": opensearch_state.as_dict(),
+            "feedback_queued": feedback_ingestor.queue.qsize(),
+        },
+        status_code=200
+    )
+
+@app.get("/client_stats")
+async def client_stats():
+    return JSONResponse(content=client_registry.stats(), status_code=200)
+
+@app.get("/use_case_stats")
+async def use_case_stats():
+    return JSONResponse(content=use_case_registry.stats(), status_code=200)
+
+@app.get("/structured_output_stats")
+async def structured_output_stats():
+    return JSONResponse(content=structured_output.stats(), status_code=200)
+
+@app.get("/summary_stats")
+async def summary_stats():
+    return JSONResponse(content=document_summarizer.stats(), status_code=200)
+
+@app.get("/slow_request_stats")
+async def slow_request_stats():
+    return JSONResponse(content=slow_request_log.stats(), status_code=200)
+
+@app.get("/logging_stats")
+async def log_stats():
+    return JSONResponse(content=logging_stats(), status_code=200)
+
+@app.get("/cache_stats")
+async def cache_stats():
+    # COUNT(*) läuft beim Disk-Backend auf der Datei
+    return JSONResponse(content=await asyncio.to_thread(response_cache.stats), status_code=200)
+
+@app.get("/semantic_cache_stats")
+async def semantic_cache_stats():
+    return JSONResponse(content=semantic_cache.stats(), status_code=200)
+
+@app.get("/coalescing_stats")
+async def coalescing_stats():
+    return JSONResponse(content=single_flight.stats(), status_code=200)
+
+@app.get("/router_stats")
+async def router_stats():
+    return JSONResponse(content=router.stats(), status_code=200)
+
+@app.get("/scheduler_stats")
+async def scheduler_stats():
+    return JSONResponse(content=provider_scheduler.stats(), status_code=200)
+
+@app.get("/quiz_pool_stats")
+async def quiz_pool_stats():
+    return JSONResponse(content=quiz_pool.stats(), status_code=200)
+
+@app.get("/session_stats")
+async def session_stats():
+    return JSONResponse(content=session_store.stats(), status_code=200)
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    try:
+        session = await session_store.find(session_id)
+    except ValueError as ve:
+        return JSONResponse(content={"error": str(ve)}, status_code=422)
+    if session is None:
+        return JSONResponse(content={"error": "Sitzung nicht gefunden"}, status_code=404)
+    return JSONResponse(content={"session_id": session.id, "messages": session.messages}, status_code=200)
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await session_store.delete(session_id)
+    return JSONResponse(content={"message": "Sitzung gelöscht"}, status_code=200)
+
+@app.get("/feedback_stats")
+async def feedback_ingest_stats():
+    return JSONResponse(content={**feedback_ingestor.stats(), "analytics": feedback_stats.stats()}, status_code=200)
+
+@app.get("/feedback/stats")
+async def feedback_analytics(window: str = None, interval: str = None):
+    # Zufriedenheit pro Provider/Modell; kurz gecacht, bei langsamem Cluster ggf. mit älterem Stand
+    try:
+        return JSONResponse(content=await feedback_stats.get(window, interval), status_code=200)
+    except ValueError as ve:
+        return JSONResponse(content={"error": str(ve)}, status_code=422)
+    except FeedbackStatsUnavailable as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503)
+
 @app.post("/store_feedback")
 async def store_feedback(request: Request):
     try:
@@ -175,21 +592,30 @@ async def store_feedback(request: Request):
         model = data.get("model")
         provider = data.get("provider")
         feedback_text = data.get("feedback", "")
-        messages = data.get("messages", [])
+        session_id = data.get("session_id")
 
         # Validierung
         if thumbs not in ["up", "down"]:
-            logger.error(f"Ungültiger thumbs-Wert: {thumbs}")
+            logger.error("Ungültiger thumbs-Wert: %r", thumbs)
             return JSONResponse(content={"error": "Ungültiger thumbs-Wert"}, status_code=400)
 
         if not isinstance(message_index, int):
-            logger.error(f"Ungültiger message_index-Wert: {message_index}")
+            logger.error("Ungültiger message_index-Wert: %r", message_index)
             return JSONResponse(content={"error": "message_index muss eine Ganzzahl sein"}, status_code=400)
 
         if provider not in ["openai", "groq", "google", "mistral"]:
-            logger.error(f"Ungültiger provider-Wert: {provider}")
+            logger.error("Ungültiger provider-Wert: %r", provider)
             return JSONResponse(content={"error": "Ungültiger provider-Wert"}, status_code=400)
 
+        # Snapshot des Verlaufs zum Zeitpunkt der Bewertung: die Sitzung wird danach
+        # weitergeführt und gekürzt, message_index muss aber auf die bewertete Nachricht zeigen.
+        # Gleiche Snapshots legt der FeedbackIngestor nur einmal ab.
+        if session_id is None:
+            messages = data.get("messages", [])
+        else:
+            session = await session_store.find(session_id)
+            messages = session_store.history(session) if session is not None else []
+
         # Erstelle das Dokument
         doc = {
             "timestamp": datetime.utcnow().isoformat(),
@@ -199,19 +625,26 @@ async def store_feedback(request: Request):
             "message_index": message_index,
             "feedback_text": feedback_text,
             "chat_snapshot": messages,
+            "session_id": session_id,
             "id": str(uuid4())
         }
-        logger.info(f"Prepared document: {doc}")
+        # Ohne Verlauf und Feedback-Text: die landen nur in OpenSearch
+        request_log.info("Feedback angenommen", extra={
+            "feedback_id": doc["id"], "thumbs": thumbs, "provider": provider, "model": model,
+            "message_index": message_index, "session_id": session_id,
+        })
 
-        client = get_opensearch_client()
-        response = client.index(index="chat-feedback", body=doc)
-        logger.info(f"Document indexed successfully: {response}")
+        # Das Dokument wird gepuffert und gebündelt über die _bulk-API geschrieben
+        await feedback_ingestor.submit(doc)
 
         return JSONResponse(content={"message": "Feedback stored successfully", "doc": doc}, status_code=200)
 
+    except FeedbackQueueFull as e:
+        logger.warning("Feedback abgewiesen", extra={"error": str(e)})
+        return JSONResponse(content={"error": str(e)}, status_code=503)
     except ValueError as ve:
-        logger.error(f"Ungültige JSON-Daten: {ve}")
+        logger.error("Ungültige JSON-Daten", extra={"error": str(ve)})
         return JSONResponse(content={"error": "Ungültige JSON-Daten"}, status_code=400)
     except Exception as e:
-        logger.error(f"Fehler beim Speichern des Feedbacks: {e}")
+        logger.error("Fehler beim Speichern des Feedbacks", extra={"error": str(e)})
         return JSONResponse(content={"error": str(e)}, status_code=500)
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+##########################
+# BACKENDS               #
+##########################
+
+class MemoryCacheBackend:
+    """LRU-Cache im Prozess mit TTL pro Eintrag."""
+
+    # Zugriffe sind billig genug für den Event-Loop
+    blocking = False
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                self.evictions += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+class DiskCacheBackend:
+    """SQLite-basierter Cache, der Neustarts überlebt; LRU über last_access.
+
+    Lesen schreibt nicht: Zugriffszeiten werden gesammelt und mit dem nächsten
+    set() (spätestens nach touch_batch Treffern) in einem Commit nachgetragen.
+    Abgelaufene Einträge entfernt ebenfalls erst set().
+    """
+
+    # Blockierende Datei-I/O; ResponseCache ruft das Backend über asyncio.to_thread auf
+    blocking = True
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS, touch_batch=256):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_batch = touch_batch
+        self.evictions = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON response_cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE response_cache SET last_access = ? WHERE key = ?",
+                                   [(at, key) for key, at in self._touched.items()])
+            self._touched.clear()
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            # Vor der Eviction, damit die LRU-Reihenfolge die letzten Treffer kennt
+            self._flush_touched()
+            self._touched.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now),
+            )
+            expired = self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,)).rowcount
+            overflow = self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._conn.commit()
+            self.evictions += expired + overflow
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+##########################
+# RESPONSE CACHE         #
+##########################
+
+def normalize_text(text: str) -> str:
+    return " ".join(str(text).split()).casefold()
+
+def make_request_key(use_case, text, provider, model, temperature, length=None):
+    payload = json.dumps(
+        [use_case, normalize_text(text), provider, model, temperature, length],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    make_key = staticmethod(make_request_key)
+
+    async def aget(self, key):
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key, value):
+        if self.backend.blocking:
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logging.warning("Cache-Lesefehler", extra={"error": str(e)})
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        # Nur bereits mit validate_response geprüfte Antworten hier ablegen.
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logging.warning("Cache-Schreibfehler", extra={"error": str(e)})
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+def create_response_cache():
+    if CACHE_BACKEND == "disk":
+        return ResponseCache(DiskCacheBackend())
+    return ResponseCache(MemoryCacheBackend())
+
+response_cache = create_response_cache()
@@ -1,43 +1,43 @@
 import re
-import json
 import logging
 import os
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List
 
-import requests
 from dotenv import load_dotenv
-from groq import Groq
-import google.generativeai as genai
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
-from langchain_core.prompts import PromptTemplate
 from pydantic import BaseModel, Field
-from langchain_openai.embeddings import OpenAIEmbeddings
 from langchain_core.exceptions import OutputParserException
-from mistralai import Mistral
 
 # Assuming src.validators exists; replace with actual implementation if needed
 from src.validators import validate_response
+from src.clients import client_registry, load_sdk
+from src.json_extract import extract_json, find_json
+from src.metrics import (
+    observe_upstream, observe_prepare, observe_parse, record_json_result, record_tokens, current_labels,
+)
+from src.log_config import setup_logging
 
 load_dotenv()
-logging.basicConfig(level=logging.INFO)
+setup_logging()
+
+_embeddings = None
 
-embedding = OpenAIEmbeddings()  # Note: Currently unused; consider removing if not needed
+def get_embeddings():
+    # Erst beim ersten Gebrauch (semantischer Cache); braucht OPENAI_API_KEY
+    global _embeddings
+    if _embeddings is None:
+        _embeddings = load_sdk("openai").OpenAIEmbeddings()
+    return _embeddings
 
 ##########################
 # CLEAN JSON OUTPUT      #
 ##########################
 
 def clean_json_output(text: str) -> str:
-    if not isinstance(text, str):
-        return text
-    # Remove code fences and language specifiers
-    text = re.sub(r"^```(?:json|python)?\s*|\s*```$", "", text.strip(), flags=re.MULTILINE)
-    # Remove surrounding quotes
-    text = re.sub(r"^['\"]{1,3}|['\"]{1,3}$", "", text.strip())
-    # Extract JSON object or array
-    match = re.search(r"(\{.*?\}|\[.*?\])", text, re.DOTALL)
-    return match.group().strip() if match else text.strip()
+    # Ein Durchlauf mit Klammer-Stack statt Regex; findet auch verschachtelte Objekte
+    # hinter Code-Fences, Reasoning-Blöcken und Begleittext (siehe src/json_extract.py)
+    return extract_json(text)
 
 ##########################
 # VALIDATION             #
@@ -53,63 +53,38 @@ def validate_input(user_input):
 # LLM FACTORY            #
 ##########################
 
+DEFAULT_MODELS = {
+    "openai": "gpt-4o",
+    "groq": "deepseek-r1-distill-llama-70b",
+    "google": "gemini-2.0-flash",
+    "mistral": "mistral-large-latest"
+}
+
 def get_llm(provider=None, model=None, temperature=0.1):
-    default_models = {
-        "openai": "gpt-4o",
-        "groq": "deepseek-r1-distill-llama-70b",
-        "google": "gemini-2.0-flash",
-        "mistral": "mistral-large-latest"
-    }
+    # Clients kommen aus der Registry und werden über Requests hinweg wiederverwendet.
+    model = model or DEFAULT_MODELS.get(provider, "gemini-2.0-flash")
+    return client_registry.get(provider, model, temperature)
 
-    model = model or default_models.get(provider, "gemini-2.0-flash")
+async def aget_llm(provider=None, model=None, temperature=0.1):
+    # Für den Request-Pfad: ein noch nicht geladenes SDK blockiert so nicht den Event-Loop
+    model = model or DEFAULT_MODELS.get(provider, "gemini-2.0-flash")
+    return await client_registry.aget(provider, model, temperature)
 
-    if provider == "groq":
-        return {
-            "provider": "groq",
-            "client": Groq(),
-            "model": model,
-            "temperature": temperature
-        }
-    elif provider == "google":
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
-        genai.configure(api_key=api_key)
-        return {
-            "provider": "google",
-            "client": genai.GenerativeModel(model_name=model),
-            "model": model,
-            "temperature": temperature
-        }
-    elif provider == "mistral":
-        api_key = os.getenv("MISTRAL_API_KEY")
-        if not api_key:
-            raise ValueError("MISTRAL_API_KEY not found in environment variables")
-        return {
-            "provider": "mistral",
-            "client": Mistral(api_key=api_key),
-            "model": model,
-            "temperature": temperature
-        }
-    else:
-        return ChatOpenAI(model=model, temperature=temperature)
+def llm_identity(llm):
+    if isinstance(llm, dict):
+        return llm["provider"], llm["model"], llm["temperature"]
+    return "openai", llm.model_name, llm.temperature
 
 ##########################
 # LANGCHAIN USE CASES    #
 ##########################
 
-free_prompt_template = PromptTemplate(
-    template="Beantworte ehrlich und hilfreich: {question}",
-    input_variables=["question"]
-)
+FREE_PROMPT_TEMPLATE = "Beantworte ehrlich und hilfreich: {question}"
 
 class SummaryInput(BaseModel):
     summary: str = Field(description="Zusammenfassung")
 
-summary_parser = JsonOutputParser(pydantic_object=SummaryInput)
-
-summary_prompt = PromptTemplate(
-    template="""
+SUMMARY_TEMPLATE = """
 Fasse den folgenden Text in einer {length}-Zusammenfassung zusammen. Antworte im JSON-Format:
 {{ "summary": "..." }}
 
@@ -117,10 +92,7 @@ Text:
 {text}
 
 {format_instructions}
-""",
-    input_variables=["text", "length"],
-    partial_variables={"format_instructions": summary_parser.get_format_instructions()}
-)
+"""
 
 class QuizResponse(BaseModel):
     question: str = Field(description="Die Quizfrage")
@@ -128,10 +100,7 @@ class QuizResponse(BaseModel):
     answer: str = Field(description="Korrekte Antwort")
     explanation: str = Field(description="Kurze Erläuterung zur richtigen Antwort")
 
-quiz_parser = JsonOutputParser(pydantic_object=QuizResponse)
-
-quiz_prompt = PromptTemplate(
-    template="""
+QUIZ_TEMPLATE = """
 Erstelle nun eine neue Multiple-Choice-Quizfrage zum Thema basierend auf dem Verlauf **ohne Wiederholung**:
 
 Beachte:
@@ -150,19 +119,13 @@ Antwortformat im JSON:
 }}
 
 {format_instructions}
-""",
-    input_variables=["topic"],
-    partial_variables={"format_instructions": quiz_parser.get_format_instructions()}
-)
+"""
 
 class FunFactResponse(BaseModel):
     fact: str = Field(description="Ein interessanter Fakt")
     source: str = Field(description="Quelle des Fakts")
 
-fun_fact_parser = JsonOutputParser(pydantic_object=FunFactResponse)
-
-fun_fact_prompt = PromptTemplate(
-    template="""
+FUN_FACT_TEMPLATE = """
 Gib mir einen interessanten Fun Fact basierend auf dem Wort: {word}. 
 
 Wähle nur verlässliche und öffentlich erreichbare Quellen.
@@ -171,10 +134,37 @@ Antwortformat im JSON:
 {{ "fact": "...", "source": "..." }}
 
 {format_instructions}
-""",
-    input_variables=["word"],
-    partial_variables={"format_instructions": fun_fact_parser.get_format_instructions()}
-)
+"""
+
+# Template, Eingabevariablen und Antwortschema je Use Case. Parser und Prompts
+# (inkl. der format_instructions aus dem Schema) werden erst beim ersten
+# Gebrauch gebaut; nur der OpenAI-Pfad braucht sie, Groq/Gemini/Mistral nicht.
+# Das Schema selbst geht bei strukturierter Ausgabe auch an Gemini.
+LANGCHAIN_USE_CASES = {
+    "Summary": (SUMMARY_TEMPLATE, ["text", "length"], SummaryInput),
+    "Quiz": (QUIZ_TEMPLATE, ["topic"], QuizResponse),
+    "FunFact": (FUN_FACT_TEMPLATE, ["word"], FunFactResponse),
+}
+
+@lru_cache(maxsize=None)
+def langchain_parser(use_case: str):
+    if use_case == "FreePrompt":
+        from langchain_core.output_parsers import StrOutputParser
+        return StrOutputParser()
+    from langchain_core.output_parsers import JsonOutputParser
+    return JsonOutputParser(pydantic_object=LANGCHAIN_USE_CASES[use_case][2])
+
+@lru_cache(maxsize=None)
+def langchain_prompt(use_case: str):
+    from langchain_core.prompts import PromptTemplate
+    if use_case == "FreePrompt":
+        return PromptTemplate(template=FREE_PROMPT_TEMPLATE, input_variables=["question"])
+    template, input_variables, _ = LANGCHAIN_USE_CASES[use_case]
+    return PromptTemplate(
+        template=template,
+        input_variables=input_variables,
+        partial_variables={"format_instructions": langchain_parser(use_case).get_format_instructions()}
+    )
 
 ##########################
 # PROVIDER API CALLS     #
@@ -185,7 +175,7 @@ REASONING_SUPPORTED_MODELS = {
     "deepseek-r1-distill-llama-70b",
 }
 
-def call_groq(prompt: str, client, model, temperature):
+def _groq_request_body(prompt: str, model, temperature, schema=None):
     request_body = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}],
@@ -197,22 +187,46 @@ def call_groq(prompt: str, client, model, temperature):
 
     if model in REASONING_SUPPORTED_MODELS:
         request_body["reasoning_format"] = "parsed"
+    if schema is not None:
+        # JSON-Modus; das Schema selbst steht weiterhin im Prompt
+        request_body["response_format"] = {"type": "json_object"}
+    return request_body
 
-    response = client.chat.completions.create(**request_body)
+def _google_generation_config(temperature, schema=None):
+    config = {
+        "temperature": temperature,
+        "top_p": 0.95,
+        "max_output_tokens": 1024
+    }
+    if schema is not None:
+        config["response_mime_type"] = "application/json"
+        config["response_schema"] = schema
+    return config
+
+def _record_openai_style_usage(provider, model, response):
+    usage = getattr(response, "usage", None)
+    if usage:
+        record_tokens(provider, model, usage.prompt_tokens, usage.completion_tokens)
+
+def _record_google_usage(model, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        record_tokens("google", model, usage.prompt_token_count, usage.candidates_token_count)
+
+def call_groq(prompt: str, client, model, temperature):
+    with observe_upstream():
+        response = client.chat.completions.create(**_groq_request_body(prompt, model, temperature))
+    _record_openai_style_usage("groq", model, response)
     return response.choices[0].message.content.strip()
 
 def call_google(prompt: str, client, model, temperature):
     try:
-        generation_config = {
-            "temperature": temperature,
-            "top_p": 0.95,
-            "max_output_tokens": 1024
-        }
-        
-        response = client.generate_content(
-            contents=prompt,
-            generation_config=generation_config
-        )
+        with observe_upstream():
+            response = client.generate_content(
+                contents=prompt,
+                generation_config=_google_generation_config(temperature)
+            )
+        _record_google_usage(model, response)
         
         if response.text:
             return response.text.strip()
@@ -220,64 +234,117 @@ def call_google(prompt: str, client, model, temperature):
             raise ValueError("No text in Gemini response")
             
     except Exception as e:
-        logging.error(f"Google API error: {e}")
+        logging.error("Google API error", extra={"error": str(e)})
         raise
 
 def call_mistral(prompt: str, client, model, temperature):
     try:
-        response = client.chat.complete(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=temperature,
-            top_p=0.95,
-            max_tokens=1024
-        )
+        with observe_upstream():
+            response = client.chat.complete(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                top_p=0.95,
+                max_tokens=1024
+            )
+        _record_openai_style_usage("mistral", model, response)
         if response.choices and response.choices[0].message.content:
             return response.choices[0].message.content.strip()
         else:
             raise ValueError("No content in Mistral response")
     except Exception as e:
-        logging.error(f"Mistral API error: {e}")
+        logging.error("Mistral API error", extra={"error": str(e)})
         raise
 
+def call_provider(prompt: str, client, model, temperature, provider="groq"):
+    if provider == "groq":
+        return call_groq(prompt, client, model, temperature)
+    elif provider == "google":
+        return call_google(prompt, client, model, temperature)
+    elif provider == "mistral":
+        return call_mistral(prompt, client, model, temperature)
+    raise ValueError(f"Unbekannter Provider: {provider}")
+
 ##########################
-# PROVIDER-AGNOSTIC CALLS #
+# ASYNC PROVIDER CALLS   #
 ##########################
 
-def get_free_prompt_groq(question: str, client, model, temperature, provider="groq"):
-    prompt = f"Beantworte ehrlich und hilfreich: {question}"
+# Gegenstücke zu call_groq/call_google/call_mistral für den FastAPI-Request-Pfad.
+# Erwarten den "async_client" aus get_llm (AsyncGroq, bzw. denselben Client
+# bei Google und Mistral, die ihre async-Methoden direkt mitbringen).
+
+async def acall_groq(prompt: str, client, model, temperature, schema=None):
+    with observe_upstream():
+        response = await client.chat.completions.create(**_groq_request_body(prompt, model, temperature, schema))
+    _record_openai_style_usage("groq", model, response)
+    return response.choices[0].message.content.strip()
+
+async def acall_google(prompt: str, client, model, temperature, schema=None):
+    try:
+        with observe_upstream():
+            response = await client.generate_content_async(
+                contents=prompt,
+                generation_config=_google_generation_config(temperature, schema)
+            )
+        _record_google_usage(model, response)
+
+        if response.text:
+            return response.text.strip()
+        else:
+            raise ValueError("No text in Gemini response")
+
+    except Exception as e:
+        logging.error("Google API error", extra={"error": str(e)})
+        raise
+
+async def acall_mistral(prompt: str, client, model, temperature, schema=None):
+    try:
+        with observe_upstream():
+            response = await client.chat.complete_async(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                top_p=0.95,
+                max_tokens=1024,
+                **({"response_format": {"type": "json_object"}} if schema is not None else {})
+            )
+        _record_openai_style_usage("mistral", model, response)
+        if response.choices and response.choices[0].message.content:
+            return response.choices[0].message.content.strip()
+        else:
+            raise ValueError("No content in Mistral response")
+    except Exception as e:
+        logging.error("Mistral API error", extra={"error": str(e)})
+        raise
+
+async def acall_provider(prompt: str, client, model, temperature, provider="groq"):
     if provider == "groq":
-        raw = call_groq(prompt, client, model, temperature)
+        return await acall_groq(prompt, client, model, temperature)
     elif provider == "google":
-        raw = call_google(prompt, client, model, temperature)
+        return await acall_google(prompt, client, model, temperature)
     elif provider == "mistral":
-        raw = call_mistral(prompt, client, model, temperature)
-    return raw
+        return await acall_mistral(prompt, client, model, temperature)
+    raise ValueError(f"Unbekannter Provider: {provider}")
 
-def get_summary_groq(text: str, length: str, client, model, temperature, provider="groq"):
-    prompt = f"""
+##########################
+# PROMPTS                #
+##########################
+
+def build_free_prompt(question: str) -> str:
+    return f"Beantworte ehrlich und hilfreich: {question}"
+
+def build_summary_prompt(text: str, length: str) -> str:
+    return f"""
 Fasse den folgenden Text in einer {length}-Zusammenfassung zusammen. Antworte im JSON-Format:
 {{ "summary": "..." }}
 
 Text:
 {text}
 """
-    if provider == "groq":
-        raw = call_groq(prompt, client, model, temperature)
-    elif provider == "google":
-        raw = call_google(prompt, client, model, temperature)
-    elif provider == "mistral":
-        raw = call_mistral(prompt, client, model, temperature)
-    cleaned = raw
-    try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError:
-        logging.error(f"Ungültige JSON-Antwort: {cleaned}")
-        return {"error": "Ungültige Antwort vom Modell"}
 
-def get_quiz_groq(topic: str, client, model, temperature, messages: list = None, provider="groq"):
+def build_quiz_prompt(topic: str, messages: list = None) -> str:
     prompt_topic = build_chat_context(messages or [], topic)
-    prompt = f"""Du bist ein Quiz-Generator. Dein Ziel ist es, eine **einzigartige Multiple-Choice-Frage** zu stellen, die sich **inhaltlich klar von vorherigen Fragen unterscheidet**.
+    return f"""Du bist ein Quiz-Generator. Dein Ziel ist es, eine **einzigartige Multiple-Choice-Frage** zu stellen, die sich **inhaltlich klar von vorherigen Fragen unterscheidet**.
 
     Vorherige Fragen und Inhalte (Chatverlauf):
     {prompt_topic}
@@ -300,21 +367,9 @@ def get_quiz_groq(topic: str, client, model, temperature, messages: list = None,
       "explanation": "..."
     }}
     """
-    if provider == "groq":
-        raw = call_groq(prompt, client, model, temperature)
-    elif provider == "google":
-        raw = call_google(prompt, client, model, temperature)
-    elif provider == "mistral":
-        raw = call_mistral(prompt, client, model, temperature)
-    cleaned = clean_json_output(raw)
-    try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError:
-        logging.error(f"Ungültige JSON-Antwort: {cleaned}")
-        return {"error": "Ungültige Antwort vom Modell"}
 
-def get_fun_fact_groq(word: str, client, model, temperature, provider="groq"):
-    prompt = f"""
+def build_fun_fact_prompt(word: str) -> str:
+    return f"""
 Gib mir einen interessanten Fun Fact basierend auf dem Wort: {word}. 
 
 Wähle nur verlässliche und öffentlich erreichbare Quellen.
@@ -322,18 +377,89 @@ Wähle nur verlässliche und öffentlich erreichbare Quellen.
 Antwortformat im JSON:
 {{ "fact": "...", "source": "..." }}
 """
-    if provider == "groq":
-        raw = call_groq(prompt, client, model, temperature)
-    elif provider == "google":
-        raw = call_google(prompt, client, model, temperature)
-    elif provider == "mistral":
-        raw = call_mistral(prompt, client, model, temperature)
-    cleaned = clean_json_output(raw)
-    try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError:
-        logging.error(f"Ungültige JSON-Antwort: {cleaned}")
-        return {"error": "Ungültige Antwort vom Modell"}
+
+def parse_json_response(raw: str, mode: str = "prompt"):
+    with observe_parse():
+        try:
+            result = find_json(raw)
+        except ValueError:
+            result = None
+    structured_output.record(mode, result is not None)
+    if result is not None:
+        return result
+    logging.error("Ungültige JSON-Antwort", extra={"raw": raw})
+    return {"error": "Ungültige Antwort vom Modell"}
+
+##########################
+# PROVIDER-AGNOSTIC CALLS #
+##########################
+
+def get_free_prompt_groq(question: str, client, model, temperature, provider="groq"):
+    return call_provider(build_free_prompt(question), client, model, temperature, provider=provider)
+
+def get_summary_groq(text: str, length: str, client, model, temperature, provider="groq"):
+    raw = call_provider(build_summary_prompt(text, length), client, model, temperature, provider=provider)
+    return parse_json_response(raw)
+
+def get_quiz_groq(topic: str, client, model, temperature, messages: list = None, provider="groq"):
+    raw = call_provider(build_quiz_prompt(topic, messages), client, model, temperature, provider=provider)
+    return parse_json_response(raw)
+
+def get_fun_fact_groq(word: str, client, model, temperature, provider="groq"):
+    raw = call_provider(build_fun_fact_prompt(word), client, model, temperature, provider=provider)
+    return parse_json_response(raw)
+
+##########################
+# STREAMING CALLS        #
+##########################
+
+async def astream_groq(prompt: str, client, model, temperature):
+    request_body = _groq_request_body(prompt, model, temperature)
+    request_body["stream"] = True
+    stream = await client.chat.completions.create(**request_body)
+    async for chunk in stream:
+        # Bei reasoning_format="parsed" kommt das Reasoning in delta.reasoning, nicht in content
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def astream_google(prompt: str, client, model, temperature):
+    response = await client.generate_content_async(
+        contents=prompt,
+        generation_config=_google_generation_config(temperature),
+        stream=True
+    )
+    async for chunk in response:
+        if chunk.text:
+            yield chunk.text
+
+async def astream_mistral(prompt: str, client, model, temperature):
+    stream = await client.chat.stream_async(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        top_p=0.95,
+        max_tokens=1024
+    )
+    async for event in stream:
+        choices = event.data.choices
+        if choices and choices[0].delta.content:
+            yield choices[0].delta.content
+
+async def astream_openai(llm, prompt_input):
+    async for chunk in llm.astream(prompt_input):
+        if chunk.content:
+            yield chunk.content
+
+def astream_use_case(llm, use_case: str, query: str, length: str = None, messages: list = None):
+    """Liefert die Text-Chunks eines Use Cases, so wie sie vom Provider eintreffen.
+
+    Die Prompts entsprechen denen von /process_query; das Parsen und Validieren
+    der vollständigen Antwort übernimmt der Aufrufer.
+    """
+    with observe_prepare():
+        compiled = use_case_registry.get(llm, use_case)
+        prompt = compiled.render(query, length, messages or [])
+    return compiled.astream(prompt)
 
 ##########################
 # SAFE INVOKE HELPER     #
@@ -343,16 +469,260 @@ def safe_invoke(chain, inputs, fallback=None, context=""):
     try:
         return chain.invoke(inputs)
     except OutputParserException as e:
-        logging.error(f"Parsing-Fehler in {context}: {e}")
+        logging.error("Parsing-Fehler", extra={"use_case": context, "error": str(e)})
         if fallback:
             return fallback()
         raise
     except Exception as e:
-        logging.error(f"Unerwarteter Fehler in {context}: {e}")
+        logging.error("Unerwarteter Fehler", extra={"use_case": context, "error": str(e)})
         if fallback:
             return fallback()
         raise
 
+async def asafe_invoke(chain, inputs, fallback=None, context="", mode="prompt"):
+    # Die Dauer umfasst hier auch den JsonOutputParser der Chain
+    try:
+        with observe_upstream():
+            result = await chain.ainvoke(inputs)
+        structured_output.record(mode, True)
+        return result
+    except OutputParserException as e:
+        structured_output.record(mode, False)
+        logging.error("Parsing-Fehler", extra={"use_case": context, "error": str(e)})
+        if fallback:
+            return fallback()
+        raise
+    except Exception as e:
+        logging.error("Unerwarteter Fehler", extra={"use_case": context, "error": str(e)})
+        if fallback:
+            return fallback()
+        raise
+
+##########################
+# STRUCTURED OUTPUT      #
+##########################
+
+# JSON-Use-Cases beim Provider als JSON anfordern (Groq/Mistral: JSON-Modus,
+# Gemini: response_schema, OpenAI: json_schema); "false" nutzt nur den Prompt
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "true").lower() != "false"
+# Modelle ohne Unterstützung, z.B. "groq:deepseek-r1-distill-llama-70b,openai:gpt-3.5-turbo"
+STRUCTURED_OUTPUT_EXCLUDE = os.getenv("STRUCTURED_OUTPUT_EXCLUDE", "")
+
+USE_CASE_SCHEMAS = {name: schema for name, (_, _, schema) in LANGCHAIN_USE_CASES.items()}
+
+# Fehlertexte, an denen eine Ablehnung des Antwortformats (nicht des Prompts) zu erkennen ist
+_FORMAT_ERROR_HINTS = ("response_format", "response_schema", "response_mime_type", "json_schema", "json_object",
+                       "json mode")
+
+class StructuredOutputSupport:
+    """Merkt sich, welche Modelle strukturierte Ausgabe unterstützen, und zählt Parse-Ergebnisse je Modus.
+
+    Lehnt ein Provider das Antwortformat ab (400/422 mit Hinweis auf
+    response_format bzw. Schema), wird das Modell bis zum Neustart als nicht
+    unterstützt geführt und der Use Case fällt auf die Prompt-Variante zurück.
+    """
+
+    def __init__(self, exclude=STRUCTURED_OUTPUT_EXCLUDE):
+        self.unsupported = {}
+        for entry in exclude.split(","):
+            provider, _, model = entry.strip().partition(":")
+            if provider and model:
+                self.unsupported[(provider, model)] = "STRUCTURED_OUTPUT_EXCLUDE"
+        self.results = {}
+
+    def supports(self, provider, model):
+        return (provider, model) not in self.unsupported
+
+    def mark_unsupported(self, provider, model, error):
+        self.unsupported[(provider, model)] = str(error)[:200]
+        logging.warning("Strukturierte Ausgabe abgelehnt, nutze Prompt-Format",
+                        extra={"provider": provider, "model": model, "error": str(error)})
+
+    @staticmethod
+    def rejects(error) -> bool:
+        text = str(error).lower()
+        # Groq meldet ungültiges JSON im JSON-Modus ebenfalls mit 400; das ist ein Parse-Fehler
+        if "json_validate_failed" in text:
+            return False
+        status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+        if status not in (400, 422) and type(error).__name__ not in ("InvalidArgument", "BadRequest"):
+            return False
+        return any(hint in text for hint in _FORMAT_ERROR_HINTS)
+
+    def record(self, mode, ok):
+        record_json_result(mode, ok)
+        labels = current_labels()
+        key = (labels["provider"], labels["model"], mode)
+        calls, failures = self.results.get(key, (0, 0))
+        self.results[key] = (calls + 1, failures + (not ok))
+
+    def stats(self):
+        return {
+            "enabled": STRUCTURED_OUTPUT,
+            "unsupported": {f"{provider}:{model}": reason for (provider, model), reason in self.unsupported.items()},
+            "results": [
+                {"provider": provider, "model": model, "mode": mode, "calls": calls, "failures": failures,
+                 "failure_rate": round(failures / calls, 4)}
+                for (provider, model, mode), (calls, failures) in sorted(self.results.items())
+            ],
+        }
+
+structured_output = StructuredOutputSupport()
+
+##########################
+# USE CASE REGISTRY      #
+##########################
+
+USE_CASE_REGISTRY_MAX_ENTRIES = int(os.getenv("USE_CASE_REGISTRY_MAX_ENTRIES", "128"))
+
+def _free_prompt_with_history(query, messages):
+    chat_context = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
+    return f"{chat_context}\nuser: {query}\nassistant:" if chat_context else query
+
+def _query_with_history(query, messages):
+    prompt_context = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
+    return f"{prompt_context}\nuser: {query}" if prompt_context else query
+
+# Prompt je Use Case als Funktion von (query, length, messages)
+PROVIDER_PROMPTS = {
+    "FreePrompt": lambda query, length, messages: build_free_prompt(_free_prompt_with_history(query, messages)),
+    "Summary": lambda query, length, messages: build_summary_prompt(query, length),
+    "Quiz": lambda query, length, messages: build_quiz_prompt(query, messages),
+    "FunFact": lambda query, length, messages: build_fun_fact_prompt(query),
+}
+
+LANGCHAIN_PROMPTS = {
+    "FreePrompt": lambda query, length, messages: messages + [{"role": "user", "content": query}],
+    "Summary": lambda query, length, messages: langchain_prompt("Summary").format_prompt(text=query, length=length),
+    "Quiz": lambda query, length, messages: langchain_prompt("Quiz").format_prompt(
+        topic=_query_with_history(query, messages)),
+    "FunFact": lambda query, length, messages: langchain_prompt("FunFact").format_prompt(
+        word=_query_with_history(query, messages)),
+}
+
+ASYNC_PROVIDER_CALLS = {"groq": acall_groq, "google": acall_google, "mistral": acall_mistral}
+STREAM_PROVIDER_CALLS = {"groq": astream_groq, "google": astream_google, "mistral": astream_mistral}
+
+class CompiledUseCase:
+    """Prompt-Aufbau, Aufruf und Parser eines Use Cases für genau ein LLM.
+
+    Wird einmal pro (Use Case, Provider, Modell, Temperatur) gebaut; pro
+    Request bleiben nur render() und der eigentliche Aufruf. Provider-Dicts
+    und ChatOpenAI laufen dabei durch dieselben Schritte.
+    """
+
+    def __init__(self, llm, use_case: str, structured: bool = None):
+        if use_case not in PROVIDER_PROMPTS:
+            raise ValueError(f"Unbekannter Use Case: {use_case}")
+        self.use_case = use_case
+        self.llm = llm
+        self.parse_json = use_case != "FreePrompt"
+        self.schema = USE_CASE_SCHEMAS.get(use_case)
+        self._identity = llm_identity(llm)[:2]
+        structured = STRUCTURED_OUTPUT if structured is None else structured
+        self.structured = structured and self.schema is not None and structured_output.supports(*self._identity)
+
+        if isinstance(llm, dict):
+            provider = llm["provider"]
+            if provider not in ASYNC_PROVIDER_CALLS:
+                raise ValueError(f"Unbekannter Provider: {provider}")
+            self.render = PROVIDER_PROMPTS[use_case]
+            self._call = ASYNC_PROVIDER_CALLS[provider]
+            self._stream = STREAM_PROVIDER_CALLS[provider]
+            self._args = (llm["async_client"], llm["model"], llm["temperature"])
+            self.runnable = None
+        else:
+            self.render = LANGCHAIN_PROMPTS[use_case]
+            # FreePrompt liefert die AIMessage, alle anderen gehen durch den JsonOutputParser
+            self.runnable = llm | langchain_parser(use_case) if self.parse_json else llm
+            # Liefert direkt eine Instanz des Schemas statt Text für den JsonOutputParser
+            self.structured_runnable = (llm.with_structured_output(self.schema, method="json_schema")
+                                        if self.structured else None)
+
+    async def ainvoke(self, prompt):
+        if self.structured and structured_output.supports(*self._identity):
+            try:
+                return await self._ainvoke_structured(prompt)
+            except Exception as e:
+                if not structured_output.rejects(e):
+                    raise
+                structured_output.mark_unsupported(*self._identity, e)
+            self.structured = False
+        if self.runnable is None:
+            raw = await self._call(prompt, *self._args)
+            return parse_json_response(raw) if self.parse_json else raw
+        if not self.parse_json:
+            with observe_upstream():
+                return (await self.runnable.ainvoke(prompt)).content
+        return await asafe_invoke(self.runnable, prompt, context=self.use_case)
+
+    async def _ainvoke_structured(self, prompt):
+        if self.runnable is None:
+            try:
+                raw = await self._call(prompt, *self._args, schema=self.schema)
+            except Exception as e:
+                if "json_validate_failed" not in str(e).lower():
+                    raise
+                structured_output.record("native", False)
+                logging.error("Ungültiges JSON im JSON-Modus", extra={"use_case": self.use_case, "error": str(e)})
+                return {"error": "Ungültige Antwort vom Modell"}
+            return parse_json_response(raw, mode="native")
+        result = await asafe_invoke(self.structured_runnable, prompt, context=self.use_case, mode="native")
+        return result.model_dump()
+
+    def astream(self, prompt):
+        if self.runnable is None:
+            return self._stream(prompt, *self._args)
+        return astream_openai(self.llm, prompt)
+
+class UseCaseRegistry:
+    """LRU-begrenzter Cache der CompiledUseCase-Objekte je (Use Case, Provider, Modell, Temperatur)."""
+
+    def __init__(self, max_entries=USE_CASE_REGISTRY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, llm, use_case: str) -> CompiledUseCase:
+        key = (use_case, *llm_identity(llm))
+        compiled = self._entries.get(key)
+        # Ein neu gebauter Client (z.B. nach Eviction in der ClientRegistry) ersetzt den alten Eintrag
+        if compiled is not None and compiled.llm is llm:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return compiled
+
+        self.misses += 1
+        compiled = self._entries[key] = CompiledUseCase(llm, use_case)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return compiled
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+use_case_registry = UseCaseRegistry()
+
+async def ainvoke_use_case(llm, use_case: str, query: str, length: str = None, messages: list = None):
+    """Führt einen Use Case gegen ein LLM aus, egal ob Provider-Dict oder ChatOpenAI.
+
+    FreePrompt liefert den Antworttext, die übrigen Use Cases das geparste
+    JSON (bzw. {"error": ...}). Validierung und Caching übernimmt der Aufrufer.
+    """
+    with observe_prepare():
+        compiled = use_case_registry.get(llm, use_case)
+        prompt = compiled.render(query, length, messages or [])
+    return await compiled.ainvoke(prompt)
+
 ##########################
 # MAIN LOGIC             #
 ##########################
@@ -404,7 +774,7 @@ def main(user_query, use_case: str, extra_params=None, provider="openai"):
 
         else:
             if use_case == "FreePrompt":
-                chain = free_prompt_template | llm | StrOutputParser()
+                chain = langchain_prompt("FreePrompt") | llm | langchain_parser("FreePrompt")
                 result = safe_invoke(chain, {"question": validated_query}, context="FreePrompt")
                 valid, msg = validate_response("FreePrompt", {"data": result})
                 if not valid:
@@ -414,7 +784,7 @@ def main(user_query, use_case: str, extra_params=None, provider="openai"):
             elif use_case == "Summary":
                 if not extra_params or "length" not in extra_params:
                     raise ValueError("Länge der Zusammenfassung fehlt.")
-                chain = summary_prompt | llm | summary_parser
+                chain = langchain_prompt("Summary") | llm | langchain_parser("Summary")
                 result = safe_invoke(chain, {"text": validated_query, "length": extra_params["length"]}, context="Summary")
                 valid, msg = validate_response("Summary", result)
                 if not valid:
@@ -422,7 +792,7 @@ def main(user_query, use_case: str, extra_params=None, provider="openai"):
                 return {"type": "summary", **result}
 
             elif use_case == "Quiz":
-                chain = quiz_prompt | llm | quiz_parser
+                chain = langchain_prompt("Quiz") | llm | langchain_parser("Quiz")
                 result = safe_invoke(chain, {"topic": validated_query}, context="Quiz")
                 valid, msg = validate_response("Quiz", result)
                 if not valid:
@@ -430,7 +800,7 @@ def main(user_query, use_case: str, extra_params=None, provider="openai"):
                 return {"type": "quiz", **result}
 
             elif use_case == "FunFact":
-                chain = fun_fact_prompt | llm | fun_fact_parser
+                chain = langchain_prompt("FunFact") | llm | langchain_parser("FunFact")
                 result = safe_invoke(chain, {"word": validated_query}, context="FunFact")
                 valid, msg = validate_response("FunFact", result)
                 if not valid:
@@ -441,7 +811,7 @@ def main(user_query, use_case: str, extra_params=None, provider="openai"):
                 return {"type": "not_supported", "message": "Diese Anfrage wird derzeit nicht unterstützt."}
 
     except ValueError as ve:
-        logging.warning(f"Validierungsfehler: {ve}")
+        logging.warning("Validierungsfehler", extra={"error": str(ve)})
         return {"error": str(ve)}
 
 def build_chat_context(messages: list, current_query: str = None) -> str:
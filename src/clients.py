@@ -0,0 +1,300 @@
+import asyncio
+import importlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+from src.metrics import token_usage_callback
+
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+MAX_REGISTRY_ENTRIES = int(os.getenv("LLM_MAX_REGISTRY_ENTRIES", "64"))
+# Alternative Endpunkte, z.B. für die Fake-Provider aus bench/fake_services.py.
+# Groq und OpenAI lesen GROQ_BASE_URL bzw. OPENAI_BASE_URL selbst aus der Umgebung,
+# GOOGLE_API_ENDPOINT ist host:port eines gRPC-Servers mit TLS (eigene CA über
+# GRPC_DEFAULT_SSL_ROOTS_FILE_PATH, siehe bench/fake_services.py).
+MISTRAL_BASE_URL = os.getenv("MISTRAL_BASE_URL")
+GOOGLE_API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+
+##########################
+# LAZY SDK LOADING       #
+##########################
+
+# Die Provider-SDKs brauchen zusammen mehrere Sekunden zum Importieren und werden
+# deshalb erst geladen, wenn der Provider das erste Mal gebraucht (oder beim
+# Start über LLM_WARM_PROVIDERS ausdrücklich aufgewärmt) wird.
+PROVIDER_MODULES = {
+    "groq": "groq",
+    "google": "google.generativeai",
+    "mistral": "mistralai",
+    "openai": "langchain_openai",
+}
+
+_sdk_modules = {}
+_sdk_load_seconds = {}
+_sdk_lock = threading.Lock()
+
+def load_sdk(provider):
+    module = _sdk_modules.get(provider)
+    if module is not None:
+        return module
+    with _sdk_lock:
+        if provider not in _sdk_modules:
+            started = time.perf_counter()
+            _sdk_modules[provider] = importlib.import_module(PROVIDER_MODULES[provider])
+            _sdk_load_seconds[provider] = time.perf_counter() - started
+            logging.info(f"SDK für {provider} geladen in {_sdk_load_seconds[provider] * 1000:.0f} ms")
+        return _sdk_modules[provider]
+
+async def preload_sdks(providers):
+    # Import im Thread, damit der Event-Loop beim Aufwärmen nicht blockiert
+    for provider in providers:
+        if provider in PROVIDER_MODULES:
+            await asyncio.to_thread(load_sdk, provider)
+
+##########################
+# POOL STATISTICS        #
+##########################
+
+class PoolStats:
+    # Zählt Requests und neu aufgebaute TCP-Verbindungen über den httpcore-Trace,
+    # daraus ergibt sich die Wiederverwendungsrate der Keep-Alive-Verbindungen.
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+
+    def _trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    async def _atrace(self, event_name, info):
+        self._trace(event_name, info)
+
+    def on_request(self, request):
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def on_async_request(self, request):
+        self.requests += 1
+        request.extensions["trace"] = self._atrace
+
+    def as_dict(self):
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0,
+        }
+
+##########################
+# CLIENT REGISTRY        #
+##########################
+
+def normalize_provider(provider):
+    # Wie bisher in get_llm: alles Unbekannte geht an OpenAI
+    return provider if provider in ("groq", "google", "mistral") else "openai"
+
+class ClientRegistry:
+    """Hält langlebige Provider-Clients, geschlüsselt nach (provider, model, temperature).
+
+    Alle Einträge eines Providers teilen sich einen httpx-Verbindungspool
+    (sync und async), dessen Größe über LLM_MAX_CONNECTIONS begrenzt ist.
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_keepalive=MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=KEEPALIVE_EXPIRY, timeout=REQUEST_TIMEOUT, max_entries=MAX_REGISTRY_ENTRIES):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._http = {}
+        self._pool_stats = {}
+        self._sdk_clients = {}
+        self._google_configured = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _http_clients(self, provider):
+        if provider not in self._http:
+            stats = self._pool_stats.setdefault(provider, PoolStats())
+            self._http[provider] = (
+                httpx.Client(limits=self.limits, timeout=self.timeout,
+                             event_hooks={"request": [stats.on_request]}),
+                httpx.AsyncClient(limits=self.limits, timeout=self.timeout,
+                                  event_hooks={"request": [stats.on_async_request]}),
+            )
+        return self._http[provider]
+
+    def _sdk_client(self, provider):
+        # Ein SDK-Client pro Provider; Modell und Temperatur sind Request-Parameter.
+        if provider in self._sdk_clients:
+            return self._sdk_clients[provider]
+
+        sync_http, async_http = self._http_clients(provider)
+        if provider == "groq":
+            # Wiederholungen bei 429/503 übernimmt der ProviderScheduler (src/scheduler.py)
+            groq = load_sdk("groq")
+            clients = (groq.Groq(http_client=sync_http), groq.AsyncGroq(http_client=async_http, max_retries=0))
+        elif provider == "mistral":
+            api_key = os.getenv("MISTRAL_API_KEY")
+            if not api_key:
+                raise ValueError("MISTRAL_API_KEY not found in environment variables")
+            client = load_sdk("mistral").Mistral(api_key=api_key, server_url=MISTRAL_BASE_URL,
+                                                 client=sync_http, async_client=async_http)
+            clients = (client, client)
+        else:
+            raise ValueError(f"Unbekannter Provider: {provider}")
+
+        self._sdk_clients[provider] = clients
+        return clients
+
+    def _configure_google(self):
+        if self._google_configured:
+            return
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        # Sync- und async-Client bleiben bei gRPC; nur der Endpunkt wird umgestellt
+        client_options = {"api_endpoint": GOOGLE_API_ENDPOINT} if GOOGLE_API_ENDPOINT else None
+        load_sdk("google").configure(api_key=api_key, client_options=client_options)
+        self._google_configured = True
+
+    def _build(self, provider, model, temperature):
+        if provider in ("groq", "mistral"):
+            client, async_client = self._sdk_client(provider)
+            return {
+                "provider": provider,
+                "client": client,
+                "async_client": async_client,
+                "model": model,
+                "temperature": temperature
+            }
+        elif provider == "google":
+            # Gemini nutzt gRPC; der Kanal wird vom SDK pro Prozess geteilt.
+            self._configure_google()
+            client = load_sdk("google").GenerativeModel(model_name=model)
+            return {
+                "provider": "google",
+                "client": client,
+                "async_client": client,
+                "model": model,
+                "temperature": temperature
+            }
+        else:
+            sync_http, async_http = self._http_clients("openai")
+            return load_sdk("openai").ChatOpenAI(model=model, temperature=temperature,
+                                                 http_client=sync_http, http_async_client=async_http,
+                                                 stream_usage=True, callbacks=[token_usage_callback],
+                                                 max_retries=0)
+
+    _normalize = staticmethod(normalize_provider)
+
+    def get(self, provider, model, temperature):
+        provider = self._normalize(provider)
+        key = (provider, model, temperature)
+
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        # Der SDK-Import dauert beim ersten Mal Sekunden und läuft deshalb ohne
+        # Registry-Lock; _build selbst baut danach nur noch Client-Objekte
+        load_sdk(provider)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            self.misses += 1
+            llm = self._build(provider, model, temperature)
+            self._entries[key] = llm
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return llm
+
+    async def aget(self, provider, model, temperature):
+        """Wie get(), importiert ein noch nicht geladenes SDK aber im Thread statt auf dem Event-Loop."""
+        provider = self._normalize(provider)
+        if provider not in _sdk_modules:
+            await asyncio.to_thread(load_sdk, provider)
+        return self.get(provider, model, temperature)
+
+    async def warm(self, providers, default_models):
+        """Baut Clients für die angegebenen Provider auf und öffnet je eine Verbindung."""
+        async def _warm_one(provider):
+            try:
+                await preload_sdks([provider])
+                llm = self.get(provider, default_models[provider], 0.1)
+                if provider == "groq":
+                    await llm["async_client"].models.list()
+                elif provider == "mistral":
+                    await llm["async_client"].models.list_async()
+                elif provider == "google":
+                    await asyncio.to_thread(lambda: next(iter(load_sdk("google").list_models()), None))
+                else:
+                    await llm.root_async_client.models.list()
+                logging.info(f"Provider-Client aufgewärmt: {provider}")
+            except Exception as e:
+                logging.warning("Aufwärmen fehlgeschlagen", extra={"provider": provider, "error": str(e)})
+
+        await asyncio.gather(*[_warm_one(p) for p in providers if p in default_models])
+
+    async def aclose(self):
+        with self._lock:
+            http_clients = list(self._http.values())
+            self._http.clear()
+            self._sdk_clients.clear()
+            self._entries.clear()
+        for sync_http, async_http in http_clients:
+            sync_http.close()
+            await async_http.aclose()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "limits": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+            },
+            "pools": {provider: stats.as_dict() for provider, stats in self._pool_stats.items()},
+            "sdk_load_ms": {provider: round(seconds * 1000) for provider, seconds in _sdk_load_seconds.items()},
+        }
+
+PROVIDER_API_KEYS = {
+    "openai": "OPENAI_API_KEY",
+    "groq": "GROQ_API_KEY",
+    "google": "GOOGLE_API_KEY",
+    "mistral": "MISTRAL_API_KEY",
+}
+
+def configured_providers():
+    return [provider for provider, key in PROVIDER_API_KEYS.items() if os.getenv(key)]
+
+def warm_providers_from_env():
+    # Kommaseparierte Liste, z.B. LLM_WARM_PROVIDERS=groq,mistral. Ohne Angabe
+    # werden alle Provider aufgewärmt, für die ein API-Key gesetzt ist.
+    configured = os.getenv("LLM_WARM_PROVIDERS")
+    if configured is not None:
+        return [p.strip() for p in configured.split(",") if p.strip()]
+    return configured_providers()
+
+client_registry = ClientRegistry()
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from src.chains import acall_provider
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+SUMMARY_MAX_WORDS = int(os.getenv("CONTEXT_SUMMARY_MAX_WORDS", "120"))
+SUMMARY_CACHE_SIZE = int(os.getenv("CONTEXT_SUMMARY_CACHE_SIZE", "512"))
+# Platz, der im Budget für die Zusammenfassung freigehalten wird (~2 Tokens pro Wort)
+SUMMARY_RESERVE_TOKENS = SUMMARY_MAX_WORDS * 2
+
+def _parse_budgets(raw):
+    # z.B. CONTEXT_TOKEN_BUDGETS="llama3-8b-8192=1500,gemma2-9b-it=1500"
+    budgets = {}
+    for item in raw.split(","):
+        if "=" in item:
+            model, value = item.split("=", 1)
+            budgets[model.strip()] = int(value)
+    return budgets
+
+MODEL_TOKEN_BUDGETS = _parse_budgets(os.getenv("CONTEXT_TOKEN_BUDGETS", ""))
+
+##########################
+# TOKEN COUNTING         #
+##########################
+
+# Encodings, die beim Start geladen werden (gpt-4o und Fallback für alle anderen Provider)
+PRELOAD_ENCODINGS = ("o200k_base", "cl100k_base")
+
+# tiktoken lädt die BPE-Datei beim ersten get_encoding() aus dem Netz bzw. Cache und
+# parst sie; das dauert zu lange für den Request-Pfad. Geladene Encodings liegen hier,
+# bis dahin (oder wenn das Laden scheitert) wird über die Zeichenzahl geschätzt.
+_encodings = {}
+_encoding_attempts = set()
+_encoding_lock = threading.Lock()
+
+@lru_cache(maxsize=32)
+def _encoding_name_for(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        # Für Groq, Gemini und Mistral gibt es keinen öffentlichen Tokenizer in tiktoken;
+        # cl100k_base liegt für die gängigen Modelle nahe genug an der echten Zahl.
+        return "cl100k_base"
+
+def load_encoding(name):
+    with _encoding_lock:
+        if name in _encoding_attempts:
+            return _encodings.get(name)
+        _encoding_attempts.add(name)
+    try:
+        _encodings[name] = tiktoken.get_encoding(name)
+    except Exception as e:
+        # Nur einmal pro Encoding; danach wird stillschweigend geschätzt
+        logging.warning("Tokenizer nicht verfügbar, Tokens werden geschätzt", extra={"encoding": name, "error": str(e)})
+    return _encodings.get(name)
+
+async def preload_encodings(names=PRELOAD_ENCODINGS):
+    # Beim Start im Thread, damit der Event-Loop nicht auf Download und Parsen wartet
+    if tiktoken is None:
+        logging.warning("tiktoken ist nicht installiert, Tokens werden geschätzt")
+        return
+    for name in names:
+        await asyncio.to_thread(load_encoding, name)
+
+def _encoding(name):
+    encoding = _encodings.get(name)
+    if encoding is not None or name is None or name in _encoding_attempts:
+        return encoding
+    try:
+        # Auf dem Event-Loop im Hintergrund nachladen und so lange schätzen
+        asyncio.get_running_loop().run_in_executor(None, load_encoding, name)
+        return None
+    except RuntimeError:
+        return load_encoding(name)
+
+@lru_cache(maxsize=8192)
+def _count(text, encoding_name):
+    return len(_encodings[encoding_name].encode(text, disallowed_special=()))
+
+def count_tokens(text: str, model: str = None) -> int:
+    name = _encoding_name_for(model or "gpt-4o")
+    if _encoding(name) is None:
+        return len(text) // 4 + 1
+    return _count(text, name)
+
+def message_tokens(message: dict, model: str = None) -> int:
+    # +4 für Rolle und Trenner, wie bei den Chat-Formaten der Provider üblich
+    return count_tokens(f"{message['role']}: {message['content']}", model) + 4
+
+def token_budget(model: str = None) -> int:
+    return MODEL_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+##########################
+# QUIZ HISTORY           #
+##########################
+
+def quiz_questions_only(messages: list) -> list:
+    """Reduziert den Quiz-Verlauf auf die bereits gestellten Fragen."""
+    reduced = []
+    for m in messages:
+        if m.get("role") != "assistant":
+            continue
+        for line in str(m.get("content", "")).splitlines():
+            if line.startswith("Frage:"):
+                reduced.append({"role": "assistant", "content": line.strip()})
+                break
+    return reduced
+
+##########################
+# ROLLING SUMMARY        #
+##########################
+
+def fold_keys(messages: list, scope=None) -> list:
+    """Cache-Schlüssel jeder Faltgrenze: verkettet über alle Nachrichten bis zur Grenze.
+
+    Zwei Verläufe teilen sich eine Zusammenfassung nur bei identischem Präfix
+    und gleichem Modell (scope), nie schon bei gleichen letzten Nachrichten.
+    """
+    key = hashlib.sha256(json.dumps(scope, ensure_ascii=False).encode("utf-8")).hexdigest()
+    keys = []
+    for m in messages:
+        key = hashlib.sha256(f"{key}\x00{m['role']}\x00{m['content']}".encode("utf-8")).hexdigest()
+        keys.append(key)
+    return keys
+
+def summary_prompt_for(previous_summary: str, messages: list) -> str:
+    transcript = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
+    previous = f"Bisherige Zusammenfassung:\n{previous_summary}\n\n" if previous_summary else ""
+    return f"""Fasse den folgenden Gesprächsverlauf in höchstens {SUMMARY_MAX_WORDS} Wörtern zusammen.
+Behalte Fakten, Namen, Zahlen und offene Fragen bei. Antworte nur mit der Zusammenfassung.
+
+{previous}Neue Nachrichten:
+{transcript}
+"""
+
+def make_summarizer(llm):
+    async def summarize(prompt: str) -> str:
+        if isinstance(llm, dict):
+            return await acall_provider(prompt, llm["async_client"], llm["model"], llm["temperature"],
+                                        provider=llm["provider"])
+        return (await llm.ainvoke(prompt)).content.strip()
+    return summarize
+
+class ContextBuilder:
+    """Begrenzt den Chatverlauf auf ein Token-Budget.
+
+    Die neuesten Nachrichten werden wörtlich übernommen, solange sie ins Budget
+    passen. Ältere Nachrichten werden zu einer Zusammenfassung gefaltet, die pro
+    Faltgrenze gecacht wird, sodass bei jedem neuen Turn nur die neu
+    herausgefallenen Nachrichten nachgefasst werden müssen.
+    """
+
+    def __init__(self, cache_size=SUMMARY_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()
+        self.summary_calls = 0
+        self.summary_cache_hits = 0
+
+    def _cache_get(self, key):
+        summary = self._summaries.get(key)
+        if summary is not None:
+            self._summaries.move_to_end(key)
+        return summary
+
+    def _cache_set(self, key, summary):
+        self._summaries[key] = summary
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.cache_size:
+            self._summaries.popitem(last=False)
+
+    async def _rolling_summary(self, folded: list, summarize, scope=None) -> str:
+        keys = fold_keys(folded, scope)
+
+        # Späteste Faltgrenze suchen, bis zu der schon eine Zusammenfassung existiert
+        start, previous = 0, None
+        for i in range(len(keys) - 1, -1, -1):
+            cached = self._cache_get(keys[i])
+            if cached is not None:
+                start, previous = i + 1, cached
+                break
+
+        if start == len(folded):
+            self.summary_cache_hits += 1
+            return previous
+
+        self.summary_calls += 1
+        summary = await summarize(summary_prompt_for(previous, folded[start:]))
+        self._cache_set(keys[-1], summary)
+        return summary
+
+    async def build(self, messages: list, query: str, model: str = None, use_case: str = None,
+                    summarize=None, budget: int = None, scope=None) -> list:
+        """scope kennzeichnet das zusammenfassende Modell, z.B. llm_identity(llm)."""
+        messages = [m for m in (messages or []) if m.get("content")]
+        if use_case == "Quiz":
+            messages = quiz_questions_only(messages)
+
+        budget = (budget if budget is not None else token_budget(model)) - count_tokens(query or "", model)
+        tokens = [message_tokens(m, model) for m in messages]
+        if sum(tokens) <= budget:
+            return messages
+
+        # Quiz braucht nur die Fragen; ältere Fragen fallen ohne Zusammenfassung heraus
+        summarizing = use_case != "Quiz" and summarize is not None
+        available = budget - (SUMMARY_RESERVE_TOKENS if summarizing else 0)
+
+        kept_from = len(messages)
+        used = 0
+        while kept_from > 0 and used + tokens[kept_from - 1] <= available:
+            kept_from -= 1
+            used += tokens[kept_from]
+        kept, folded = messages[kept_from:], messages[:kept_from]
+
+        if not summarizing:
+            return kept
+
+        try:
+            summary = await self._rolling_summary(folded, summarize, scope)
+        except Exception as e:
+            logging.warning("Zusammenfassung des Verlaufs fehlgeschlagen, ältere Nachrichten werden verworfen",
+                            extra={"error": str(e)})
+            return kept
+
+        return [{"role": "system", "content": f"Zusammenfassung des bisherigen Gesprächs: {summary}"}] + kept
+
+    def stats(self):
+        return {
+            "summary_entries": len(self._summaries),
+            "summary_calls": self.summary_calls,
+            "summary_cache_hits": self.summary_cache_hits,
+        }
+
+context_builder = ContextBuilder()
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+
+from src.cache import MemoryCacheBackend
+from src.chains import llm_identity
+from src.context import count_tokens, make_summarizer
+from src.scheduler import provider_scheduler, estimate_tokens
+from src.singleflight import SingleFlight
+
+# Ab dieser Länge (Tokens) wird ein Dokument erst abschnittsweise zusammengefasst
+SUMMARY_CHUNK_THRESHOLD = int(os.getenv("SUMMARY_CHUNK_THRESHOLD", "3000"))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1200"))
+SUMMARY_CHUNK_MAX_WORDS = int(os.getenv("SUMMARY_CHUNK_MAX_WORDS", "150"))
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+# Sind die Teilzusammenfassungen zusammen noch zu lang, folgt eine weitere Runde
+SUMMARY_MAX_ROUNDS = int(os.getenv("SUMMARY_MAX_ROUNDS", "3"))
+SUMMARY_CHUNK_CACHE_SIZE = int(os.getenv("SUMMARY_CHUNK_CACHE_SIZE", "2048"))
+SUMMARY_CHUNK_CACHE_TTL = float(os.getenv("SUMMARY_CHUNK_CACHE_TTL", "86400"))
+
+##########################
+# CHUNKING               #
+##########################
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+# Jede wievielte Einheit (per Hash) einen Abschnitt beenden darf, siehe split_into_chunks
+BOUNDARY_DIVISOR = 3
+
+def _units(text: str, max_tokens: int, model: str):
+    """Absätze, zu lange Absätze in Sätze, zu lange Sätze in Wortgruppen zerlegt.
+
+    Liefert (Text, Trenner davor); Absätze werden mit Leerzeile, Sätze eines
+    Absatzes mit Leerzeichen wieder zusammengesetzt.
+    """
+    for paragraph in _PARAGRAPH_BREAK.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph, model) <= max_tokens:
+            yield paragraph, "\n\n"
+            continue
+        joiner = "\n\n"
+        for sentence in _SENTENCE_END.split(paragraph):
+            if count_tokens(sentence, model) <= max_tokens:
+                yield sentence, joiner
+            else:
+                words = sentence.split()
+                step = max(len(words) * max_tokens // count_tokens(sentence, model), 1)
+                for i in range(0, len(words), step):
+                    yield " ".join(words[i:i + step]), joiner if i == 0 else " "
+            joiner = " "
+
+def _is_boundary(unit: str) -> bool:
+    digest = hashlib.blake2b(unit.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "little") % BOUNDARY_DIVISOR == 0
+
+def split_into_chunks(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS, model: str = None) -> list:
+    """Zerlegt einen Text an Absatz- und Satzgrenzen in Abschnitte von höchstens max_tokens.
+
+    Wo ein Abschnitt endet, hängt (ab der halben Größe) vom Inhalt der Einheit
+    ab und nicht von ihrer Position. Wird ein Absatz geändert, verschieben sich
+    deshalb nur die Grenzen in seiner Nähe, und die übrigen Abschnitte treffen
+    weiterhin den Cache.
+    """
+    chunks, current, current_tokens = [], [], 0
+    min_tokens = max_tokens // 2
+    for unit, joiner in _units(text, max_tokens, model):
+        tokens = count_tokens(unit, model)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(unit if not current else joiner + unit)
+        current_tokens += tokens
+        if current_tokens >= min_tokens and _is_boundary(unit):
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+def chunk_prompt(chunk: str) -> str:
+    return f"""Fasse den folgenden Abschnitt eines längeren Dokuments in höchstens {SUMMARY_CHUNK_MAX_WORDS} Wörtern zusammen.
+Behalte Fakten, Namen, Zahlen und Schlussfolgerungen bei. Antworte nur mit der Zusammenfassung, ohne Einleitung.
+
+Abschnitt:
+{chunk}
+"""
+
+##########################
+# MAP-REDUCE             #
+##########################
+
+class DocumentSummarizer:
+    """Verkürzt lange Dokumente vor dem Summary-Use-Case per Map-Schritt.
+
+    Der Text wird in Abschnitte zerlegt, die parallel (höchstens
+    map_concurrency gleichzeitig) zusammengefasst werden. Die Teil-
+    zusammenfassungen werden pro Abschnitt gecacht, geschlüsselt nach Provider,
+    Modell, Temperatur und vollständigem Abschnitts-Prompt. Ihr
+    Ergebnis geht als neuer Text in den normalen Summary-Prompt, der es auf
+    die gewünschte Länge bringt (Reduce) und das gewohnte JSON liefert.
+    """
+
+    def __init__(self, threshold=SUMMARY_CHUNK_THRESHOLD, chunk_tokens=SUMMARY_CHUNK_TOKENS,
+                 map_concurrency=SUMMARY_MAP_CONCURRENCY, max_rounds=SUMMARY_MAX_ROUNDS,
+                 cache_size=SUMMARY_CHUNK_CACHE_SIZE, cache_ttl=SUMMARY_CHUNK_CACHE_TTL):
+        self.threshold = threshold
+        self.chunk_tokens = chunk_tokens
+        self.map_concurrency = map_concurrency
+        self.max_rounds = max_rounds
+        self._cache = MemoryCacheBackend(max_entries=cache_size, ttl=cache_ttl)
+        self._inflight = SingleFlight()
+        self.documents = 0
+        self.chunks = 0
+        self.chunk_calls = 0
+        self.chunk_cache_hits = 0
+
+    def needs_chunking(self, text: str, model: str = None) -> bool:
+        return count_tokens(text, model) > self.threshold
+
+    async def condense(self, llm, text: str) -> str:
+        """Liefert den Text für den Summary-Prompt: kurze Texte unverändert, lange als Teilzusammenfassungen."""
+        model = llm_identity(llm)[1]
+        if not self.needs_chunking(text, model):
+            return text
+
+        self.documents += 1
+        for round_ in range(1, self.max_rounds + 1):
+            chunks = split_into_chunks(text, self.chunk_tokens, model)
+            if len(chunks) < 2:
+                break
+            summaries = await self._map(llm, chunks)
+            text = "\n\n".join(f"Teil {i}: {summary}" for i, summary in enumerate(summaries, 1))
+            logging.info(f"Dokument in Runde {round_} auf {len(chunks)} Teilzusammenfassungen verdichtet")
+            if not self.needs_chunking(text, model):
+                break
+        return text
+
+    @staticmethod
+    def chunk_key(llm, prompt: str) -> str:
+        # Der Prompt enthält Vorlage und Wortgrenze; ein anderes Modell oder eine
+        # geänderte Vorlage ergibt damit einen neuen Schlüssel
+        payload = json.dumps([*llm_identity(llm), prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _map(self, llm, chunks: list) -> list:
+        provider, model, _ = llm_identity(llm)
+        summarize = make_summarizer(llm)
+        semaphore = asyncio.Semaphore(self.map_concurrency)
+
+        async def summarize_chunk(prompt):
+            async with semaphore:
+                summary = await provider_scheduler.submit(
+                    provider, lambda: summarize(prompt), tokens=estimate_tokens(prompt, model)
+                )
+            self.chunk_calls += 1
+            return summary.strip()
+
+        async def one(chunk):
+            self.chunks += 1
+            prompt = chunk_prompt(chunk)
+            key = self.chunk_key(llm, prompt)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self.chunk_cache_hits += 1
+                return cached
+            # Gleiche Abschnitte parallel laufender Anfragen (oder Hedges) nur einmal zusammenfassen
+            summary = await self._inflight.do(key, lambda: summarize_chunk(prompt))
+            if summary:
+                self._cache.set(key, summary)
+            return summary
+
+        return await asyncio.gather(*(one(chunk) for chunk in chunks))
+
+    def stats(self):
+        return {
+            "threshold_tokens": self.threshold,
+            "chunk_tokens": self.chunk_tokens,
+            "map_concurrency": self.map_concurrency,
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "chunk_calls": self.chunk_calls,
+            "chunk_cache_hits": self.chunk_cache_hits,
+            "chunk_cache_entries": len(self._cache),
+            "chunk_cache_hit_rate": round(self.chunk_cache_hits / self.chunks, 4) if self.chunks else 0.0,
+        }
+
+document_summarizer = DocumentSummarizer()
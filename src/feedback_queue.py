@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from opensearchpy.helpers import async_bulk
+
+from src.opensearch import FEEDBACK_INDEX, SNAPSHOT_INDEX, get_opensearch_client, opensearch_state
+from src.tracing import current_span_context, linked_span, span
+
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+FEEDBACK_FLUSH_INTERVAL = float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "1.0"))
+FEEDBACK_QUEUE_SIZE = int(os.getenv("FEEDBACK_QUEUE_SIZE", "10000"))
+FEEDBACK_ENQUEUE_TIMEOUT = float(os.getenv("FEEDBACK_ENQUEUE_TIMEOUT", "0.5"))
+FEEDBACK_MAX_RETRIES = int(os.getenv("FEEDBACK_MAX_RETRIES", "3"))
+FEEDBACK_SHUTDOWN_TIMEOUT = float(os.getenv("FEEDBACK_SHUTDOWN_TIMEOUT", "10"))
+# Hashes bereits gespeicherter Verläufe, für die kein weiterer Schreibversuch nötig ist
+FEEDBACK_KNOWN_SNAPSHOTS = int(os.getenv("FEEDBACK_KNOWN_SNAPSHOTS", "10000"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class FeedbackQueueFull(Exception):
+    pass
+
+def snapshot_id(messages: list) -> str:
+    """Inhalts-Hash eines Chat-Verlaufs; gleiche Verläufe ergeben dieselbe ID."""
+    canonical = json.dumps(messages, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class FeedbackIngestor:
+    """Sammelt Feedback-Dokumente und schreibt sie gebündelt über die _bulk-API.
+
+    Ein Batch wird geschrieben, sobald batch_size Dokumente vorliegen oder
+    flush_interval Sekunden seit dem ersten Dokument vergangen sind. Die
+    Warteschlange ist begrenzt; ist sie voll, wartet submit() höchstens
+    enqueue_timeout Sekunden und wirft dann FeedbackQueueFull. Bis der Index
+    bereit ist, bleiben die Dokumente in der Warteschlange.
+
+    Der chat_snapshot eines Dokuments wird nicht mit ihm gespeichert, sondern
+    einmal pro Inhalt im Snapshot-Index (per create unter seinem Hash); das
+    Feedback-Dokument verweist nur über snapshot_id darauf.
+    """
+
+    def __init__(self, index=FEEDBACK_INDEX, snapshot_index=SNAPSHOT_INDEX, batch_size=FEEDBACK_BATCH_SIZE,
+                 flush_interval=FEEDBACK_FLUSH_INTERVAL, max_queue=FEEDBACK_QUEUE_SIZE,
+                 enqueue_timeout=FEEDBACK_ENQUEUE_TIMEOUT, max_retries=FEEDBACK_MAX_RETRIES,
+                 known_snapshots=FEEDBACK_KNOWN_SNAPSHOTS):
+        self.index = index
+        self.snapshot_index = snapshot_index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.client = None
+        self._worker = None
+        self._known = OrderedDict()
+        # Span-Kontext der einreichenden Anfrage je Dokument, für Links am Bulk-Span
+        self._trace_contexts = {}
+        self.known_snapshots = known_snapshots
+        self.indexed = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self.batches = 0
+        self.snapshots_written = 0
+        self.snapshots_deduplicated = 0
+        self.snapshot_errors = 0
+
+    async def start(self):
+        if self.client is None:
+            self.client = get_opensearch_client()
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=FEEDBACK_SHUTDOWN_TIMEOUT):
+        # Restliche Dokumente noch schreiben, dann den Worker beenden
+        if self._worker is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"{self.queue.qsize()} Feedback-Dokumente beim Herunterfahren nicht geschrieben")
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, doc):
+        with span("feedback.enqueue", queued=self.queue.qsize()):
+            try:
+                await asyncio.wait_for(self.queue.put(doc), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise FeedbackQueueFull("Feedback-Warteschlange ist voll")
+        context = current_span_context()
+        if context is not None:
+            self._trace_contexts[doc.get("id")] = context
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        await opensearch_state.ready.wait()
+        while True:
+            batch = await self._next_batch()
+            contexts = [self._trace_contexts.pop(doc.get("id"), None) for doc in batch]
+            try:
+                with linked_span("opensearch.bulk", contexts, documents=len(batch)):
+                    await self._flush(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logging.error("Bulk-Indexierung fehlgeschlagen", extra={"documents": len(batch), "error": str(e)})
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _actions(self, docs):
+        actions, referenced = [], {}
+        for doc in docs:
+            messages = doc.get("chat_snapshot")
+            if messages:
+                key = snapshot_id(messages)
+                doc = {k: v for k, v in doc.items() if k != "chat_snapshot"}
+                doc["snapshot_id"] = key
+                if key in self._known or key in referenced:
+                    self.snapshots_deduplicated += 1
+                else:
+                    actions.append({"_op_type": "create", "_index": self.snapshot_index, "_id": key, "_source": {
+                        "created_at": doc["timestamp"],
+                        "message_count": len(messages),
+                        "messages": messages,
+                    }})
+                referenced.setdefault(key, []).append(doc["id"])
+            else:
+                doc = {k: v for k, v in doc.items() if k != "chat_snapshot"}
+            actions.append({"_index": self.index, "_id": doc["id"], "_source": doc})
+        return actions, referenced
+
+    def _remember_snapshot(self, key):
+        self._known[key] = True
+        self._known.move_to_end(key)
+        while len(self._known) > self.known_snapshots:
+            self._known.popitem(last=False)
+
+    async def _bulk(self, docs):
+        actions, referenced = self._actions(docs)
+        snapshots = {action["_id"] for action in actions if action.get("_op_type") == "create"}
+        feedback_ids = [action["_id"] for action in actions if action.get("_op_type") != "create"]
+        # Der Erfolgszähler von async_bulk mischt Feedback und Snapshots; gezählt wird
+        # deshalb aus den Fehlern pro Dokument
+        _, errors = await async_bulk(self.client, actions, raise_on_error=False, raise_on_exception=False)
+
+        feedback_errors, failed = [], set()
+        for item in errors:
+            op, info = next(iter(item.items()))
+            if op != "create":
+                feedback_errors.append(item)
+                continue
+            # 409: derselbe Verlauf liegt schon im Index
+            if info.get("status") == 409:
+                self.snapshots_deduplicated += 1
+                snapshots.discard(info.get("_id"))
+                self._remember_snapshot(info.get("_id"))
+                continue
+            failed.add(info.get("_id"))
+            status = info.get("status")
+            if status in RETRYABLE_STATUS or not isinstance(status, int):
+                # Die verweisenden Feedback-Dokumente werden erneut geschrieben
+                # (gleiche _id, also idempotent), damit ihr Snapshot mitkommt
+                for doc_id in referenced.get(info.get("_id"), []):
+                    feedback_errors.append({"index": {**info, "_id": doc_id}})
+            else:
+                self.snapshot_errors += 1
+                logging.error("Chat-Snapshot abgelehnt", extra={"snapshot_id": info.get("_id"), "error": info.get("error")})
+
+        for key in snapshots - failed:
+            self.snapshots_written += 1
+            self._remember_snapshot(key)
+
+        not_written = {next(iter(item.values())).get("_id") for item in feedback_errors}
+        indexed = sum(1 for doc_id in feedback_ids if doc_id not in not_written)
+        return indexed, feedback_errors
+
+    async def _flush(self, docs):
+        self.batches += 1
+        pending = docs
+        for attempt in range(self.max_retries + 1):
+            indexed, errors = await self._bulk(pending)
+            self.indexed += indexed
+            if not errors:
+                return
+
+            retry_ids = set()
+            for item in errors:
+                info = next(iter(item.values()))
+                status = info.get("status")
+                # Verbindungsfehler liefern keinen HTTP-Status ("N/A") und werden ebenfalls wiederholt
+                if status in RETRYABLE_STATUS or not isinstance(status, int):
+                    retry_ids.add(info.get("_id"))
+                else:
+                    self.failed += 1
+                    logging.error("Feedback-Dokument abgelehnt",
+                                  extra={"feedback_id": info.get("_id"), "error": info.get("error")})
+
+            pending = [doc for doc in pending if doc["id"] in retry_ids]
+            if not pending:
+                return
+            if attempt < self.max_retries:
+                self.retried += len(pending)
+                await asyncio.sleep(min(2 ** attempt * 0.5, 10))
+
+        self.failed += len(pending)
+        logging.error(f"{len(pending)} Feedback-Dokumente nach {self.max_retries} Wiederholungen verworfen")
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "snapshots_written": self.snapshots_written,
+            "snapshots_deduplicated": self.snapshots_deduplicated,
+            "snapshot_errors": self.snapshot_errors,
+            "known_snapshots": len(self._known),
+        }
+
+feedback_ingestor = FeedbackIngestor()
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+
+from src.cache import MemoryCacheBackend
+from src.opensearch import FEEDBACK_INDEX, get_opensearch_client, opensearch_state
+from src.singleflight import SingleFlight
+
+# Ergebnisse gelten so lange als frisch, danach wird neu aggregiert
+FEEDBACK_STATS_TTL = float(os.getenv("FEEDBACK_STATS_TTL", "60"))
+# Bis zu diesem Alter wird ein altes Ergebnis geliefert, wenn der Cluster nicht rechtzeitig antwortet
+FEEDBACK_STATS_STALE_TTL = float(os.getenv("FEEDBACK_STATS_STALE_TTL", "3600"))
+FEEDBACK_STATS_TIMEOUT = float(os.getenv("FEEDBACK_STATS_TIMEOUT", "2.0"))
+FEEDBACK_STATS_DEFAULT_WINDOW = os.getenv("FEEDBACK_STATS_DEFAULT_WINDOW", "7d")
+FEEDBACK_STATS_MAX_WINDOW_DAYS = int(os.getenv("FEEDBACK_STATS_MAX_WINDOW_DAYS", "365"))
+# Mindestanzahl Bewertungen, ab der ein Modell als best_model in Frage kommt
+FEEDBACK_STATS_MIN_VOTES = int(os.getenv("FEEDBACK_STATS_MIN_VOTES", "20"))
+FEEDBACK_STATS_MAX_BUCKETS = 200
+# Obergrenze für alle Buckets einer Aggregation; muss unter search.max_buckets des Clusters bleiben
+FEEDBACK_STATS_MAX_TOTAL_BUCKETS = int(os.getenv("FEEDBACK_STATS_MAX_TOTAL_BUCKETS", "65535"))
+FEEDBACK_STATS_PROVIDERS = 10
+FEEDBACK_STATS_MODELS = 50
+
+_DURATION = re.compile(r"^(\d+)([mhd])$")
+_UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400}
+
+class FeedbackStatsUnavailable(Exception):
+    pass
+
+def parse_duration(value: str) -> int:
+    match = _DURATION.match(value or "")
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Ungültige Zeitangabe '{value}', erwartet z.B. 30m, 24h oder 7d")
+    return int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+# Von fein nach grob; default_interval weicht auf das nächste aus, wenn die Buckets nicht reichen
+_INTERVALS = ("10m", "1h", "1d", "7d", "30d")
+
+def periods(window_seconds: int, interval: str) -> int:
+    # extended_bounds ist nicht am Intervall ausgerichtet, daher ggf. ein angeschnittener Abschnitt mehr
+    return math.ceil(window_seconds / parse_duration(interval)) + 1
+
+def total_buckets(window_seconds: int, interval: str) -> int:
+    """Höchstzahl der Buckets von build_query: jeder Zeitabschnitt und jede Gruppe trägt bis zu zwei thumbs-Buckets."""
+    trend = periods(window_seconds, interval) * 3
+    models = FEEDBACK_STATS_PROVIDERS * FEEDBACK_STATS_MODELS * (3 + trend)
+    return 2 + trend + FEEDBACK_STATS_PROVIDERS * 3 + models
+
+def fits(window_seconds: int, interval: str) -> bool:
+    return (periods(window_seconds, interval) <= FEEDBACK_STATS_MAX_BUCKETS
+            and total_buckets(window_seconds, interval) <= FEEDBACK_STATS_MAX_TOTAL_BUCKETS)
+
+def default_interval(window_seconds: int) -> str:
+    if window_seconds <= 6 * 3600:
+        start = 0
+    elif window_seconds <= 3 * 86400:
+        start = 1
+    else:
+        start = 2
+    for interval in _INTERVALS[start:]:
+        if fits(window_seconds, interval):
+            return interval
+    return _INTERVALS[-1]
+
+def wilson_lower_bound(up: int, total: int, z: float = 1.96) -> float:
+    """Untere Grenze des 95%-Konfidenzintervalls; bevorzugt keine Modelle mit wenigen Stimmen."""
+    if total == 0:
+        return 0.0
+    p = up / total
+    centre = p + z * z / (2 * total)
+    margin = z * math.sqrt((p * (1 - p) + z * z / (4 * total)) / total)
+    return (centre - margin) / (1 + z * z / total)
+
+##########################
+# AGGREGATION            #
+##########################
+
+def _thumbs_aggs():
+    return {"thumbs": {"terms": {"field": "thumbs", "size": 2}}}
+
+def build_query(window: str, interval: str) -> dict:
+    trend = {"date_histogram": {"field": "timestamp", "fixed_interval": interval, "min_doc_count": 0,
+                                "extended_bounds": {"min": f"now-{window}", "max": "now"}},
+             "aggs": _thumbs_aggs()}
+    return {
+        "size": 0,
+        "track_total_hits": True,
+        "query": {"range": {"timestamp": {"gte": f"now-{window}"}}},
+        "aggs": {
+            **_thumbs_aggs(),
+            "trend": trend,
+            "providers": {
+                "terms": {"field": "provider", "size": FEEDBACK_STATS_PROVIDERS},
+                "aggs": {
+                    **_thumbs_aggs(),
+                    "models": {
+                        "terms": {"field": "model", "size": FEEDBACK_STATS_MODELS},
+                        "aggs": {**_thumbs_aggs(), "trend": trend},
+                    },
+                },
+            },
+        },
+    }
+
+def _rates(bucket: dict) -> dict:
+    counts = {b["key"]: b["doc_count"] for b in bucket["thumbs"]["buckets"]}
+    up, down = counts.get("up", 0), counts.get("down", 0)
+    total = up + down
+    return {
+        "total": total,
+        "up": up,
+        "down": down,
+        "satisfaction": round(up / total, 4) if total else None,
+        "satisfaction_lower": round(wilson_lower_bound(up, total), 4),
+    }
+
+def _trend(agg: dict) -> list:
+    return [{"bucket": b["key_as_string"], **_rates(b)} for b in agg["buckets"]]
+
+def summarize(response: dict, window: str, interval: str) -> dict:
+    aggs = response["aggregations"]
+    providers = []
+    for provider in aggs["providers"]["buckets"]:
+        models = [
+            {"model": model["key"], **_rates(model), "trend": _trend(model["trend"])}
+            for model in provider["models"]["buckets"]
+        ]
+        candidates = [m for m in models if m["total"] >= FEEDBACK_STATS_MIN_VOTES]
+        best = max(candidates, key=lambda m: m["satisfaction_lower"], default=None)
+        providers.append({
+            "provider": provider["key"], **_rates(provider),
+            "best_model": best["model"] if best else None,
+            "models": models,
+        })
+    return {
+        "window": window,
+        "interval": interval,
+        **_rates(aggs),
+        "trend": _trend(aggs["trend"]),
+        "providers": providers,
+    }
+
+##########################
+# CACHE                  #
+##########################
+
+class FeedbackStats:
+    """Zufriedenheit pro Provider, Modell und Zeitabschnitt aus OpenSearch-Aggregationen.
+
+    Ergebnisse werden pro (window, interval) für ttl Sekunden gecacht;
+    gleichzeitige Abfragen teilen sich eine Aggregation. Antwortet der
+    Cluster nicht innerhalb von timeout Sekunden oder mit einem Fehler, wird
+    ein älteres Ergebnis (bis stale_ttl) mit "stale": true geliefert; die
+    begonnene Aggregation läuft weiter und füllt den Cache für den nächsten
+    Aufruf.
+    """
+
+    def __init__(self, index=FEEDBACK_INDEX, ttl=FEEDBACK_STATS_TTL, stale_ttl=FEEDBACK_STATS_STALE_TTL,
+                 timeout=FEEDBACK_STATS_TIMEOUT):
+        self.index = index
+        self.ttl = ttl
+        self.timeout = timeout
+        self._cache = MemoryCacheBackend(max_entries=64, ttl=stale_ttl)
+        self._inflight = SingleFlight()
+        self.hits = 0
+        self.refreshes = 0
+        self.stale_served = 0
+        self.errors = 0
+
+    def _key(self, window, interval):
+        return f"{window}|{interval}"
+
+    async def get(self, window: str = None, interval: str = None) -> dict:
+        window = window or FEEDBACK_STATS_DEFAULT_WINDOW
+        window_seconds = parse_duration(window)
+        if window_seconds > FEEDBACK_STATS_MAX_WINDOW_DAYS * 86400:
+            raise ValueError(f"Zeitfenster höchstens {FEEDBACK_STATS_MAX_WINDOW_DAYS}d")
+        interval = interval or default_interval(window_seconds)
+        if periods(window_seconds, interval) > FEEDBACK_STATS_MAX_BUCKETS:
+            raise ValueError(f"Höchstens {FEEDBACK_STATS_MAX_BUCKETS} Zeitabschnitte pro Abfrage")
+        if total_buckets(window_seconds, interval) > FEEDBACK_STATS_MAX_TOTAL_BUCKETS:
+            raise ValueError(f"Intervall {interval} ist für {window} zu fein (Trend pro Modell), "
+                             f"gröberes Intervall wählen, z.B. {default_interval(window_seconds)}")
+
+        key = self._key(window, interval)
+        cached = self._cache.get(key)
+        if cached is not None and time.time() - cached[0] < self.ttl:
+            self.hits += 1
+            return self._response(cached, stale=False)
+
+        try:
+            computed = await asyncio.wait_for(self._inflight.do(key, lambda: self._refresh(key, window, interval)),
+                                              timeout=self.timeout)
+            return self._response(computed, stale=False)
+        except Exception as e:
+            self.errors += 1
+            logging.warning("Feedback-Statistik nicht aktualisiert",
+                            extra={"window": window, "interval": interval, "error": repr(e)})
+            if cached is None:
+                raise FeedbackStatsUnavailable("Feedback-Statistik ist gerade nicht verfügbar") from e
+            self.stale_served += 1
+            return self._response(cached, stale=True)
+
+    async def _refresh(self, key, window, interval):
+        if not opensearch_state.ready.is_set():
+            raise FeedbackStatsUnavailable("OpenSearch ist nicht bereit")
+        self.refreshes += 1
+        response = await get_opensearch_client().search(index=self.index, body=build_query(window, interval),
+                                                        request_timeout=30)
+        computed = (time.time(), summarize(response, window, interval))
+        self._cache.set(key, computed)
+        return computed
+
+    def _response(self, cached, stale):
+        computed_at, result = cached
+        return {**result, "computed_at": computed_at, "age_s": round(time.time() - computed_at, 1), "stale": stale}
+
+    def stats(self):
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "stale_served": self.stale_served,
+            "errors": self.errors,
+        }
+
+feedback_stats = FeedbackStats()
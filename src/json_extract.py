@@ -0,0 +1,190 @@
+import json
+
+OPENERS = {"{": "}", "[": "]"}
+CLOSERS = {"}", "]"}
+
+REASONING_END = "</think>"
+
+##########################
+# SCANNER                #
+##########################
+
+class _Scanner:
+    """Ein Durchlauf über den Text, der balancierte {...}/[...]-Bereiche findet.
+
+    Strings (inkl. Escapes) werden nur innerhalb von Klammern beachtet, damit
+    Anführungszeichen im Fließtext davor nichts verschlucken. Nicht passende
+    schließende Klammern werden ignoriert. `spans` enthält nach jedem feed()
+    nur die äußersten abgeschlossenen Bereiche; innere werden beim Schließen
+    des umgebenden Bereichs verworfen. feed() bekommt jeweils nur den neuen
+    Text; die Positionen zählen ab `pos`, das beim Anlegen gesetzt werden kann.
+    """
+
+    def __init__(self, pos: int = 0):
+        self.stack = []
+        self.spans = []
+        self.in_string = False
+        self.escape = False
+        self.pos = pos
+
+    def feed(self, text: str):
+        stack = self.stack
+        spans = self.spans
+        in_string = self.in_string
+        escape = self.escape
+
+        for i, ch in enumerate(text, self.pos):
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+                continue
+
+            if ch in OPENERS:
+                stack.append((OPENERS[ch], i))
+            elif not stack:
+                continue
+            elif ch == '"':
+                in_string = True
+            elif ch in CLOSERS and ch == stack[-1][0]:
+                _, start = stack.pop()
+                # Bereits gefundene Bereiche innerhalb des neuen fallen weg
+                while spans and spans[-1][0] > start:
+                    spans.pop()
+                spans.append((start, i + 1))
+
+        self.in_string = in_string
+        self.escape = escape
+        self.pos += len(text)
+
+##########################
+# EXTRACTION             #
+##########################
+
+def _strip_reasoning(text: str) -> str:
+    # Reasoning-Modelle (z.B. deepseek-r1) schreiben ihr Nachdenken vor die Antwort
+    end = text.rfind(REASONING_END)
+    return text[end + len(REASONING_END):] if end != -1 else text
+
+def find_json(text: str):
+    """Gibt den ersten parsebaren JSON-Wert im Text zurück.
+
+    Code-Fences, Reasoning-Präambeln, einleitender und nachfolgender Text
+    werden übersprungen. Wirft ValueError, wenn kein JSON gefunden wird.
+    """
+    if not isinstance(text, str):
+        raise ValueError("Kein Text")
+    text = _strip_reasoning(text)
+
+    scanner = _Scanner()
+    scanner.feed(text)
+    for start, end in scanner.spans:
+        try:
+            return json.loads(text[start:end])
+        except json.JSONDecodeError:
+            continue
+
+    # Ohne balancierte Klammern kann der Text selbst noch gültiges JSON sein (z.B. "\"...\"")
+    try:
+        return json.loads(text.strip())
+    except json.JSONDecodeError:
+        raise ValueError("Kein gültiges JSON gefunden")
+
+def extract_json(text: str) -> str:
+    """Liefert den JSON-Teil des Textes als String, sonst den bereinigten Text."""
+    if not isinstance(text, str):
+        return text
+    stripped = _strip_reasoning(text)
+    scanner = _Scanner()
+    scanner.feed(stripped)
+    for start, end in scanner.spans:
+        candidate = stripped[start:end]
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    return stripped.strip()
+
+##########################
+# INCREMENTAL MODE       #
+##########################
+
+class IncrementalJSONExtractor:
+    """Findet den JSON-Wert in einer gestreamten Antwort, sobald er vollständig ist.
+
+    feed() nimmt jeweils den nächsten Chunk und gibt den geparsten Wert zurück,
+    sobald ein äußerer Bereich geschlossen wurde und sich parsen lässt, sonst
+    None. Jeder Chunk wird nur einmal gescannt; die Chunks werden erst
+    zusammengesetzt, wenn ein Bereich geparst oder `text` gelesen wird. Endet der
+    Stream ohne Treffer, parst der Aufrufer `text` (z.B. mit find_json).
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._length = 0
+        self._joined = ""
+        # Letzte Zeichen des bisherigen Texts, damit über Chunk-Grenzen geteilte Tags gefunden werden
+        self._tail = ""
+        self._scanner = _Scanner()
+        self._checked = 0
+        # Solange ein <think>-Block offen ist, zählen gefundene Klammern nicht
+        self._reasoning_open = False
+        self.value = None
+        self.done = False
+
+    @property
+    def text(self) -> str:
+        if len(self._joined) != self._length:
+            self._joined = "".join(self._chunks)
+            self._chunks = [self._joined]
+        return self._joined
+
+    def _track_reasoning(self, chunk: str) -> bool:
+        """Gibt True zurück, wenn der Reasoning-Block mit diesem Chunk endet."""
+        window = self._tail + chunk
+        window_start = self._length - len(window)
+        self._tail = window[-len(REASONING_END):]
+        opened = window.find("<think>") if not self._reasoning_open else -1
+        if opened != -1:
+            self._reasoning_open = True
+        if not self._reasoning_open:
+            return False
+        end = window.find(REASONING_END, max(opened, 0))
+        if end == -1:
+            return False
+        # Ab dem Ende des Reasoning-Blocks neu scannen; Klammern davor zählen nicht
+        self._reasoning_open = False
+        self._scanner = _Scanner(window_start + end + len(REASONING_END))
+        self._checked = 0
+        return True
+
+    def feed(self, chunk: str):
+        if self.done:
+            return self.value
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        if self._track_reasoning(chunk):
+            self._scanner.feed(self.text[self._scanner.pos:])
+        elif self._reasoning_open:
+            return None
+        else:
+            self._scanner.feed(chunk)
+
+        # Nur prüfen, wenn keine Klammer mehr offen ist; dann sind alle Bereiche endgültig
+        if self._scanner.stack:
+            return None
+        spans = self._scanner.spans
+        while self._checked < len(spans):
+            start, end = spans[self._checked]
+            self._checked += 1
+            try:
+                self.value = json.loads(self.text[start:end])
+                self.done = True
+                return self.value
+            except json.JSONDecodeError:
+                continue
+        return None
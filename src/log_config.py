@@ -0,0 +1,204 @@
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import traceback
+from datetime import datetime, timezone
+
+from src.tracing import current_request_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json | text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_MESSAGE_LENGTH = int(os.getenv("LOG_MAX_MESSAGE_LENGTH", "2000"))
+LOG_MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "300"))
+# Nutzerinhalte (Anfragen, Verläufe, Feedback-Texte) nur als Länge und Hash loggen
+LOG_REDACT = os.getenv("LOG_REDACT", "true").lower() != "false"
+# Anteil der INFO-Einträge pro Logger, z.B. "paiya.requests=0.1"; WARNING und höher immer
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "paiya.requests=0.1")
+
+# Felder in extra={...}, die Nutzerinhalte enthalten; "error" trägt Exception-Texte, die Eingaben
+# oder Modellausgaben zitieren können. Nachrichten selbst bleiben deshalb konstant.
+REDACTED_FIELDS = {"query", "messages", "chat_snapshot", "feedback_text", "prompt", "content", "raw", "error"}
+
+# Logger für häufige Ereignisse pro Anfrage; wird per LOG_SAMPLE_RATES ausgedünnt
+request_log = logging.getLogger("paiya.requests")
+
+_STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+def _parse_rates(raw):
+    rates = {}
+    for part in raw.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… [+{len(text) - limit} Zeichen]"
+
+def redact(value) -> str:
+    raw = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+    return f"[redacted len={len(raw)} sha256={digest}]"
+
+def format_exception(exc_info) -> str:
+    """Traceback mit geschwärzter Exception-Meldung; die Stack-Frames bleiben lesbar."""
+    if not LOG_REDACT:
+        return "".join(traceback.format_exception(*exc_info)).rstrip()
+    exc_type, exc, tb = exc_info
+    frames = "".join(traceback.format_tb(tb))
+    return f"Traceback (most recent call last):\n{frames}{exc_type.__name__}: {redact(str(exc))}"
+
+def _field(key, value):
+    if LOG_REDACT and key in REDACTED_FIELDS:
+        return redact(value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return _truncate(text, LOG_MAX_FIELD_LENGTH)
+
+##########################
+# FILTER & FORMATTER     #
+##########################
+
+class SamplingFilter(logging.Filter):
+    """Lässt von Loggern mit Sampling-Rate nur den entsprechenden Anteil der Einträge unter WARNING durch."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(record.name)
+        if rate is None or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+class RequestIdFilter(logging.Filter):
+    # Läuft im aufrufenden Task, wo der ContextVar der Anfrage noch gesetzt ist
+    def filter(self, record):
+        record.request_id = current_request_id()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Eine JSON-Zeile pro Eintrag; Felder aus extra={...} werden gekürzt bzw. geschwärzt übernommen."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _truncate(record.getMessage(), LOG_MAX_MESSAGE_LENGTH),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES:
+                entry[key] = _field(key, value)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        record.message = _truncate(record.getMessage(), LOG_MAX_MESSAGE_LENGTH)
+        extras = " ".join(f"{k}={_field(k, v)}" for k, v in vars(record).items() if k not in _STANDARD_ATTRIBUTES)
+        line = f"{self.formatTime(record)} {record.levelname} {record.name}: {record.message}"
+        if getattr(record, "request_id", None):
+            line += f" request_id={record.request_id}"
+        if extras:
+            line += f" {extras}"
+        return f"{line}\n{record.exc_text}" if record.exc_text else line
+
+##########################
+# QUEUE                  #
+##########################
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, der Nachrichten erst im Listener-Thread formatiert und bei voller Queue verwirft.
+
+    Die Standard-Implementierung formatiert in prepare() bereits im
+    aufrufenden Thread; hier wird nur ein Traceback sofort in Text
+    umgewandelt (mit geschwärzter Meldung, siehe format_exception), weil er
+    sich auf den aktuellen Stack bezieht. Argumente
+    für %-Platzhalter sollten deshalb nach dem Aufruf nicht mehr verändert
+    werden.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = format_exception(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener = None
+_handler = None
+_sampling = None
+_lock = threading.Lock()
+
+def setup_logging():
+    """Richtet das gemeinsame Logging ein (idempotent); ersetzt logging.basicConfig."""
+    global _listener, _handler, _sampling
+    with _lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+        _sampling = SamplingFilter(_parse_rates(LOG_SAMPLE_RATES))
+        _handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _handler.addFilter(_sampling)
+        _handler.addFilter(RequestIdFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(_handler)
+        root.setLevel(LOG_LEVEL)
+
+        _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+def stop_logging():
+    # Schreibt die Queue leer; danach landen Einträge wieder direkt über lastResort auf stderr
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            logging.getLogger().removeHandler(_handler)
+            _listener = None
+
+def logging_stats():
+    if _handler is None:
+        return {}
+    return {
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "sampled_out": _sampling.sampled_out,
+        "sample_rates": _sampling.rates,
+    }
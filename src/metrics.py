@@ -0,0 +1,261 @@
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.tracing import span
+from src.validators import validate_response
+
+KNOWN_USE_CASES = {"FreePrompt", "Summary", "Quiz", "FunFact"}
+KNOWN_PROVIDERS = {"openai", "groq", "google", "mistral"}
+# Provider und Modell kommen vom Client; nur bekannte Werte werden zu eigenen Zeitreihen,
+# alles andere läuft unter "other". Weitere Modelle per METRICS_EXTRA_MODELS (kommasepariert).
+KNOWN_MODELS = {
+    "gpt-4o", "gpt-3.5-turbo",
+    "gemma2-9b-it", "compound-beta-mini", "qwen-qwq-32b", "deepseek-r1-distill-llama-70b",
+    "llama-3.3-70b-versatile", "allam-2-7b", "llama-3.1-8b-instant", "llama-guard-3-8b",
+    "llama3-70b-8192", "llama3-8b-8192", "meta-llama/llama-4-maverick-17b-128e-instruct",
+    "meta-llama/llama-4-scout-17b-16e-instruct", "mistral-saba-24b",
+    "gemini-2.0-flash", "gemini-1.5-flash", "gemini-1.5-pro",
+    "mistral-large-latest", "mistral-small-latest", "pixtral-12b-2409", "open-mistral-nemo",
+    "open-codestral-mamba",
+} | {m.strip() for m in os.getenv("METRICS_EXTRA_MODELS", "").split(",") if m.strip()}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+UPSTREAM_LATENCY = Histogram(
+    "llm_upstream_seconds", "Dauer des Provider-Aufrufs",
+    ["use_case", "provider", "model"], buckets=LATENCY_BUCKETS,
+)
+PARSE_LATENCY = Histogram(
+    "llm_parse_seconds", "Dauer von JSON-Bereinigung und json.loads",
+    ["use_case", "provider", "model"], buckets=FAST_BUCKETS,
+)
+PREPARE_LATENCY = Histogram(
+    "llm_prepare_seconds", "Vorbereitung bis zum Provider-Aufruf: Registry-Lookup und Prompt",
+    ["use_case", "provider", "model"], buckets=FAST_BUCKETS,
+)
+VALIDATION_LATENCY = Histogram(
+    "llm_validation_seconds", "Dauer von validate_response",
+    ["use_case", "provider", "model"], buckets=FAST_BUCKETS,
+)
+TTFT = Histogram(
+    "llm_time_to_first_token_seconds", "Zeit bis zum ersten gestreamten Token",
+    ["use_case", "provider", "model"], buckets=LATENCY_BUCKETS,
+)
+TOKENS = Counter(
+    "llm_tokens_total", "Vom Provider gemeldete Tokens",
+    ["provider", "model", "kind"],
+)
+IN_FLIGHT = Gauge(
+    "llm_requests_in_flight", "Laufende Anfragen pro Use Case und Provider",
+    ["use_case", "provider"],
+)
+JSON_FAILURES = Counter(
+    "llm_json_parse_failures_total", "Antworten, die nicht als JSON gelesen werden konnten",
+    ["use_case", "provider", "model"],
+)
+JSON_RESULTS = Counter(
+    "llm_json_responses_total", "JSON-Antworten nach Modus (native: vom Provider erzwungen, prompt: nur per Prompt)",
+    ["use_case", "provider", "model", "mode", "result"],
+)
+VALIDATION_REJECTIONS = Counter(
+    "llm_validation_rejections_total", "Von validate_response abgelehnte Antworten",
+    ["use_case", "provider", "model"],
+)
+HEDGES = Counter(
+    "llm_router_hedges_total", "Parallel gestartete Hedge-Requests",
+    ["provider", "model"],
+)
+FAILOVERS = Counter(
+    "llm_router_failovers_total", "Wechsel zu einem Fallback nach Fehler oder offenem Circuit",
+    ["provider", "model"],
+)
+CIRCUIT_STATE = Gauge(
+    "llm_circuit_open", "1, wenn der Circuit Breaker offen oder halb offen ist",
+    ["provider", "model"],
+)
+QUEUE_DEPTH = Gauge(
+    "llm_scheduler_queue_depth", "Auf einen freien Provider-Platz wartende Aufrufe",
+    ["provider"],
+)
+QUEUE_WAIT = Histogram(
+    "llm_scheduler_wait_seconds", "Wartezeit bis zur Zulassung beim Provider",
+    ["provider"], buckets=LATENCY_BUCKETS,
+)
+SHED = Counter(
+    "llm_scheduler_shed_total", "Wegen Überlast abgewiesene Aufrufe",
+    ["provider", "reason"],
+)
+UPSTREAM_RETRIES = Counter(
+    "llm_upstream_retries_total", "Wiederholte Aufrufe nach 429/503 des Providers",
+    ["provider", "status"],
+)
+QUIZ_POOL_REQUESTS = Counter(
+    "llm_quiz_pool_requests_total", "Quiz-Anfragen, die aus dem Vorrat bedient wurden (hit) oder nicht (miss)",
+    ["result"],
+)
+QUIZ_POOL_SIZE = Gauge(
+    "llm_quiz_pool_questions", "Vorab generierte Quizfragen im Vorrat",
+)
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "llm_semantic_cache_lookups_total", "Suchen im semantischen Cache",
+    ["use_case", "result"],
+)
+SEMANTIC_CACHE_LATENCY = Histogram(
+    "llm_semantic_cache_seconds", "Dauer von Embedding und Vektorsuche im semantischen Cache",
+    ["stage"], buckets=FAST_BUCKETS + LATENCY_BUCKETS[2:],
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Verspätung des Event-Loops gegenüber einem festen Sleep-Intervall",
+    buckets=FAST_BUCKETS + LATENCY_BUCKETS[2:],
+)
+
+##########################
+# REQUEST LABELS         #
+##########################
+
+# Wird pro Request gesetzt, damit tiefer liegende Aufrufe (chains.py) ohne
+# zusätzliche Parameter mit use_case/provider/model gelabelt werden können.
+_request_labels = ContextVar("llm_request_labels", default=None)
+
+def _use_case_label(use_case):
+    return use_case if use_case in KNOWN_USE_CASES else "other"
+
+def _provider_label(provider):
+    if not provider:
+        return "unknown"
+    return provider if provider in KNOWN_PROVIDERS else "other"
+
+def _model_label(model):
+    if not model:
+        return "unknown"
+    return model if model in KNOWN_MODELS else "other"
+
+def set_request_labels(use_case, provider, model):
+    _request_labels.set({
+        "use_case": _use_case_label(use_case),
+        "provider": _provider_label(provider),
+        "model": _model_label(model),
+    })
+
+def current_labels():
+    return _request_labels.get() or {"use_case": "other", "provider": "unknown", "model": "unknown"}
+
+@contextmanager
+def track_in_flight(use_case, provider):
+    gauge = IN_FLIGHT.labels(use_case=_use_case_label(use_case), provider=_provider_label(provider))
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+# Die observe_*-Helfer öffnen zusätzlich einen Span, damit die Stufen im Trace auftauchen
+
+@contextmanager
+def observe_upstream():
+    labels = current_labels()
+    with span("llm.upstream", provider=labels["provider"], model=labels["model"]), \
+            UPSTREAM_LATENCY.labels(**labels).time():
+        yield
+
+@contextmanager
+def observe_prepare():
+    with span("llm.prepare"), PREPARE_LATENCY.labels(**current_labels()).time():
+        yield
+
+@contextmanager
+def observe_parse():
+    with span("llm.parse_json"), PARSE_LATENCY.labels(**current_labels()).time():
+        yield
+
+def record_json_result(mode, ok):
+    labels = current_labels()
+    JSON_RESULTS.labels(**labels, mode=mode, result="ok" if ok else "failure").inc()
+    if not ok:
+        JSON_FAILURES.labels(**labels).inc()
+
+def record_ttft(seconds):
+    TTFT.labels(**current_labels()).observe(seconds)
+
+def record_tokens(provider, model, prompt_tokens=None, completion_tokens=None):
+    provider, model = _provider_label(provider), _model_label(model)
+    if prompt_tokens:
+        TOKENS.labels(provider=provider, model=model, kind="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        TOKENS.labels(provider=provider, model=model, kind="completion").inc(completion_tokens)
+
+def record_hedge(provider, model):
+    HEDGES.labels(provider=_provider_label(provider), model=_model_label(model)).inc()
+
+def record_failover(provider, model):
+    FAILOVERS.labels(provider=_provider_label(provider), model=_model_label(model)).inc()
+
+def set_circuit_state(provider, model, state):
+    CIRCUIT_STATE.labels(provider=_provider_label(provider), model=_model_label(model)).set(0 if state == "closed" else 1)
+
+def set_queue_depth(provider, depth):
+    QUEUE_DEPTH.labels(provider=provider).set(depth)
+
+def observe_queue_wait(provider, seconds):
+    QUEUE_WAIT.labels(provider=provider).observe(seconds)
+
+def record_shed(provider, reason):
+    SHED.labels(provider=provider, reason=reason).inc()
+
+def record_upstream_retry(provider, status):
+    UPSTREAM_RETRIES.labels(provider=provider, status=str(status)).inc()
+
+def record_quiz_pool(result):
+    QUIZ_POOL_REQUESTS.labels(result=result).inc()
+
+def set_quiz_pool_size(size):
+    QUIZ_POOL_SIZE.set(size)
+
+def record_semantic_lookup(use_case, result):
+    SEMANTIC_CACHE_LOOKUPS.labels(use_case=_use_case_label(use_case), result=result).inc()
+
+@contextmanager
+def observe_semantic_stage(stage):
+    with SEMANTIC_CACHE_LATENCY.labels(stage=stage).time():
+        yield
+
+async def monitor_event_loop_lag(interval):
+    # Läuft als Hintergrund-Task; alles, was den Loop blockiert, verlängert den Sleep
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(time.perf_counter() - started - interval, 0.0))
+
+def observe_validation(route_type, data):
+    labels = current_labels()
+    started = time.perf_counter()
+    with span("validate_response", use_case=route_type):
+        valid, msg = validate_response(route_type, data)
+    VALIDATION_LATENCY.labels(**labels).observe(time.perf_counter() - started)
+    if not valid:
+        VALIDATION_REJECTIONS.labels(**labels).inc()
+    return valid, msg
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Zählt die Token-Angaben von ChatOpenAI, auch wenn eine Chain die AIMessage verschluckt."""
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None)
+                if not usage:
+                    continue
+                model = current_labels()["model"]
+                if model == "unknown":
+                    model = (message.response_metadata or {}).get("model_name", model)
+                record_tokens("openai", model, usage.get("input_tokens"), usage.get("output_tokens"))
+
+token_usage_callback = TokenUsageCallback()
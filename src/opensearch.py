@@ -1,55 +1,283 @@
+import asyncio
+import logging
 import os
+import random
 import time
-from opensearchpy import OpenSearch
-from opensearchpy.exceptions import ConnectionError
+
+from opensearchpy import AsyncOpenSearch
+from opensearchpy.exceptions import ConflictError, ConnectionError, NotFoundError, TransportError
 
 host = os.getenv("OPENSEARCH_HOST", "opensearch")
 port = int(os.getenv("OPENSEARCH_PORT", "9200"))
+pool_maxsize = int(os.getenv("OPENSEARCH_POOL_MAXSIZE", "25"))
+request_timeout = int(os.getenv("OPENSEARCH_TIMEOUT", "10"))
+
+# Schreib-Alias; die Indizes dahinter entstehen aus dem Template und rollen per ISM über
+FEEDBACK_INDEX = "chat-feedback"
+FEEDBACK_TEMPLATE_VERSION = 2
+FEEDBACK_INDEX_PATTERN = f"{FEEDBACK_INDEX}-v{FEEDBACK_TEMPLATE_VERSION}-*"
+FEEDBACK_FIRST_INDEX = f"{FEEDBACK_INDEX}-v{FEEDBACK_TEMPLATE_VERSION}-000001"
+FEEDBACK_POLICY = "chat-feedback-retention"
+FEEDBACK_ROLLOVER_AGE = os.getenv("FEEDBACK_ROLLOVER_AGE", "30d")
+FEEDBACK_ROLLOVER_SIZE = os.getenv("FEEDBACK_ROLLOVER_SIZE", "5gb")
+# Wie lange ein Index nach dem Rollover noch aufbewahrt wird
+FEEDBACK_RETENTION = os.getenv("FEEDBACK_RETENTION", "365d")
+
+# Chat-Verläufe, adressiert über ihren Hash, damit gleiche Verläufe nur einmal gespeichert werden
+SNAPSHOT_INDEX = "chat-snapshots"
+
+INDEX_SETTINGS = {
+    "number_of_shards": 1,
+    "number_of_replicas": 0,
+    # Feedback wird nicht sofort gesucht; seltener refreshen spart Segmente und Merges
+    "refresh_interval": "5s",
+    "codec": "best_compression"
+}
+
+FEEDBACK_MAPPING = {
+    "dynamic": "strict",
+    "properties": {
+        "timestamp": {"type": "date"},
+        "thumbs": {"type": "keyword"},
+        "model": {"type": "keyword"},
+        "provider": {"type": "keyword"},
+        "message_index": {"type": "integer"},
+        "feedback_text": {"type": "text"},
+        "session_id": {"type": "keyword"},
+        "snapshot_id": {"type": "keyword"},
+        # Nur noch in migrierten Altdokumenten; abgelegt, aber nicht indexiert
+        "chat_snapshot": {"type": "object", "enabled": False},
+        "id": {"type": "keyword"}
+    }
+}
+
+FEEDBACK_TEMPLATE = {
+    "index_patterns": [FEEDBACK_INDEX_PATTERN],
+    "version": FEEDBACK_TEMPLATE_VERSION,
+    "priority": 100,
+    "template": {
+        "settings": {
+            "index": INDEX_SETTINGS,
+            "plugins.index_state_management.rollover_alias": FEEDBACK_INDEX
+        },
+        "mappings": FEEDBACK_MAPPING
+    }
+}
+
+FEEDBACK_ISM_POLICY = {
+    "policy": {
+        "description": f"chat-feedback v{FEEDBACK_TEMPLATE_VERSION}: Rollover nach {FEEDBACK_ROLLOVER_AGE} "
+                       f"oder {FEEDBACK_ROLLOVER_SIZE}, Löschen {FEEDBACK_RETENTION} nach dem Rollover",
+        "default_state": "hot",
+        "states": [
+            {
+                "name": "hot",
+                "actions": [{"rollover": {"min_index_age": FEEDBACK_ROLLOVER_AGE,
+                                          "min_primary_shard_size": FEEDBACK_ROLLOVER_SIZE}}],
+                "transitions": [{"state_name": "delete", "conditions": {"min_rollover_age": FEEDBACK_RETENTION}}]
+            },
+            {
+                "name": "delete",
+                "actions": [{"delete": {}}],
+                "transitions": []
+            }
+        ],
+        "ism_template": [{"index_patterns": [FEEDBACK_INDEX_PATTERN], "priority": 100}]
+    }
+}
+
+SNAPSHOT_MAPPING = {
+    "settings": {"index": INDEX_SETTINGS},
+    "mappings": {
+        "dynamic": "strict",
+        "properties": {
+            "created_at": {"type": "date"},
+            "message_count": {"type": "integer"},
+            "messages": {"type": "object", "enabled": False}
+        }
+    }
+}
+
+_client = None
 
 def get_opensearch_client():
-    client = OpenSearch(
-        hosts=[{"host": host, "port": port}],
-        http_compress=True,
-        use_ssl=False,
-        verify_certs=False,
-    )
-    return client
-
-def create_feedback_index_if_not_exists(max_retries=5, retry_delay=5):
+    # Ein gemeinsamer Client pro Prozess; aiohttp hält bis zu pool_maxsize Verbindungen offen
+    global _client
+    if _client is None:
+        _client = AsyncOpenSearch(
+            hosts=[{"host": host, "port": port}],
+            http_compress=True,
+            use_ssl=False,
+            verify_certs=False,
+            maxsize=pool_maxsize,
+            timeout=request_timeout,
+        )
+    return _client
+
+async def close_opensearch_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+class OpenSearchState:
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.status = "starting"
+        self.attempts = 0
+        self.last_error = None
+        self.ready_since = None
+
+    def mark_ready(self):
+        self.status = "ready"
+        self.last_error = None
+        self.ready_since = time.time()
+        self.ready.set()
+
+    def as_dict(self):
+        return {
+            "status": self.status,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "ready_since": self.ready_since,
+        }
+
+opensearch_state = OpenSearchState()
+
+async def create_feedback_index_if_not_exists(max_retries=None, base_delay=1.0, max_delay=30.0, extra_indices=None):
+    """Legt Template, ISM-Policy und Indizes für Feedback an; läuft als Hintergrund-Task beim Start.
+
+    extra_indices bildet Indexnamen auf ihr Mapping ab, z.B. den Session-Index
+    aus src/sessions.py. Bei Verbindungsfehlern wird mit exponentiellem
+    Backoff (plus Jitter) erneut versucht, ohne max_retries unbegrenzt.
+    """
     client = get_opensearch_client()
-    index_name = "chat-feedback"
+    indices = {SNAPSHOT_INDEX: SNAPSHOT_MAPPING, **(extra_indices or {})}
+    attempt = 0
+
+    while max_retries is None or attempt < max_retries:
+        attempt += 1
+        opensearch_state.attempts = attempt
+        try:
+            await _ensure_feedback_index(client)
+            for index, mapping in indices.items():
+                await _create_index_if_not_exists(client, index, mapping)
+            opensearch_state.mark_ready()
+            return True
+        except (ConnectionError, TransportError) as e:
+            opensearch_state.status = "unavailable"
+            opensearch_state.last_error = str(e)
+            delay = min(base_delay * 2 ** (attempt - 1), max_delay) * random.uniform(0.5, 1.0)
+            logging.warning("Verbindungsfehler", extra={"attempt": attempt, "retry_in_s": round(delay, 1), "error": str(e)})
+            await asyncio.sleep(delay)
+
+    logging.error("Maximale Versuche erreicht. Kann keine Verbindung zu OpenSearch herstellen.")
+    return False
 
-    for attempt in range(max_retries):
+async def _create_index_if_not_exists(client, index, body):
+    try:
+        if not await client.indices.exists(index=index):
+            logging.info(f"Index '{index}' wird erstellt...")
+            await client.indices.create(index=index, body=body)
+            logging.info(f"Index '{index}' wurde erfolgreich erstellt.")
+        else:
+            logging.info(f"Index '{index}' existiert bereits.")
+    except TransportError as e:
+        # resource_already_exists: ein anderer Worker war schneller
+        if e.error != "resource_already_exists_exception":
+            raise
+
+async def _put_feedback_template(client):
+    await client.indices.put_index_template(name=FEEDBACK_INDEX, body=FEEDBACK_TEMPLATE)
+    try:
+        current = await client.plugins.index_management.get_policy(policy=FEEDBACK_POLICY)
+    except NotFoundError:
+        current = None
+    except TransportError as e:
+        # Ohne ISM-Plugin gibt es kein automatisches Rollover, geschrieben wird trotzdem
+        logging.warning("ISM-Policy nicht verfügbar", extra={"policy": FEEDBACK_POLICY, "error": str(e)})
+        return
+    if current is None:
         try:
-            if not client.indices.exists(index=index_name):
-                print(f"Index '{index_name}' wird erstellt...")
-                mapping = {
-                    "settings": {
-                        "index": {
-                            "number_of_shards": 1,
-                            "number_of_replicas": 0
-                        }
-                    },
-                    "mappings": {
-                        "properties": {
-                            "timestamp": {"type": "date"},
-                            "thumbs": {"type": "keyword"},
-                            "model": {"type": "keyword"},
-                            "provider": {"type": "keyword"},
-                            "message_index": {"type": "integer"},
-                            "feedback_text": {"type": "text"},
-                            "id": {"type": "keyword"}
-                        }
-                    }
-                }
-                client.indices.create(index=index_name, body=mapping)
-                print(f"Index '{index_name}' wurde erfolgreich erstellt.")
-            else:
-                print(f"Index '{index_name}' existiert bereits.")
-            return  # Erfolgreich, beende die Funktion
-        except ConnectionError as e:
-            print(f"Verbindungsfehler: {e}. Versuch {attempt + 1}/{max_retries}...")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-            else:
-                raise Exception(f"Maximale Versuche erreicht. Kann keine Verbindung zu OpenSearch herstellen: {e}")
+            await client.plugins.index_management.put_policy(policy=FEEDBACK_POLICY, body=FEEDBACK_ISM_POLICY)
+        except ConflictError:
+            pass
+    elif current["policy"].get("description") != FEEDBACK_ISM_POLICY["policy"]["description"]:
+        await client.plugins.index_management.put_policy(
+            policy=FEEDBACK_POLICY, body=FEEDBACK_ISM_POLICY,
+            params={"if_seq_no": current["_seq_no"], "if_primary_term": current["_primary_term"]},
+        )
+        logging.info(f"ISM-Policy '{FEEDBACK_POLICY}' aktualisiert.")
+
+async def _ensure_feedback_index(client):
+    await _put_feedback_template(client)
+    if await client.indices.exists_alias(name=FEEDBACK_INDEX):
+        return
+    if await client.indices.exists(index=FEEDBACK_INDEX):
+        # Alter Einzelindex ohne Template: läuft weiter, bis er migriert ist
+        logging.warning(f"Index '{FEEDBACK_INDEX}' hat noch das alte Layout; "
+                        f"Migration mit: python -m src.opensearch migrate")
+        return
+    await _create_index_if_not_exists(client, FEEDBACK_FIRST_INDEX,
+                                      {"aliases": {FEEDBACK_INDEX: {"is_write_index": True}}})
+
+##########################
+# MIGRATION              #
+##########################
+
+async def migrate_legacy_feedback_index(client):
+    """Überführt den alten Einzelindex chat-feedback in das Template-Layout.
+
+    Der alte Index wird schreibgeschützt, per _reindex in den ersten
+    versionierten Index kopiert und erst nach Abgleich der Dokumentzahl in
+    einem Schritt gelöscht und durch den Alias ersetzt. Feedback, das während
+    der Migration eintrifft, wird abgewiesen; die App sollte dafür gestoppt sein.
+    """
+    if await client.indices.exists_alias(name=FEEDBACK_INDEX):
+        logging.info(f"'{FEEDBACK_INDEX}' ist bereits ein Alias, nichts zu migrieren.")
+        return False
+    if not await client.indices.exists(index=FEEDBACK_INDEX):
+        logging.info(f"Kein Index '{FEEDBACK_INDEX}' vorhanden, nichts zu migrieren.")
+        return False
+
+    await _put_feedback_template(client)
+    await _create_index_if_not_exists(client, FEEDBACK_FIRST_INDEX, {})
+    await client.indices.put_settings(index=FEEDBACK_INDEX, body={"index": {"blocks.write": True}})
+    try:
+        result = await client.reindex(
+            body={"source": {"index": FEEDBACK_INDEX}, "dest": {"index": FEEDBACK_FIRST_INDEX, "op_type": "create"},
+                  "conflicts": "proceed"},
+            wait_for_completion=True, refresh=True, request_timeout=3600,
+        )
+        if result.get("failures"):
+            raise RuntimeError(f"Reindex mit {len(result['failures'])} Fehlern: {result['failures'][:3]}")
+        before = (await client.count(index=FEEDBACK_INDEX))["count"]
+        after = (await client.count(index=FEEDBACK_FIRST_INDEX))["count"]
+        if before != after:
+            raise RuntimeError(f"Dokumentzahl weicht ab: {before} alt, {after} neu")
+    except Exception:
+        await client.indices.put_settings(index=FEEDBACK_INDEX, body={"index": {"blocks.write": False}})
+        raise
+
+    await client.indices.update_aliases(body={"actions": [
+        {"remove_index": {"index": FEEDBACK_INDEX}},
+        {"add": {"index": FEEDBACK_FIRST_INDEX, "alias": FEEDBACK_INDEX, "is_write_index": True}},
+    ]})
+    logging.info(f"{after} Feedback-Dokumente nach '{FEEDBACK_FIRST_INDEX}' migriert, '{FEEDBACK_INDEX}' ist jetzt ein Alias.")
+    return True
+
+async def _migrate():
+    try:
+        await migrate_legacy_feedback_index(get_opensearch_client())
+    finally:
+        await close_opensearch_client()
+
+if __name__ == "__main__":
+    import sys
+
+    from src.log_config import setup_logging
+
+    setup_logging()
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("Aufruf: python -m src.opensearch migrate")
+    asyncio.run(_migrate())
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+from src.cache import normalize_text
+from src.context import quiz_questions_only
+from src.metrics import observe_validation, record_quiz_pool, set_quiz_pool_size
+
+QUIZ_POOL_ENABLED = os.getenv("QUIZ_POOL_ENABLED", "true").lower() != "false"
+QUIZ_POOL_BUFFER_SIZE = int(os.getenv("QUIZ_POOL_BUFFER_SIZE", "3"))
+QUIZ_POOL_MAX_QUESTIONS = int(os.getenv("QUIZ_POOL_MAX_QUESTIONS", "500"))
+# Themen, die so lange nicht mehr angefragt wurden, gelten als kalt und werden verworfen
+QUIZ_POOL_TOPIC_TTL = float(os.getenv("QUIZ_POOL_TOPIC_TTL", "1800"))
+QUIZ_POOL_WORKERS = int(os.getenv("QUIZ_POOL_WORKERS", "2"))
+# Fehlversuche pro Nachfüllrunde, bevor ein Thema bis zur nächsten Anfrage ruht
+QUIZ_POOL_MAX_FAILURES = int(os.getenv("QUIZ_POOL_MAX_FAILURES", "3"))
+
+def question_key(question: str) -> str:
+    return normalize_text(question)
+
+def asked_questions(messages: list) -> set:
+    """Die bereits gestellten Fragen aus dem Verlauf, so wie App.vue sie mitschickt."""
+    asked = set()
+    for m in quiz_questions_only(messages or []):
+        asked.add(question_key(m["content"][len("Frage:"):]))
+    return asked
+
+class _TopicBuffer:
+    def __init__(self):
+        self.questions = deque()
+        self.last_used = time.monotonic()
+        self.refilling = False
+
+class QuizPool:
+    """Hält pro (Thema, Provider, Modell, Temperatur) ein paar fertig validierte Quizfragen.
+
+    Eine Quiz-Anfrage nimmt die nächste Frage aus dem Puffer, sofern sie im
+    Verlauf der Sitzung noch nicht vorkam, und stößt das Nachfüllen im
+    Hintergrund an. Insgesamt werden höchstens QUIZ_POOL_MAX_QUESTIONS Fragen
+    gehalten; bei Bedarf werden die am längsten nicht genutzten Themen verworfen.
+    """
+
+    def __init__(self, buffer_size=QUIZ_POOL_BUFFER_SIZE, max_questions=QUIZ_POOL_MAX_QUESTIONS,
+                 topic_ttl=QUIZ_POOL_TOPIC_TTL, workers=QUIZ_POOL_WORKERS):
+        self.buffer_size = buffer_size
+        self.max_questions = max_questions
+        self.topic_ttl = topic_ttl
+        self._workers = asyncio.Semaphore(workers)
+        self._topics = OrderedDict()
+        self._tasks = set()
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.generated = 0
+        self.evicted = 0
+
+    @staticmethod
+    def make_key(topic, provider, model, temperature):
+        return (normalize_text(topic), provider, model, temperature)
+
+    def _touch(self, key):
+        buffer = self._topics.get(key)
+        if buffer is None:
+            buffer = self._topics[key] = _TopicBuffer()
+        buffer.last_used = time.monotonic()
+        self._topics.move_to_end(key)
+        return buffer
+
+    def _drop(self, key):
+        buffer = self._topics.pop(key)
+        self.total -= len(buffer.questions)
+        self.evicted += len(buffer.questions)
+
+    def _evict(self, keep, reserve=0):
+        now = time.monotonic()
+        for key in list(self._topics):
+            if key != keep and now - self._topics[key].last_used > self.topic_ttl:
+                self._drop(key)
+        for key in list(self._topics):
+            if self.total + reserve <= self.max_questions:
+                break
+            if key != keep:
+                self._drop(key)
+        set_quiz_pool_size(self.total)
+
+    def take(self, key, messages: list = None):
+        """Nächste noch nicht gestellte Frage aus dem Puffer oder None."""
+        buffer = self._topics.get(key)
+        if buffer is not None:
+            self._touch(key)
+            asked = asked_questions(messages)
+            while buffer.questions:
+                quiz = buffer.questions.popleft()
+                self.total -= 1
+                if question_key(quiz["question"]) in asked:
+                    self.discarded += 1
+                    continue
+                self.hits += 1
+                record_quiz_pool("hit")
+                set_quiz_pool_size(self.total)
+                return quiz
+        self.misses += 1
+        record_quiz_pool("miss")
+        set_quiz_pool_size(self.total)
+        return None
+
+    def refill(self, key, generate, messages: list = None):
+        """Füllt den Puffer des Themas im Hintergrund auf.
+
+        generate(avoid) erzeugt eine neue Quizfrage; avoid enthält die Fragen
+        der Sitzung und des Puffers als Verlauf, damit sich nichts wiederholt.
+        """
+        buffer = self._touch(key)
+        self._evict(keep=key)
+        if buffer.refilling or len(buffer.questions) >= self.buffer_size:
+            return
+        buffer.refilling = True
+        task = asyncio.create_task(self._refill(key, buffer, generate, list(messages or [])))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key, buffer, generate, messages):
+        failures = 0
+        try:
+            while len(buffer.questions) < self.buffer_size and failures < QUIZ_POOL_MAX_FAILURES:
+                if self._topics.get(key) is not buffer:
+                    return
+                # Platz für die neue Frage auf Kosten der am längsten ungenutzten Themen
+                self._evict(keep=key, reserve=1)
+                if self.total >= self.max_questions:
+                    return
+                known = {question_key(q["question"]) for q in buffer.questions} | asked_questions(messages)
+                avoid = quiz_questions_only(messages) + [
+                    {"role": "assistant", "content": f"Frage: {q['question']}"} for q in buffer.questions
+                ]
+                try:
+                    async with self._workers:
+                        quiz = await generate(avoid)
+                except Exception as e:
+                    failures += 1
+                    logging.warning("Quiz-Vorabgenerierung fehlgeschlagen", extra={"query": key[0], "error": str(e)})
+                    continue
+
+                valid, msg = observe_validation("Quiz", quiz) if isinstance(quiz, dict) else (False, "Kein Objekt")
+                if not valid or question_key(quiz["question"]) in known:
+                    failures += 1
+                    self.discarded += 1
+                    continue
+                if self._topics.get(key) is not buffer:
+                    return
+                buffer.questions.append(quiz)
+                self.total += 1
+                self.generated += 1
+                set_quiz_pool_size(self.total)
+        finally:
+            buffer.refilling = False
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "enabled": QUIZ_POOL_ENABLED,
+            "topics": len(self._topics),
+            "questions": self.total,
+            "max_questions": self.max_questions,
+            "buffer_size": self.buffer_size,
+            "refilling": sum(1 for b in self._topics.values() if b.refilling),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+            "generated": self.generated,
+            "discarded": self.discarded,
+            "evicted": self.evicted,
+        }
+
+quiz_pool = QuizPool()
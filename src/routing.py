@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from src.chains import DEFAULT_MODELS, aget_llm, llm_identity
+from src.clients import configured_providers
+from src.scheduler import ProviderOverloaded
+from src.metrics import current_labels, set_request_labels, record_hedge, record_failover, set_circuit_state
+
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "100"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+HEDGE_ENABLED = os.getenv("ROUTER_HEDGE_ENABLED", "true").lower() != "false"
+HEDGE_PERCENTILE = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "0.95"))
+# Bis genug Messwerte vorliegen, wird nach dieser festen Wartezeit gehedgt
+HEDGE_DEFAULT_DELAY = float(os.getenv("ROUTER_HEDGE_DEFAULT_DELAY", "10"))
+HEDGE_MIN_DELAY = float(os.getenv("ROUTER_HEDGE_MIN_DELAY", "0.5"))
+MAX_PARALLEL = int(os.getenv("ROUTER_MAX_PARALLEL", "2"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+def fallback_order_from_env():
+    # Kommaseparierte Reihenfolge, z.B. LLM_FALLBACK_ORDER=groq,mistral,google.
+    # Ohne Angabe kommen alle Provider mit gesetztem API-Key infrage.
+    configured = os.getenv("LLM_FALLBACK_ORDER")
+    if configured is not None:
+        return [p.strip() for p in configured.split(",") if p.strip()]
+    return configured_providers()
+
+def identity(llm):
+    return llm_identity(llm)[:2]
+
+async def fallback_candidates(llm):
+    """Die Default-Modelle der übrigen konfigurierten Provider, in Fallback-Reihenfolge."""
+    provider, _, temperature = llm_identity(llm)
+    candidates = []
+    for fallback in fallback_order_from_env():
+        if fallback == provider or fallback not in DEFAULT_MODELS:
+            continue
+        try:
+            candidates.append(await aget_llm(provider=fallback, model=DEFAULT_MODELS[fallback],
+                                             temperature=temperature))
+        except Exception as e:
+            logging.warning("Fallback nicht verfügbar", extra={"provider": fallback, "error": str(e)})
+    return candidates
+
+class UpstreamError(Exception):
+    """Der Provider hat geantwortet, aber kein verwertbares Ergebnis geliefert."""
+
+    def __init__(self, result):
+        super().__init__(result.get("error"))
+        self.result = result
+
+##########################
+# ROLLING STATISTICS     #
+##########################
+
+class ProviderStats:
+    def __init__(self, window=ROUTER_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+
+    def record(self, latency, ok):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def as_dict(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "samples": len(self.outcomes),
+            "error_rate": round(self.error_rate(), 4),
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+        }
+
+##########################
+# CIRCUIT BREAKER        #
+##########################
+
+class CircuitBreaker:
+    """closed -> open nach zu vielen Fehlern, nach CIRCUIT_OPEN_SECONDS half_open.
+
+    Im Zustand half_open wird genau ein Probe-Request durchgelassen; dessen
+    Ergebnis entscheidet, ob der Circuit wieder schließt oder erneut öffnet.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, error_rate=CIRCUIT_ERROR_RATE,
+                 open_seconds=CIRCUIT_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def available(self):
+        """Wie allow(), aber ohne eine Probe zu belegen; für die Vorauswahl der Kandidaten."""
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.open_seconds
+        return self.state == "closed" or not self._probing
+
+    def allow(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def on_success(self):
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self._probing = False
+
+    def on_failure(self, stats):
+        self.consecutive_failures += 1
+        too_many = self.consecutive_failures >= self.failure_threshold
+        too_often = len(stats.outcomes) >= ROUTER_MIN_SAMPLES and stats.error_rate() >= self.error_rate
+        if self.state == "half_open" or too_many or too_often:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+##########################
+# ROUTER                 #
+##########################
+
+class Router:
+    """Verteilt einen Aufruf auf den angefragten Provider und bei Bedarf auf Fallbacks.
+
+    Antwortet der Primär-Provider nicht innerhalb seines beobachteten p95,
+    wird parallel ein Fallback gestartet (Hedging); die erste erfolgreiche
+    Antwort gewinnt, die übrigen Aufrufe werden abgebrochen. Fehler oder
+    offene Circuits führen direkt zum nächsten Kandidaten.
+    """
+
+    def __init__(self, hedge_enabled=HEDGE_ENABLED, max_parallel=MAX_PARALLEL):
+        self.hedge_enabled = hedge_enabled
+        self.max_parallel = max_parallel
+        self._stats = {}
+        self._breakers = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def _stats_for(self, key):
+        if key not in self._stats:
+            self._stats[key] = ProviderStats()
+        return self._stats[key]
+
+    def _breaker_for(self, key):
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker()
+        return self._breakers[key]
+
+    def hedge_delay(self, key):
+        stats = self._stats_for(key)
+        if len(stats.latencies) < ROUTER_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(stats.percentile(HEDGE_PERCENTILE), HEDGE_MIN_DELAY)
+
+    def _record(self, key, latency, ok):
+        stats = self._stats_for(key)
+        stats.record(latency, ok)
+        breaker = self._breaker_for(key)
+        if ok:
+            breaker.on_success()
+        else:
+            breaker.on_failure(stats)
+        set_circuit_state(*key, breaker.state)
+
+    async def _attempt(self, key, llm, call):
+        # Läuft als eigener Task mit Kopie des Kontexts; die Labels gelten nur hier
+        set_request_labels(current_labels()["use_case"], *key)
+        started = time.perf_counter()
+        try:
+            result = await call(llm)
+        except asyncio.CancelledError:
+            # Abgebrochener Hedge-Verlierer: kein Messwert, aber eine Probe wieder freigeben
+            self._breaker_for(key)._probing = False
+            raise
+        except ProviderOverloaded:
+            # Lokal abgewiesen oder vom Provider gedrosselt: Fallback ja, Circuit bleibt zu
+            self._breaker_for(key)._probing = False
+            raise
+        except Exception:
+            self._record(key, time.perf_counter() - started, False)
+            raise
+        if isinstance(result, dict) and "error" in result:
+            self._record(key, time.perf_counter() - started, False)
+            raise UpstreamError(result)
+        self._record(key, time.perf_counter() - started, True)
+        return result
+
+    async def run(self, llm, call, fallback=True):
+        """Führt call(llm) aus und liefert (Ergebnis, bedienendes llm, gehedgt).
+
+        Mit fallback=False wird nur das angefragte LLM verwendet. Schlagen alle
+        Kandidaten fehl, wird die letzte Fehlerantwort zurückgegeben bzw. die
+        letzte Exception geworfen.
+        """
+        candidates = [llm] + (await fallback_candidates(llm) if fallback else [])
+        # allow() belegt im Zustand half_open die Probe, deshalb erst beim tatsächlichen Start
+        queue = [llm for llm in candidates if self._breaker_for(identity(llm)).available()]
+        forced = not queue
+        if forced:
+            # Alle Circuits offen: lieber den angefragten Provider versuchen als sofort abzulehnen
+            queue = candidates[:1]
+        elif queue[0] is not candidates[0]:
+            self.failovers += 1
+            record_failover(*identity(candidates[0]))
+
+        tasks = {}
+        hedged = False
+        last_error = None
+
+        def launch():
+            nonlocal forced
+            while queue:
+                llm = queue.pop(0)
+                if not (forced or self._breaker_for(identity(llm)).allow()):
+                    continue
+                forced = False
+                task = asyncio.ensure_future(self._attempt(identity(llm), llm, call))
+                tasks[task] = llm
+                return
+
+        launch()
+        try:
+            while tasks:
+                can_hedge = self.hedge_enabled and queue and len(tasks) < self.max_parallel
+                timeout = self.hedge_delay(identity(candidates[0])) if can_hedge else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedged = True
+                    self.hedges += 1
+                    record_hedge(*identity(queue[0]))
+                    logging.info(f"Hedge nach {timeout:.2f}s: {identity(queue[0])}")
+                    launch()
+                    continue
+
+                for task in done:
+                    llm = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        logging.warning("Provider fehlgeschlagen", extra={"provider": identity(llm), "error": str(e)})
+                        continue
+                    if hedged and llm is not candidates[0]:
+                        self.hedge_wins += 1
+                    return result, llm, hedged
+
+                # Fehlgeschlagene Versuche sofort durch den nächsten Kandidaten ersetzen
+                if queue and len(tasks) < self.max_parallel:
+                    self.failovers += 1
+                    record_failover(*identity(queue[0]))
+                    launch()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        if isinstance(last_error, UpstreamError):
+            return last_error.result, candidates[0], hedged
+        raise last_error
+
+    def stats(self):
+        return {
+            "hedge_enabled": self.hedge_enabled,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "providers": {
+                f"{provider}/{model}": {
+                    **stats.as_dict(),
+                    "circuit": self._breaker_for((provider, model)).state,
+                    "hedge_delay_ms": round(self.hedge_delay((provider, model)) * 1000),
+                }
+                for (provider, model), stats in self._stats.items()
+            },
+        }
+
+router = Router()
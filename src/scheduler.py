@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+from src.context import count_tokens
+from src.metrics import observe_queue_wait, set_queue_depth, record_shed, record_upstream_retry
+from src.tracing import span
+
+def _parse_limits(raw):
+    # z.B. PROVIDER_MAX_CONCURRENCY="groq=4,mistral=2"
+    limits = {}
+    for item in raw.split(","):
+        if "=" in item:
+            provider, value = item.split("=", 1)
+            limits[provider.strip()] = int(value)
+    return limits
+
+DEFAULT_CONCURRENCY = int(os.getenv("PROVIDER_DEFAULT_CONCURRENCY", "8"))
+MAX_CONCURRENCY = _parse_limits(os.getenv("PROVIDER_MAX_CONCURRENCY", ""))
+# Tokens pro Minute; 0 bzw. nicht gesetzt heißt unbegrenzt
+TOKENS_PER_MINUTE = _parse_limits(os.getenv("PROVIDER_TPM", ""))
+QUEUE_SIZE = int(os.getenv("PROVIDER_QUEUE_SIZE", "50"))
+QUEUE_TIMEOUT = float(os.getenv("PROVIDER_QUEUE_TIMEOUT", "10"))
+MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("PROVIDER_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("PROVIDER_RETRY_MAX_DELAY", "20"))
+# Pauschale für die Antwort-Tokens, solange nur der Prompt gezählt werden kann
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("PROVIDER_COMPLETION_TOKEN_ESTIMATE", "512"))
+
+RETRYABLE_STATUS = {429, 503}
+
+class ProviderOverloaded(Exception):
+    """Anfrage wurde abgewiesen: Warteschlange voll, Frist abgelaufen oder Provider drosselt."""
+
+    def __init__(self, provider, reason, retry_after=None):
+        super().__init__(f"Provider {provider} ausgelastet ({reason})")
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+
+##########################
+# UPSTREAM ERRORS        #
+##########################
+
+def upstream_status(exc):
+    """HTTP-Status einer Provider-Exception (Groq/OpenAI/Mistral/Google), sonst None."""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None) or getattr(exc, "raw_response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+def retry_after_seconds(exc):
+    response = getattr(exc, "response", None) or getattr(exc, "raw_response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+def estimate_tokens(prompt_text: str, model: str = None) -> int:
+    return count_tokens(prompt_text or "", model) + COMPLETION_TOKEN_ESTIMATE
+
+##########################
+# PROVIDER LIMITER       #
+##########################
+
+class ProviderLimiter:
+    """Begrenzt gleichzeitige Aufrufe und Tokens pro Minute für einen Provider.
+
+    Wartende Anfragen stehen in einer begrenzten Warteschlange; wer länger als
+    die Frist wartet oder keinen Platz mehr findet, wird mit ProviderOverloaded
+    abgewiesen. Meldet der Provider Retry-After, pausieren alle Aufrufe.
+    """
+
+    def __init__(self, provider, concurrency, tokens_per_minute=0, queue_size=QUEUE_SIZE):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.queue_size = queue_size
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self.resume_at = 0.0
+        self.waiting = 0
+        self.active = 0
+        self.shed = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60
+        self._tokens = min(self.tokens_per_minute, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    async def _wait_for_budget(self, tokens, deadline):
+        needed = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+        while True:
+            now = time.monotonic()
+            wait = max(self.resume_at - now, 0.0)
+            if needed:
+                self._refill()
+                if self._tokens < needed:
+                    wait = max(wait, (needed - self._tokens) / (self.tokens_per_minute / 60))
+            if wait <= 0:
+                self._tokens -= needed
+                return
+            if now + wait > deadline:
+                raise ProviderOverloaded(self.provider, "budget", retry_after=wait)
+            await asyncio.sleep(wait)
+
+    def _shed(self, reason, retry_after=None):
+        self.shed += 1
+        record_shed(self.provider, reason)
+        return ProviderOverloaded(self.provider, reason, retry_after=retry_after)
+
+    async def _acquire_slot(self, timeout):
+        if not self._slots.locked() and not self.waiting:
+            await self._slots.acquire()
+            return
+        if self.waiting >= self.queue_size:
+            raise self._shed("queue_full")
+
+        self.waiting += 1
+        set_queue_depth(self.provider, self.waiting)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise self._shed("deadline")
+        finally:
+            self.waiting -= 1
+            set_queue_depth(self.provider, self.waiting)
+
+    async def acquire(self, tokens, timeout=QUEUE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        started = time.perf_counter()
+        with span("scheduler.wait", provider=self.provider, tokens=tokens):
+            await self._acquire_slot(timeout)
+            try:
+                await self._wait_for_budget(tokens, deadline)
+            except ProviderOverloaded as e:
+                self._slots.release()
+                raise self._shed(e.reason, e.retry_after)
+            except BaseException:
+                self._slots.release()
+                raise
+        observe_queue_wait(self.provider, time.perf_counter() - started)
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    def pause(self, seconds):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "tokens_per_minute": self.tokens_per_minute or None,
+            "active": self.active,
+            "waiting": self.waiting,
+            "shed": self.shed,
+            "paused_for": round(max(self.resume_at - time.monotonic(), 0.0), 2),
+        }
+
+##########################
+# SCHEDULER              #
+##########################
+
+class ProviderScheduler:
+    def __init__(self, max_retries=MAX_RETRIES):
+        self.max_retries = max_retries
+        self._limiters = {}
+        self.retries = 0
+
+    def limiter(self, provider):
+        if provider not in self._limiters:
+            self._limiters[provider] = ProviderLimiter(
+                provider,
+                MAX_CONCURRENCY.get(provider, DEFAULT_CONCURRENCY),
+                TOKENS_PER_MINUTE.get(provider, 0),
+            )
+        return self._limiters[provider]
+
+    async def submit(self, provider, call, tokens=0):
+        """Führt call() aus, sobald der Provider Kapazität hat.
+
+        Bei 429/503 wird mit Jitter erneut versucht; ein Retry-After des
+        Providers wird eingehalten und gilt für alle wartenden Aufrufe.
+        Sind die Versuche aufgebraucht, folgt ProviderOverloaded.
+        """
+        limiter = self.limiter(provider)
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire(tokens)
+            try:
+                return await call()
+            except Exception as e:
+                status = upstream_status(e)
+                if status not in RETRYABLE_STATUS:
+                    raise
+                retry_after = retry_after_seconds(e)
+                if retry_after:
+                    limiter.pause(retry_after)
+                if attempt == self.max_retries or (retry_after or 0) > RETRY_MAX_DELAY:
+                    raise ProviderOverloaded(provider, f"upstream_{status}", retry_after=retry_after) from e
+                delay = retry_after or min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY)
+                delay += random.uniform(0, RETRY_BASE_DELAY)
+                self.retries += 1
+                record_upstream_retry(provider, status)
+                logging.warning(f"{provider} antwortet mit {status}, neuer Versuch in {delay:.1f}s")
+            finally:
+                limiter.release()
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def slot(self, provider, tokens=0):
+        """Belegt einen Platz für Aufrufe ohne Wiederholung, z.B. Streams."""
+        limiter = self.limiter(provider)
+        await limiter.acquire(tokens)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def stats(self):
+        return {
+            "retries": self.retries,
+            "providers": {provider: limiter.stats() for provider, limiter in self._limiters.items()},
+        }
+
+provider_scheduler = ProviderScheduler()
@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.cache import normalize_text
+from src.chains import get_embeddings
+from src.metrics import observe_semantic_stage, record_semantic_lookup
+
+def _parse_thresholds(raw):
+    # z.B. SEMANTIC_CACHE_THRESHOLDS="FreePrompt=0.95,FunFact=0.92"
+    thresholds = {}
+    for item in raw.split(","):
+        if "=" in item:
+            use_case, value = item.split("=", 1)
+            thresholds[use_case.strip()] = float(value)
+    return thresholds
+
+# openai | hashing | off; ausdrücklich einzuschalten, weil "openai" pro Anfrage
+# einen kostenpflichtigen Embedding-Aufruf kostet (auch bei Groq oder Mistral)
+SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "off")
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+# Partitionsschlüssel enthalten Modell und Länge aus der Anfrage; ohne Obergrenze
+# legte jeder neue Wert eine weitere Matrix an
+SEMANTIC_CACHE_MAX_PARTITIONS = int(os.getenv("SEMANTIC_CACHE_MAX_PARTITIONS", "32"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+# Wie beim exakten Cache nur Use Cases mit wiederverwendbaren Antworten;
+# FreePrompt und Quiz sollen auch bei ähnlicher Eingabe neu antworten
+SEMANTIC_CACHE_THRESHOLDS = {
+    "FunFact": 0.92,
+    **_parse_thresholds(os.getenv("SEMANTIC_CACHE_THRESHOLDS", "")),
+}
+HASHING_DIMENSIONS = int(os.getenv("SEMANTIC_CACHE_HASHING_DIMENSIONS", "512"))
+
+##########################
+# EMBEDDERS              #
+##########################
+
+class OpenAIEmbedder:
+    """Nutzt ein LangChain-Embeddings-Objekt, standardmäßig chains.get_embeddings()."""
+
+    name = "openai"
+
+    def __init__(self, embeddings_factory=get_embeddings):
+        self.embeddings_factory = embeddings_factory
+        self.embeddings = None
+
+    async def embed(self, text: str) -> np.ndarray:
+        if self.embeddings is None:
+            # langchain_openai wird erst bei der ersten Suche geladen, im Thread
+            self.embeddings = await asyncio.to_thread(self.embeddings_factory)
+        return np.asarray(await self.embeddings.aembed_query(text), dtype=np.float32)
+
+class HashingEmbedder:
+    """Deterministischer Embedder ohne Netzwerk, z.B. für Tests und Benchmarks.
+
+    Bildet Wörter und Zeichen-Trigramme per Hash auf einen festen Vektor ab;
+    Umformulierungen mit vielen gemeinsamen Wörtern landen nah beieinander.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _index(self, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.dimensions
+
+    async def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in normalize_text(text).split():
+            vector[self._index(word)] += 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                vector[self._index(padded[i:i + 3])] += 0.5
+        return vector
+
+def create_embedder(name=SEMANTIC_CACHE_EMBEDDER):
+    if name == "openai":
+        return OpenAIEmbedder()
+    if name == "hashing":
+        return HashingEmbedder()
+    return None
+
+##########################
+# VECTOR INDEX           #
+##########################
+
+class _Partition:
+    """Vektoren eines (Use Case, Provider, Modell, ...) als NumPy-Matrix, die bei Bedarf wächst."""
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, dimensions, max_entries):
+        capacity = min(self.INITIAL_CAPACITY, max_entries)
+        self.max_entries = max_entries
+        self.vectors = np.zeros((capacity, dimensions), dtype=np.float32)
+        self.expires_at = np.zeros(capacity, dtype=np.float64)
+        self.last_access = np.zeros(capacity, dtype=np.float64)
+        self.values = [None] * capacity
+        self.size = 0
+
+    def grow(self):
+        capacity = min(len(self.values) * 2, self.max_entries)
+        extra = capacity - len(self.values)
+        self.vectors = np.vstack([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)])
+        self.expires_at = np.concatenate([self.expires_at, np.zeros(extra)])
+        self.last_access = np.concatenate([self.last_access, np.zeros(extra)])
+        self.values.extend([None] * extra)
+
+class SemanticCache:
+    """Findet Antworten auf inhaltlich gleiche Anfragen per Kosinus-Ähnlichkeit.
+
+    Die Vektoren sind normiert abgelegt, eine Suche ist damit ein einziges
+    Matrix-Vektor-Produkt über die Partition. Ist die Partition voll, wird der
+    am längsten nicht genutzte (bzw. abgelaufene) Eintrag überschrieben. Über
+    max_partitions hinaus wird die am längsten ungenutzte Partition verworfen.
+    """
+
+    def __init__(self, embedder, max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL,
+                 thresholds=None, max_partitions=SEMANTIC_CACHE_MAX_PARTITIONS):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.max_partitions = max_partitions
+        self.ttl = ttl
+        self.thresholds = thresholds if thresholds is not None else SEMANTIC_CACHE_THRESHOLDS
+        self._partitions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.partition_evictions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self):
+        return self.embedder is not None
+
+    def applies_to(self, use_case):
+        return self.enabled and use_case in self.thresholds
+
+    async def embed(self, text):
+        try:
+            with observe_semantic_stage("embed"):
+                vector = await self.embedder.embed(text)
+        except Exception as e:
+            # Ohne Embedding geht die Anfrage ganz normal an den Provider
+            self.errors += 1
+            logging.warning("Embedding für den semantischen Cache fehlgeschlagen", extra={"error": str(e)})
+            return None
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def lookup(self, use_case, partition_key, vector):
+        """Liefert (Antwort, Ähnlichkeit) des besten Treffers über dem Schwellwert, sonst (None, Ähnlichkeit)."""
+        with observe_semantic_stage("search"):
+            partition = self._partitions.get(partition_key)
+            best, score = None, 0.0
+            if partition is not None:
+                self._partitions.move_to_end(partition_key)
+            if partition is not None and partition.size:
+                scores = partition.vectors[:partition.size] @ vector
+                scores[partition.expires_at[:partition.size] < time.time()] = -1.0
+                index = int(np.argmax(scores))
+                score = float(scores[index])
+                if score >= self.thresholds[use_case]:
+                    partition.last_access[index] = time.time()
+                    best = partition.values[index]
+
+        if best is None:
+            self.misses += 1
+            record_semantic_lookup(use_case, "miss")
+        else:
+            self.hits += 1
+            record_semantic_lookup(use_case, "hit")
+        return best, score
+
+    def store(self, partition_key, vector, value):
+        partition = self._partitions.get(partition_key)
+        if partition is None:
+            partition = self._partitions[partition_key] = _Partition(len(vector), self.max_entries)
+            while len(self._partitions) > self.max_partitions:
+                _, dropped = self._partitions.popitem(last=False)
+                self.partition_evictions += 1
+                self.evictions += dropped.size
+        self._partitions.move_to_end(partition_key)
+
+        now = time.time()
+        if partition.size == len(partition.values) and partition.size < self.max_entries:
+            partition.grow()
+        if partition.size < len(partition.values):
+            index = partition.size
+            partition.size += 1
+        else:
+            # Abgelaufene Einträge zuerst, sonst der am längsten ungenutzte
+            expired = partition.expires_at < now
+            index = int(np.argmax(expired)) if expired.any() else int(np.argmin(partition.last_access))
+            self.evictions += 1
+
+        partition.vectors[index] = vector
+        partition.expires_at[index] = now + self.ttl
+        partition.last_access[index] = now
+        partition.values[index] = value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "embedder": getattr(self.embedder, "name", None),
+            "thresholds": self.thresholds,
+            "partitions": len(self._partitions),
+            "max_partitions": self.max_partitions,
+            "entries": sum(p.size for p in self._partitions.values()),
+            "max_entries_per_partition": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "partition_evictions": self.partition_evictions,
+            "embed_errors": self.errors,
+        }
+
+semantic_cache = SemanticCache(create_embedder())
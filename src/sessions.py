@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+
+from opensearchpy.exceptions import NotFoundError
+
+from src.opensearch import get_opensearch_client, opensearch_state
+
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "50"))
+# Längere Nachrichten (z.B. ganze Summary-Dokumente) werden gekürzt im Verlauf abgelegt
+SESSION_MAX_MESSAGE_CHARS = int(os.getenv("SESSION_MAX_MESSAGE_CHARS", "4000"))
+# Sitzungen, die so lange (Sekunden) nicht benutzt wurden, beginnen von vorn
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+# memory | opensearch
+SESSION_PERSISTENCE = os.getenv("SESSION_PERSISTENCE", "memory")
+
+SESSION_INDEX = "chat-sessions"
+
+SESSION_MAPPING = {
+    "settings": {
+        "index": {
+            "number_of_shards": 1,
+            "number_of_replicas": 0
+        }
+    },
+    "mappings": {
+        "properties": {
+            "session_id": {"type": "keyword"},
+            "updated_at": {"type": "date"},
+            # Nur abgelegt, nicht durchsucht
+            "messages": {"type": "object", "enabled": False}
+        }
+    }
+}
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+def assistant_content(content: dict) -> str:
+    """Die Antwort als Verlaufstext, so wie App.vue sie bisher selbst mitgeschickt hat."""
+    kind = content.get("type")
+    if kind == "free_prompt":
+        return content.get("data", "")
+    if kind == "summary":
+        return content.get("summary", "")
+    if kind == "fun_fact":
+        return content.get("fact", "")
+    if kind == "quiz":
+        options = "\n".join(content.get("options", []))
+        return (f"Frage: {content.get('question', '')}\nAntwortmöglichkeiten:\n{options}\n"
+                f"Richtige Antwort: {content.get('answer', '')}\nErklärung: {content.get('explanation', '')}")
+    return ""
+
+class Session:
+    def __init__(self, session_id, messages=None):
+        self.id = session_id
+        self.messages = list(messages or [])
+        self.last_used = time.time()
+        self.dirty = False
+
+    def as_document(self):
+        return {
+            "session_id": self.id,
+            "updated_at": int(self.last_used * 1000),
+            "messages": self.messages,
+        }
+
+##########################
+# PERSISTENCE            #
+##########################
+
+class OpenSearchSessionBackend:
+    """Hält Sitzungen zusätzlich in OpenSearch, damit sie Neustarts und LRU-Eviction überleben."""
+
+    def __init__(self, index=SESSION_INDEX):
+        self.index = index
+
+    async def load(self, session_id):
+        """Das gespeicherte Dokument (messages, updated_at in ms) oder None."""
+        if not opensearch_state.ready.is_set():
+            return None
+        try:
+            response = await get_opensearch_client().get(index=self.index, id=session_id)
+        except NotFoundError:
+            return None
+        return response["_source"]
+
+    async def save(self, session):
+        if opensearch_state.ready.is_set():
+            await get_opensearch_client().index(index=self.index, id=session.id, body=session.as_document())
+
+    async def delete(self, session_id):
+        if opensearch_state.ready.is_set():
+            try:
+                await get_opensearch_client().delete(index=self.index, id=session_id)
+            except NotFoundError:
+                pass
+
+##########################
+# SESSION STORE          #
+##########################
+
+class SessionStore:
+    """Gesprächsverläufe auf dem Server, damit Clients nur noch Session-ID und neue Eingabe schicken.
+
+    Die Sitzungen liegen in einem LRU im Prozess, begrenzt auf max_sessions
+    Sitzungen mit je höchstens max_messages Nachrichten. Mit einem Backend
+    werden Änderungen im Hintergrund gespeichert (pro Sitzung höchstens ein
+    Schreibvorgang gleichzeitig) und bei einem Cache-Miss nachgeladen.
+    """
+
+    def __init__(self, backend=None, max_sessions=SESSION_MAX_SESSIONS, max_messages=SESSION_MAX_MESSAGES,
+                 ttl=SESSION_TTL, max_message_chars=SESSION_MAX_MESSAGE_CHARS):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.max_message_chars = max_message_chars
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._saving = {}
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+        self.expired = 0
+        self.evicted = 0
+        self.save_errors = 0
+
+    @property
+    def persistent(self):
+        return self.backend is not None
+
+    def indices(self):
+        # Für create_feedback_index_if_not_exists beim Start
+        return {SESSION_INDEX: SESSION_MAPPING} if self.persistent else {}
+
+    def _remember(self, session):
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def _expired(self, last_used):
+        return time.time() - last_used > self.ttl
+
+    async def find(self, session_id: str):
+        """Bestehende Sitzung zur ID oder None, wenn sie unbekannt oder abgelaufen ist."""
+        if not isinstance(session_id, str) or not _SESSION_ID.match(session_id):
+            raise ValueError("Ungültige session_id")
+
+        session = self._sessions.get(session_id)
+        if session is not None and self._expired(session.last_used):
+            del self._sessions[session_id]
+            self.expired += 1
+            session = None
+        if session is not None:
+            self.hits += 1
+            session.last_used = time.time()
+            self._sessions.move_to_end(session_id)
+            return session
+
+        self.misses += 1
+        if self.backend is None:
+            return None
+        try:
+            document = await self.backend.load(session_id)
+        except Exception as e:
+            logging.warning("Sitzung konnte nicht geladen werden", extra={"session_id": session_id, "error": str(e)})
+            return None
+        if document is None:
+            return None
+        # Die TTL gilt auch für gespeicherte Sitzungen, sonst käme jede abgelaufene Sitzung wieder
+        if self._expired(document.get("updated_at", 0) / 1000):
+            self.expired += 1
+            return None
+        self.loaded += 1
+        session = Session(session_id, document.get("messages", []))
+        self._remember(session)
+        return session
+
+    async def get(self, session_id: str) -> Session:
+        """Sitzung zur ID; unbekannte oder abgelaufene IDs beginnen mit leerem Verlauf."""
+        session = await self.find(session_id)
+        if session is None:
+            session = Session(session_id)
+            self._remember(session)
+        return session
+
+    def history(self, session: Session) -> list:
+        # Kopie, damit Kontextaufbau und Zusammenfassung den Sitzungsverlauf nicht verändern
+        return list(session.messages)
+
+    def _clip(self, text: str) -> str:
+        if len(text) <= self.max_message_chars:
+            return text
+        return f"{text[:self.max_message_chars]}… [gekürzt]"
+
+    def record_turn(self, session: Session, query: str, content: dict):
+        session.messages.append({"role": "user", "content": self._clip(query)})
+        session.messages.append({"role": "assistant", "content": self._clip(assistant_content(content))})
+        del session.messages[:-self.max_messages]
+        session.last_used = time.time()
+        if self.backend is not None:
+            self._schedule_save(session)
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        if self.backend is not None:
+            task = self._saving.get(session_id)
+            if task is not None:
+                await asyncio.gather(task, return_exceptions=True)
+            await self.backend.delete(session_id)
+
+    def _schedule_save(self, session):
+        session.dirty = True
+        if session.id in self._saving:
+            return
+        task = asyncio.create_task(self._save(session))
+        self._saving[session.id] = task
+        task.add_done_callback(lambda _: self._saving.pop(session.id, None))
+
+    async def _save(self, session):
+        # Änderungen während eines laufenden Schreibvorgangs werden im nächsten Durchlauf mitgenommen
+        while session.dirty:
+            session.dirty = False
+            try:
+                await self.backend.save(session)
+            except Exception as e:
+                self.save_errors += 1
+                logging.warning("Sitzung konnte nicht gespeichert werden", extra={"session_id": session.id, "error": str(e)})
+                return
+
+    async def stop(self):
+        if self._saving:
+            await asyncio.gather(*self._saving.values(), return_exceptions=True)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "persistence": SESSION_PERSISTENCE if self.persistent else "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "max_messages": self.max_messages,
+            "max_message_chars": self.max_message_chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "loaded": self.loaded,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "saving": len(self._saving),
+            "save_errors": self.save_errors,
+        }
+
+session_store = SessionStore(OpenSearchSessionBackend() if SESSION_PERSISTENCE == "opensearch" else None)
@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+# Use Cases, bei denen identische parallele Anfragen zusammengelegt werden.
+# Quiz ist bewusst nicht dabei, weil jede Anfrage eine neue Frage liefern soll.
+COALESCE_USE_CASES = {
+    u.strip() for u in os.getenv("SINGLEFLIGHT_USE_CASES", "FreePrompt,Summary,FunFact").split(",") if u.strip()
+}
+
+class SingleFlight:
+    """Führt pro Schlüssel höchstens einen Upstream-Aufruf gleichzeitig aus.
+
+    Spätere identische Anfragen warten auf das Ergebnis des laufenden Aufrufs.
+    Der Aufruf läuft als eigener Task, damit ein abgebrochener erster Client
+    die Wartenden nicht mitreißt.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, call):
+        task = self._inflight.get(key)
+        if task is None:
+            self.upstream_calls += 1
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Sind alle Wartenden abgebrochen, liest sonst niemand die Exception und
+        # asyncio meldet "Task exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        total = self.upstream_calls + self.coalesced
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "saved_ratio": round(self.coalesced / total, 4) if total else 0.0,
+            "use_cases": sorted(COALESCE_USE_CASES),
+        }
+
+single_flight = SingleFlight()
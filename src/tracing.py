@@ -0,0 +1,277 @@
+import base64
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from uuid import uuid4
+
+try:
+    from opentelemetry import context as otel_context, trace
+    from opentelemetry.propagate import extract
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    TRACING_AVAILABLE = True
+except ImportError:
+    SpanProcessor = SpanExporter = object
+    TRACING_AVAILABLE = False
+
+# none | otlp | file; otlp nutzt die üblichen OTEL_EXPORTER_OTLP_* Variablen (Standard: localhost:4318)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "paiya-api")
+# Anfragen über dieser Dauer (Sekunden) werden mit Aufschlüsselung geloggt, 0 schaltet das ab
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", "5.0"))
+# Anteil der langsamen Anfragen, die tatsächlich geloggt werden
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", "1.0"))
+SLOW_REQUEST_MAX_TRACES = 1000
+
+REQUEST_ID_HEADER = "x-request-id"
+
+_request_id = ContextVar("request_id", default=None)
+
+def current_request_id():
+    return _request_id.get()
+
+##########################
+# EXPORT                 #
+##########################
+
+class OTLPJsonFileExporter(SpanExporter):
+    """Schreibt Spans als OTLP/JSON (eine ExportTraceServiceRequest pro Zeile).
+
+    Das Format liest z.B. der otlpjsonfile-Receiver des OpenTelemetry
+    Collectors, die Datei lässt sich also nachträglich in Jaeger o.ä. laden.
+    """
+
+    def __init__(self, path=TRACING_FILE):
+        from google.protobuf.json_format import MessageToDict
+        from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+
+        self._encode = lambda spans: _hex_ids(MessageToDict(encode_spans(spans)))
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        line = json.dumps(self._encode(spans), separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self._file.close()
+
+def _hex_ids(request):
+    # Protobuf-JSON kodiert bytes als Base64, OTLP/JSON verlangt Trace- und Span-IDs als Hex
+    def convert(item):
+        for key in ("traceId", "spanId", "parentSpanId"):
+            if key in item:
+                item[key] = base64.b64decode(item[key]).hex()
+
+    for resource_spans in request.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                convert(span)
+                for link in span.get("links", []):
+                    convert(link)
+    return request
+
+def _exporter(kind):
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if kind == "file":
+        return OTLPJsonFileExporter()
+    return None
+
+##########################
+# SLOW REQUEST LOG       #
+##########################
+
+class SlowRequestLog(SpanProcessor):
+    """Sammelt die Spans laufender Traces und loggt bei langsamen Anfragen die Aufschlüsselung.
+
+    Geloggt wird, wenn der Server-Span einer Anfrage (ohne lokalen Parent)
+    länger als threshold Sekunden dauert, und dann nur mit Wahrscheinlichkeit
+    sample_rate. Spans, die erst nach dem Server-Span enden (z.B. Hintergrund-
+    Tasks), werden verworfen.
+    """
+
+    def __init__(self, threshold=SLOW_REQUEST_THRESHOLD, sample_rate=SLOW_REQUEST_SAMPLE_RATE,
+                 max_traces=SLOW_REQUEST_MAX_TRACES):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+        self.slow = 0
+        self.logged = 0
+
+    def on_start(self, span, parent_context=None):
+        pass
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            if not is_root:
+                spans = self._traces.setdefault(trace_id, [])
+                spans.append(span)
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+                return
+            spans = self._traces.pop(trace_id, [])
+
+        duration = (span.end_time - span.start_time) / 1e9
+        if duration < self.threshold:
+            return
+        self.slow += 1
+        if random.random() >= self.sample_rate:
+            return
+        self.logged += 1
+        logging.warning(f"Langsame Anfrage ({duration * 1000:.0f} ms):\n{self.breakdown(span, spans)}")
+
+    @staticmethod
+    def breakdown(root, spans):
+        children = {}
+        for span in spans:
+            children.setdefault(span.parent.span_id, []).append(span)
+
+        lines = []
+
+        def walk(span, depth):
+            attributes = " ".join(f"{k}={v}" for k, v in (span.attributes or {}).items())
+            offset = (span.start_time - root.start_time) / 1e6
+            duration = (span.end_time - span.start_time) / 1e6
+            lines.append(f"{'  ' * depth}{span.name}: {duration:.1f} ms (+{offset:.1f} ms) {attributes}".rstrip())
+            for child in sorted(children.get(span.context.span_id, []), key=lambda s: s.start_time):
+                walk(child, depth + 1)
+
+        walk(root, 0)
+        return "\n".join(lines)
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self, timeout_millis=30000):
+        return True
+
+    def stats(self):
+        return {
+            "threshold_s": self.threshold,
+            "sample_rate": self.sample_rate,
+            "open_traces": len(self._traces),
+            "slow_requests": self.slow,
+            "logged": self.logged,
+        }
+
+##########################
+# TRACER                 #
+##########################
+
+slow_request_log = SlowRequestLog()
+_provider = None
+_tracer = None
+
+def setup_tracing():
+    """Richtet den TracerProvider ein; ohne Exporter und Slow-Log bleiben alle Spans No-ops."""
+    global _provider, _tracer
+    if _provider is not None or not TRACING_AVAILABLE:
+        if not TRACING_AVAILABLE and TRACING_EXPORTER != "none":
+            logging.warning("opentelemetry-sdk ist nicht installiert, Tracing bleibt aus")
+        return
+    exporter = _exporter(TRACING_EXPORTER)
+    if exporter is None and SLOW_REQUEST_THRESHOLD <= 0:
+        return
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATIO)),
+    )
+    if exporter is not None:
+        _provider.add_span_processor(BatchSpanProcessor(exporter))
+    if SLOW_REQUEST_THRESHOLD > 0:
+        _provider.add_span_processor(slow_request_log)
+    _tracer = _provider.get_tracer("paiya")
+    logging.info(f"Tracing aktiv (Exporter: {TRACING_EXPORTER}, Slow-Log ab {SLOW_REQUEST_THRESHOLD}s)")
+
+def shutdown_tracing():
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = _tracer = None
+
+def span(name, **attributes):
+    """Kind-Span der aktuellen Anfrage; ohne aktives Tracing ein leerer Kontext."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes={k: v for k, v in attributes.items() if v is not None})
+
+def current_span_context():
+    if _tracer is None:
+        return None
+    context = trace.get_current_span().get_span_context()
+    return context if context.is_valid else None
+
+@contextmanager
+def linked_span(name, contexts, **attributes):
+    """Span ohne Parent, der auf die Spans der auslösenden Anfragen verweist (z.B. für Batches)."""
+    if _tracer is None:
+        yield None
+        return
+    links = [trace.Link(context) for context in contexts if context is not None]
+    with _tracer.start_as_current_span(name, context=otel_context.Context(), links=links,
+                                       attributes=attributes) as current:
+        yield current
+
+##########################
+# MIDDLEWARE             #
+##########################
+
+class TracingMiddleware:
+    """ASGI-Middleware: Request-ID und Server-Span pro HTTP-Anfrage.
+
+    Die Request-ID kommt aus X-Request-ID oder wird erzeugt und in derselben
+    Kopfzeile zurückgegeben. Ein eingehender traceparent wird übernommen. Der
+    Span endet erst, wenn die Antwort (auch ein Stream) vollständig gesendet ist.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        request_id = headers.get(REQUEST_ID_HEADER) or uuid4().hex
+        token = _request_id.set(request_id)
+        status = {}
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = [*message.get("headers", []),
+                                      (REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            if _tracer is None:
+                return await self.app(scope, receive, send_with_request_id)
+            started = time.perf_counter()
+            with _tracer.start_as_current_span(
+                f"{scope['method']} {scope['path']}", context=extract(headers), kind=trace.SpanKind.SERVER,
+                attributes={"http.method": scope["method"], "http.target": scope["path"], "request.id": request_id},
+            ) as current:
+                await self.app(scope, receive, send_with_request_id)
+                current.set_attribute("http.status_code", status.get("code", 0))
+                current.set_attribute("http.duration_ms", round((time.perf_counter() - started) * 1000, 1))
+        finally:
+            _request_id.reset(token)
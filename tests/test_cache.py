@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+
+from src.cache import DiskCacheBackend, MemoryCacheBackend, ResponseCache, make_request_key
+
+@pytest.fixture
+def disk(tmp_path):
+    return lambda **kwargs: DiskCacheBackend(path=str(tmp_path / "cache.sqlite3"), **kwargs)
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2, ttl=60)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    assert backend.get("a") == 1
+    backend.set("c", 3)
+    assert backend.get("b") is None
+    assert backend.get("a") == 1 and backend.get("c") == 3
+    assert backend.evictions == 1
+
+def test_memory_backend_expires_entries():
+    backend = MemoryCacheBackend(ttl=0)
+    backend.set("a", 1)
+    time.sleep(0.01)
+    assert backend.get("a") is None
+
+def test_disk_backend_survives_reopen(disk):
+    disk().set("a", {"summary": "ä"})
+    assert disk().get("a") == {"summary": "ä"}
+
+def test_disk_backend_reads_do_not_write(disk):
+    backend = disk()
+    backend.set("a", 1)
+    changes = backend._conn.total_changes
+    for _ in range(10):
+        assert backend.get("a") == 1
+    assert backend._conn.total_changes == changes
+    assert not backend._conn.in_transaction
+
+def test_disk_backend_lru_uses_batched_reads(disk):
+    backend = disk(max_entries=2)
+    backend.set("a", 1)
+    time.sleep(0.01)
+    backend.set("b", 2)
+    time.sleep(0.01)
+    assert backend.get("a") == 1
+    backend.set("c", 3)
+    assert backend.get("b") is None
+    assert backend.get("a") == 1 and backend.get("c") == 3
+    assert len(backend) == 2
+
+def test_disk_backend_flushes_touches_in_batches(disk):
+    backend = disk(touch_batch=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    assert backend._touched
+    backend.get("b")
+    assert not backend._touched and not backend._conn.in_transaction
+
+def test_disk_backend_expires_entries(disk):
+    backend = disk(ttl=0)
+    backend.set("a", 1)
+    time.sleep(0.01)
+    assert backend.get("a") is None
+    backend.set("b", 2)
+    assert len(backend) <= 1
+
+def test_response_cache_runs_disk_backend_off_the_event_loop(disk):
+    cache = ResponseCache(disk())
+    key = make_request_key("Summary", "Text", "groq", "llama", 0.1, length="kurz")
+
+    async def scenario():
+        assert await cache.aget(key) is None
+        await cache.aset(key, {"summary": "kurz"})
+        return await cache.aget(key)
+
+    assert asyncio.run(scenario()) == {"summary": "kurz"}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_request_key_normalizes_whitespace_and_case():
+    assert make_request_key("FunFact", "Hallo  Welt", "groq", "m", 0.1) == \
+        make_request_key("FunFact", " hallo welt", "groq", "m", 0.1)
+    assert make_request_key("FunFact", "Hallo", "groq", "m", 0.1) != make_request_key("FunFact", "Hallo", "groq", "n", 0.1)
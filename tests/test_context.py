@@ -0,0 +1,55 @@
+import asyncio
+
+from src.context import ContextBuilder, fold_keys
+
+SCOPE = ("groq", "llama", 0.1)
+
+def conversation(secret):
+    return [
+        {"role": "user", "content": f"Meine IBAN ist {secret}"},
+        {"role": "assistant", "content": "Notiert."},
+        {"role": "user", "content": "Erzähl mir etwas über Photosynthese. " * 20},
+        {"role": "assistant", "content": "Pflanzen wandeln Licht in Energie um. " * 20},
+        {"role": "user", "content": "Und weiter?"},
+        {"role": "assistant", "content": "Chlorophyll absorbiert rotes und blaues Licht. " * 20},
+    ]
+
+class FakeSummarizer:
+    def __init__(self):
+        self.prompts = []
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return f"Zusammenfassung {len(self.prompts)}: {prompt[-80:]}"
+
+def build(builder, messages, summarize, scope=SCOPE):
+    return asyncio.run(builder.build(messages, "Frage", use_case="FreePrompt", summarize=summarize,
+                                     budget=400, scope=scope))
+
+def test_fold_keys_depend_on_whole_prefix_and_scope():
+    a, b = conversation("DE001"), conversation("DE002")
+    assert fold_keys(a, SCOPE)[-1] != fold_keys(b, SCOPE)[-1]
+    assert fold_keys(a, SCOPE)[-1] != fold_keys(a, ("mistral", "small", 0.1))[-1]
+    assert fold_keys(a, SCOPE) == fold_keys(list(a), SCOPE)
+
+def test_same_tail_does_not_share_summary_across_conversations():
+    builder = ContextBuilder()
+    first, second = FakeSummarizer(), FakeSummarizer()
+    build(builder, conversation("DE001"), first)
+    context = build(builder, conversation("DE002"), second)
+
+    assert builder.summary_cache_hits == 0
+    assert len(second.prompts) == 1
+    assert "DE001" not in context[0]["content"]
+    assert "DE002" in second.prompts[0]
+
+def test_summary_is_reused_for_the_same_conversation_and_model():
+    builder = ContextBuilder()
+    summarize = FakeSummarizer()
+    build(builder, conversation("DE001"), summarize)
+    build(builder, conversation("DE001"), summarize)
+    assert builder.summary_cache_hits == 1
+    assert len(summarize.prompts) == 1
+
+    build(builder, conversation("DE001"), summarize, scope=("mistral", "small", 0.1))
+    assert len(summarize.prompts) == 2
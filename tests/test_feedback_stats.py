@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from src.feedback_stats import (FEEDBACK_STATS_MAX_TOTAL_BUCKETS, FeedbackStats, FeedbackStatsUnavailable,
+                                build_query, default_interval, parse_duration, summarize, total_buckets,
+                                wilson_lower_bound)
+
+def test_parse_duration():
+    assert parse_duration("30m") == 1800
+    assert parse_duration("7d") == 7 * 86400
+    for value in ("0d", "7w", "", None):
+        with pytest.raises(ValueError):
+            parse_duration(value)
+
+@pytest.mark.parametrize("window", ["30m", "6h", "24h", "3d", "7d", "30d", "90d", "365d"])
+def test_default_interval_stays_within_bucket_limit(window):
+    seconds = parse_duration(window)
+    assert total_buckets(seconds, default_interval(seconds)) <= FEEDBACK_STATS_MAX_TOTAL_BUCKETS
+
+def test_too_fine_interval_is_rejected():
+    with pytest.raises(ValueError, match="1d"):
+        asyncio.run(FeedbackStats().get("7d", "1h"))
+    with pytest.raises(ValueError):
+        asyncio.run(FeedbackStats().get("400d"))
+
+def test_wilson_lower_bound_prefers_more_votes():
+    assert wilson_lower_bound(0, 0) == 0.0
+    assert wilson_lower_bound(90, 100) > wilson_lower_bound(9, 10)
+
+def thumbs(up, down):
+    return {"thumbs": {"buckets": [{"key": "up", "doc_count": up}, {"key": "down", "doc_count": down}]}}
+
+def test_summarize_picks_best_model_with_enough_votes():
+    trend = {"buckets": [{"key_as_string": "2026-10-18", **thumbs(1, 0)}]}
+    response = {"aggregations": {
+        **thumbs(110, 20),
+        "trend": trend,
+        "providers": {"buckets": [{
+            "key": "groq", **thumbs(110, 20),
+            "models": {"buckets": [
+                {"key": "klein", **thumbs(5, 0), "trend": trend},
+                {"key": "gross", **thumbs(105, 20), "trend": trend},
+            ]},
+        }]},
+    }}
+    result = summarize(response, "7d", "1d")
+    assert result["total"] == 130 and result["satisfaction"] == round(110 / 130, 4)
+    assert result["providers"][0]["best_model"] == "gross"
+    assert result["trend"][0]["bucket"] == "2026-10-18"
+
+def test_build_query_uses_window_and_interval():
+    query = build_query("24h", "1h")
+    assert query["query"]["range"]["timestamp"]["gte"] == "now-24h"
+    assert query["aggs"]["trend"]["date_histogram"]["fixed_interval"] == "1h"
+
+def test_unavailable_without_cached_result():
+    stats = FeedbackStats(timeout=0.1)
+    with pytest.raises(FeedbackStatsUnavailable):
+        asyncio.run(stats.get("1d", "1h"))
+    assert stats.errors == 1
@@ -0,0 +1,48 @@
+import pytest
+
+from src.json_extract import IncrementalJSONExtractor, extract_json, find_json
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('```json\n{"a": [1, 2]}\n```', {"a": [1, 2]}),
+    ('Hier ist die Antwort: {"a": "x}"} Viel Spaß!', {"a": "x}"}),
+    ('<think>Vielleicht {"a": 0}?</think>{"a": 2}', {"a": 2}),
+    ('Er sagte "hallo" und dann {"b": "\\"}"}', {"b": '"}'}),
+    ('[1, 2] und {"c": 3}', [1, 2]),
+    ('"nur ein String"', "nur ein String"),
+])
+def test_find_json(text, expected):
+    assert find_json(text) == expected
+
+def test_find_json_skips_unparsable_spans():
+    assert find_json('{kein json} dann {"a": 1}') == {"a": 1}
+
+def test_find_json_without_json_raises():
+    with pytest.raises(ValueError):
+        find_json("Leider keine Antwort")
+    with pytest.raises(ValueError):
+        find_json(None)
+
+def test_extract_json_returns_cleaned_text_without_json():
+    assert extract_json('Text {"a": 1} Text') == '{"a": 1}'
+    assert extract_json("<think>x</think>  nur Text ") == "nur Text"
+
+def feed_all(chunks):
+    extractor = IncrementalJSONExtractor()
+    values = [extractor.feed(chunk) for chunk in chunks]
+    return extractor, values
+
+def test_incremental_extractor_finishes_on_the_closing_chunk():
+    extractor, values = feed_all(['Antwort: {"fa', 'ct": "Kat', 'zen"}', " und noch mehr Text"])
+    assert values[:2] == [None, None]
+    assert values[2] == {"fact": "Katzen"}
+    assert extractor.done and extractor.text.startswith("Antwort")
+
+def test_incremental_extractor_ignores_json_inside_split_reasoning_tag():
+    extractor, values = feed_all(['<th', 'ink>{"a": 0}</th', 'ink>', '{"a": 1}'])
+    assert values[-1] == {"a": 1}
+
+def test_incremental_extractor_leaves_incomplete_stream_to_caller():
+    extractor, values = feed_all(['{"a": ', '1'])
+    assert not extractor.done and values == [None, None]
+    assert extractor.text == '{"a": 1'
@@ -0,0 +1,18 @@
+from src.metrics import IN_FLIGHT, current_labels, set_request_labels, track_in_flight
+
+def test_request_labels_map_unknown_values_to_other():
+    set_request_labels("Summary", "groq", "gemma2-9b-it")
+    assert current_labels() == {"use_case": "Summary", "provider": "groq", "model": "gemma2-9b-it"}
+
+    set_request_labels("Beliebig", "x" * 40, "mein-eigenes-modell-123")
+    assert current_labels() == {"use_case": "other", "provider": "other", "model": "other"}
+
+def test_in_flight_gauge_does_not_grow_with_client_values():
+    def series():
+        return {tuple(s.labels.values()) for metric in IN_FLIGHT.collect() for s in metric.samples}
+
+    before = series()
+    for i in range(20):
+        with track_in_flight("Summary", f"provider-{i}"):
+            pass
+    assert len(series() - before) <= 1
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from src import routing
+from src.routing import CircuitBreaker, ProviderStats, Router
+
+PRIMARY = {"provider": "groq", "model": "llama", "temperature": 0.1}
+FALLBACK = {"provider": "mistral", "model": "mistral-small", "temperature": 0.1}
+
+@pytest.fixture
+def router(monkeypatch):
+    async def candidates(llm):
+        return [FALLBACK]
+
+    monkeypatch.setattr(routing, "fallback_candidates", candidates)
+    return Router(hedge_enabled=False)
+
+def expire(breaker):
+    breaker.state = "open"
+    breaker.opened_at = time.monotonic() - breaker.open_seconds - 1
+
+def test_breaker_lets_one_probe_through_when_half_open():
+    breaker = CircuitBreaker(open_seconds=0)
+    expire(breaker)
+    assert breaker.available()
+    assert breaker.allow()
+    assert not breaker.available()
+    assert not breaker.allow()
+    breaker.on_failure(ProviderStats())
+    assert breaker.state == "open"
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, open_seconds=60)
+    stats = ProviderStats()
+    breaker.on_failure(stats)
+    assert breaker.allow()
+    breaker.on_failure(stats)
+    assert breaker.state == "open"
+    assert not breaker.available()
+    assert not breaker.allow()
+
+def test_expired_fallback_stays_available_while_primary_succeeds(router):
+    fallback_breaker = router._breaker_for(routing.identity(FALLBACK))
+    expire(fallback_breaker)
+    calls = []
+
+    async def ok(llm):
+        calls.append(llm["provider"])
+        return {"answer": llm["provider"]}
+
+    async def primary_fails(llm):
+        calls.append(llm["provider"])
+        if llm is PRIMARY:
+            raise RuntimeError("boom")
+        return {"answer": llm["provider"]}
+
+    result, served, _ = asyncio.run(router.run(PRIMARY, ok))
+    assert served is PRIMARY
+    assert fallback_breaker.available() and not fallback_breaker._probing
+
+    result, served, _ = asyncio.run(router.run(PRIMARY, primary_fails))
+    assert served is FALLBACK
+    assert result == {"answer": "mistral"}
+    assert calls == ["groq", "groq", "mistral"]
+    assert fallback_breaker.state == "closed"
+
+def test_all_circuits_open_still_tries_requested_provider(router):
+    for llm in (PRIMARY, FALLBACK):
+        router._breaker_for(routing.identity(llm)).state = "open"
+        router._breaker_for(routing.identity(llm)).opened_at = time.monotonic()
+
+    async def ok(llm):
+        return {"answer": llm["provider"]}
+
+    result, served, _ = asyncio.run(router.run(PRIMARY, ok))
+    assert served is PRIMARY
+
+def test_upstream_error_result_is_returned_when_all_fail(router):
+    async def error(llm):
+        return {"error": f"{llm['provider']} kaputt"}
+
+    result, served, _ = asyncio.run(router.run(PRIMARY, error))
+    assert result == {"error": "mistral kaputt"}
+    assert served is PRIMARY
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from src import scheduler
+from src.scheduler import ProviderLimiter, ProviderOverloaded, ProviderScheduler, retry_after_seconds
+
+class UpstreamError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+def test_limiter_caps_concurrency():
+    limiter = ProviderLimiter("groq", concurrency=2)
+    active, peak = 0, 0
+
+    async def call():
+        nonlocal active, peak
+        await limiter.acquire(0)
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        limiter.release()
+
+    async def scenario():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert peak == 2 and limiter.active == 0
+
+def test_limiter_sheds_when_queue_is_full():
+    limiter = ProviderLimiter("groq", concurrency=1, queue_size=1)
+
+    async def scenario():
+        await limiter.acquire(0)
+        waiting = asyncio.ensure_future(limiter.acquire(0, timeout=1))
+        await asyncio.sleep(0)
+        with pytest.raises(ProviderOverloaded) as shed:
+            await limiter.acquire(0, timeout=1)
+        limiter.release()
+        await waiting
+        limiter.release()
+        return shed.value.reason
+
+    assert asyncio.run(scenario()) == "queue_full"
+    assert limiter.shed == 1
+
+def test_limiter_sheds_after_deadline():
+    limiter = ProviderLimiter("groq", concurrency=1)
+
+    async def scenario():
+        await limiter.acquire(0)
+        with pytest.raises(ProviderOverloaded) as shed:
+            await limiter.acquire(0, timeout=0.01)
+        return shed.value.reason
+
+    assert asyncio.run(scenario()) == "deadline"
+
+def test_token_budget_rejects_requests_that_cannot_fit_before_deadline():
+    limiter = ProviderLimiter("groq", concurrency=4, tokens_per_minute=600)
+
+    async def scenario():
+        await limiter.acquire(600, timeout=0.1)
+        limiter.release()
+        with pytest.raises(ProviderOverloaded) as shed:
+            await limiter.acquire(600, timeout=0.1)
+        return shed.value
+
+    shed = asyncio.run(scenario())
+    assert shed.reason == "budget" and shed.retry_after > 0.1
+    assert limiter.active == 0
+
+def test_retry_after_headers():
+    assert retry_after_seconds(UpstreamError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(UpstreamError(429, {"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(UpstreamError(429)) is None
+
+def test_submit_retries_rate_limits_then_succeeds(monkeypatch):
+    monkeypatch.setattr(scheduler, "RETRY_BASE_DELAY", 0.001)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise UpstreamError(429)
+        return "ok"
+
+    provider_scheduler = ProviderScheduler(max_retries=3)
+    assert asyncio.run(provider_scheduler.submit("groq", call)) == "ok"
+    assert len(attempts) == 3 and provider_scheduler.retries == 2
+
+def test_submit_gives_up_with_provider_overloaded(monkeypatch):
+    monkeypatch.setattr(scheduler, "RETRY_BASE_DELAY", 0.001)
+
+    async def call():
+        raise UpstreamError(503)
+
+    with pytest.raises(ProviderOverloaded) as overloaded:
+        asyncio.run(ProviderScheduler(max_retries=1).submit("groq", call))
+    assert overloaded.value.reason == "upstream_503"
+
+def test_submit_does_not_retry_other_errors():
+    async def call():
+        raise UpstreamError(400)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(ProviderScheduler().submit("groq", call))
@@ -0,0 +1,44 @@
+import asyncio
+
+from src.semantic_cache import HashingEmbedder, SemanticCache
+
+def make_cache(**kwargs):
+    return SemanticCache(HashingEmbedder(dimensions=64), thresholds={"FunFact": 0.9}, **kwargs)
+
+def embed(cache, text):
+    return asyncio.run(cache.embed(text))
+
+def test_similar_query_hits_same_partition_only():
+    cache = make_cache()
+    vector = embed(cache, "Erzähl mir einen Fakt über Katzen")
+    cache.store(("FunFact", "groq", "m"), vector, {"fact": "Katzen schlafen viel"})
+
+    assert cache.lookup("FunFact", ("FunFact", "groq", "m"), embed(cache, "erzähl mir einen Fakt über Katzen!"))[0] \
+        == {"fact": "Katzen schlafen viel"}
+    assert cache.lookup("FunFact", ("FunFact", "groq", "n"), vector)[0] is None
+
+def test_partitions_are_bounded_least_recently_used_first():
+    cache = make_cache(max_partitions=2)
+    vector = embed(cache, "Katzen")
+    cache.store("a", vector, 1)
+    cache.store("b", vector, 2)
+    cache.lookup("FunFact", "a", vector)
+    cache.store("c", vector, 3)
+
+    assert cache.stats()["partitions"] == 2
+    assert cache.partition_evictions == 1
+    assert cache.lookup("FunFact", "b", vector)[0] is None
+    assert cache.lookup("FunFact", "a", vector)[0] == 1
+    assert cache.lookup("FunFact", "c", vector)[0] == 3
+
+def test_partition_overwrites_least_recently_used_entry_when_full():
+    cache = make_cache(max_entries=2)
+    vectors = [embed(cache, text) for text in ("Katzen", "Hunde", "Pferde")]
+    cache.store("p", vectors[0], "katzen")
+    cache.store("p", vectors[1], "hunde")
+    cache.lookup("FunFact", "p", vectors[0])
+    cache.store("p", vectors[2], "pferde")
+
+    assert cache.lookup("FunFact", "p", vectors[1])[0] is None
+    assert cache.lookup("FunFact", "p", vectors[0])[0] == "katzen"
+    assert cache.evictions == 1
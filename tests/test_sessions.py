@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+from src.sessions import SessionStore
+
+SESSION_ID = "session-0001"
+
+class MemoryBackend:
+    def __init__(self):
+        self.documents = {}
+
+    async def load(self, session_id):
+        return self.documents.get(session_id)
+
+    async def save(self, session):
+        self.documents[session.id] = session.as_document()
+
+    async def delete(self, session_id):
+        self.documents.pop(session_id, None)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_unknown_session_is_not_found_but_get_creates_it():
+    store = SessionStore()
+    assert run(store.find(SESSION_ID)) is None
+    assert run(store.get(SESSION_ID)).messages == []
+    assert run(store.find(SESSION_ID)) is not None
+
+def test_invalid_session_id_is_rejected():
+    with pytest.raises(ValueError):
+        run(SessionStore().find("x"))
+
+def test_expired_session_starts_over():
+    store = SessionStore(ttl=60)
+    session = run(store.get(SESSION_ID))
+    store.record_turn(session, "Hallo", {"type": "free_prompt", "data": "Hi"})
+    session.last_used = time.time() - 61
+    assert run(store.find(SESSION_ID)) is None
+    assert run(store.get(SESSION_ID)).messages == []
+    assert store.stats()["expired"] == 1
+
+def test_ttl_applies_to_persisted_sessions():
+    backend = MemoryBackend()
+    backend.documents[SESSION_ID] = {
+        "session_id": SESSION_ID,
+        "updated_at": int((time.time() - 120) * 1000),
+        "messages": [{"role": "user", "content": "alt"}],
+    }
+    assert run(SessionStore(backend, ttl=60).find(SESSION_ID)) is None
+
+    store = SessionStore(backend, ttl=600)
+    assert run(store.find(SESSION_ID)).messages == [{"role": "user", "content": "alt"}]
+    assert store.stats()["loaded"] == 1
+
+def test_record_turn_caps_message_count_and_length():
+    store = SessionStore(max_messages=4, max_message_chars=10)
+    session = run(store.get(SESSION_ID))
+    for i in range(3):
+        store.record_turn(session, f"Frage {i}", {"type": "summary", "summary": "x" * 100})
+    assert len(session.messages) == 4
+    assert session.messages[0]["content"] == "Frage 1"
+    assert session.messages[-1]["content"] == "x" * 10 + "… [gekürzt]"
+
+def test_history_is_a_copy():
+    store = SessionStore()
+    session = run(store.get(SESSION_ID))
+    history = store.history(session)
+    history.append({"role": "user", "content": "neu"})
+    assert session.messages == []
@@ -0,0 +1,57 @@
+import asyncio
+import gc
+
+import pytest
+
+from src.singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", call) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["ok"] * 5
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 4 and flight.stats()["in_flight"] == 0
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        return await asyncio.gather(flight.do("k", call), flight.do("k", call), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(scenario())] == ["boom", "boom"]
+
+def test_failure_after_all_waiters_cancelled_is_not_reported_as_unretrieved():
+    flight = SingleFlight()
+    reported = []
+
+    async def call():
+        await asyncio.sleep(0.02)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: reported.append(context))
+        waiter = asyncio.ensure_future(flight.do("k", call))
+        await asyncio.sleep(0.005)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0.05)
+        gc.collect()
+
+    asyncio.run(scenario())
+    gc.collect()
+    assert reported == []
+    assert flight.stats()["in_flight"] == 0